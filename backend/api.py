@@ -1,61 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import Session
-from sqlalchemy import func, String, cast
-from database import get_db, PatientData
-from schemas import PredictionInput, PredictionOutput
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, or_
+from database import get_db, get_read_db, PatientData, PatientRisk, Stay
+from risk_scheduler import SOFA_COLS
+from stats import read_stats, record_insert
+from stay_index import prefix_ranges, record_stay_insert
+from ingest import read_rows, ingest
+from history import FORMATS, MAX_PAGE, ARROW_MEDIA_TYPE, parse_fields, read_history, rows_payload, columnar_payload, arrow_payload
+from stay_latest import load_latest, latest_row, record_latest, row_state, grud_last
+from model_wrapper import MODEL_INPUT_FEATURES
+from feature_map import FEATURE_MAP
+from schemas import PredictionInput, PredictionOutput, BatchPredictionInput, BatchPredictionOutput, TrajectoryOutput
 from typing import List, Dict, Any, Optional
+import time
+import numpy as np
 
 router = APIRouter()
 
+# Convert window_hours to window_id (0=6h, 1=12h, 2=24h)
+WINDOW_MAP = {6: 0, 12: 1, 24: 2}
+
+# Next-page cursor of /patients and /patient/{stay_id}?limit= (exposed to the
+# frontend through CORS in main.py)
+CURSOR_HEADER = "X-Next-Cursor"
+
 @router.get("/stats")
 def get_dataset_stats(db: Session = Depends(get_db)):
     try:
-        # Improve performance by caching or simplified info?
-        # For now, standard queries.
-        
-        # 1. Total Patients
-        subq = db.query(PatientData.age, PatientData.f0_, PatientData.sepsis, PatientData.stay_id).group_by(PatientData.stay_id).subquery()
-        
-        total_patients = db.query(func.count()).select_from(subq).scalar()
-        
-        # 2. Avg Age
-        avg_age = db.query(func.avg(subq.c.age)).scalar()
-        
-        # 3. Gender Distribution
-        male_count = db.query(func.count()).select_from(subq).filter(subq.c.f0_.in_(['M', 'Male'])).scalar()
-        female_count = db.query(func.count()).select_from(subq).filter(subq.c.f0_.in_(['F', 'Female'])).scalar()
-        
-        # 4. Sepsis Distribution
-        sepsis_count = db.query(func.count()).select_from(subq).filter(subq.c.sepsis == 1).scalar()
-        normal_count = (total_patients or 0) - (sepsis_count or 0)
-        
-        # 5. Age Distribution (Simplified Buckets for Charts)
-        # 0-18, 19-40, 41-60, 61-80, 80+
-        # This is hard in SQLite without CASE. We can do separate counts or fetch all ages and bucket in python?
-        # Fetching all ages for 100k might be heavy? No, just 100k ints.
-        # But aggregate in SQL is better.
-        age_groups = {
-            "0-18": db.query(func.count()).select_from(subq).filter(subq.c.age <= 18).scalar(),
-            "19-40": db.query(func.count()).select_from(subq).filter(subq.c.age > 18, subq.c.age <= 40).scalar(),
-            "41-60": db.query(func.count()).select_from(subq).filter(subq.c.age > 40, subq.c.age <= 60).scalar(),
-            "61-80": db.query(func.count()).select_from(subq).filter(subq.c.age > 60, subq.c.age <= 80).scalar(),
-            "80+": db.query(func.count()).select_from(subq).filter(subq.c.age > 80).scalar(),
-        }
-
-        return {
-            "total_patients": total_patients,
-            "avg_age": round(avg_age, 1) if avg_age else 0,
-            "gender_distribution": {
-                "Male": male_count,
-                "Female": female_count
-            },
-            "sepsis_cases": {
-                "Sepsis": sepsis_count,
-                "Normal": normal_count
-            },
-            "age_distribution": age_groups
-        }
+        # O(1): read the incrementally maintained summary row (see stats.py)
+        return read_stats(db)
     except Exception as e:
         print(f"Stats error: {e}")
         return {
@@ -67,45 +43,119 @@ def get_dataset_stats(db: Session = Depends(get_db)):
         }
 
 @router.get("/patients/emergency")
-def get_emergency_patients(limit: int = 50, db: Session = Depends(get_db)):
+def get_emergency_patients(limit: int = 50, db: Session = Depends(get_read_db)):
     try:
-        # Find patients with Sepsis=1
-        # Group by stay_id to get unique patients
-        query = db.query(PatientData.stay_id, PatientData.subject_id, PatientData.age, PatientData.f0_, PatientData.sepsis)\
-                     .filter(PatientData.sepsis == 1)\
-                     .group_by(PatientData.stay_id)
+        # Rank by the materialized model risk (see risk_scheduler.py)
+        ranked = db.query(PatientRisk, Stay)\
+                   .join(Stay, Stay.stay_id == PatientRisk.stay_id)\
+                   .order_by(PatientRisk.sepsis_prob.desc(), PatientRisk.sofa_total.desc())\
+                   .limit(limit)\
+                   .all()
+        
+        if not ranked:
+            # Nothing scored yet: fall back to the historical sepsis label
+            patients = db.query(Stay).filter(Stay.sepsis == 1).order_by(Stay.stay_id).limit(limit).all()
+            return [{"stay_id": p.stay_id, "subject_id": p.subject_id, "age": p.age, "gender": p.f0_, "sepsis": p.sepsis} for p in patients]
         
-        patients = query.limit(limit).all()
-        return [{"stay_id": p.stay_id, "subject_id": p.subject_id, "age": p.age, "gender": p.f0_, "sepsis": p.sepsis} for p in patients]
+        return [{
+            "stay_id": p.stay_id, "subject_id": p.subject_id, "age": p.age, "gender": p.f0_, "sepsis": p.sepsis,
+            "sepsis_probability": r.sepsis_prob,
+            "sofa_total": r.sofa_total,
+            "sofa": {c: getattr(r, c) for c in SOFA_COLS},
+            "scored_hr": r.scored_hr,
+            "scored_at": r.scored_at,
+        } for r, p in ranked]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/patients")
-def get_patients(search: Optional[str] = None, db: Session = Depends(get_db)):
+def get_patients(response: Response, search: Optional[str] = None, cursor: Optional[int] = None, limit: int = 50, db: Session = Depends(get_read_db)):
+    """
+    List stays ordered by stay_id, from the per-stay index table.
+    search is a stay_id/subject_id prefix; pass the X-Next-Cursor response
+    header back as cursor to fetch the next page.
+    """
     try:
-        query = db.query(PatientData.stay_id, PatientData.subject_id, PatientData.age, PatientData.f0_)\
-                     .group_by(PatientData.stay_id)
+        limit = max(1, min(limit, 500))
+        query = db.query(Stay).order_by(Stay.stay_id)
         
         if search:
-            # Filter by stay_id (cast to string for wildcards if needed, or exact match)
-            # For simplicity in sqlite:
-            query = query.filter(cast(PatientData.stay_id, String).contains(search))
+            search = search.strip()
+            matches = [cond for cond in (prefix_ranges(Stay.stay_id, search), prefix_ranges(Stay.subject_id, search)) if cond is not None]
+            if not matches:
+                return []
+            query = query.filter(or_(*matches))
+        
+        if cursor is not None:
+            query = query.filter(Stay.stay_id > cursor)
         
-        patients = query.limit(50).all()
+        patients = query.limit(limit + 1).all()
+        if len(patients) > limit:
+            patients = patients[:limit]
+            response.headers[CURSOR_HEADER] = str(patients[-1].stay_id)
         return [{"stay_id": p.stay_id, "subject_id": p.subject_id, "age": p.age, "gender": p.f0_} for p in patients]
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/patient/{stay_id}")
-def get_patient_history(stay_id: int, db: Session = Depends(get_db)):
-    rows = db.query(PatientData).filter(PatientData.stay_id == stay_id).order_by(PatientData.hr).all()
-    if not rows:
+def get_patient_history(stay_id: int, fields: Optional[str] = None, hr_from: Optional[int] = None, hr_to: Optional[int] = None,
+                        cursor: Optional[int] = None, limit: Optional[int] = None, format: str = "rows",
+                        db: Session = Depends(get_read_db)):
+    """
+    Hourly history of a stay, ordered by hr (see history.py for the formats).
+    fields is a comma-separated column list (hr is always included), hr_from /
+    hr_to an inclusive hr range. With limit, pass the X-Next-Cursor response
+    header back as cursor to fetch the next page.
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE))
+    
+    rows, next_cursor = read_history(db, stay_id, columns, hr_from, hr_to, cursor, limit)
+    if not rows and db.query(PatientData.id).filter(PatientData.stay_id == stay_id).first() is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return rows
+    headers = {CURSOR_HEADER: str(next_cursor)} if next_cursor is not None else None
+    
+    # Plain JSON-native values: skip FastAPI's generic encoder
+    if format == "rows":
+        return JSONResponse(rows_payload(columns, rows), headers=headers)
+    if format == "columnar":
+        return JSONResponse(columnar_payload(columns, rows), headers=headers)
+    try:
+        content = arrow_payload(columns, rows)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="format=arrow needs pyarrow installed on the server")
+    return Response(content, media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+# A stay without stay_latest state is computed from patient_data but not stored
+# (POST /patient, ingestion and migrate() backfill it)
+@router.get("/patient/{stay_id}/latest")
+def get_patient_latest(stay_id: int, db: Session = Depends(get_read_db)):
+    """Last known value of every column, plus the model's GRU-D last value / last hr per feature."""
+    latest = load_latest(db, [stay_id], persist=False).get(stay_id)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    last_value, last_time = grud_last(latest)
+    return {
+        "stay_id": stay_id,
+        "first_hr": latest.first_hr,
+        "hr": latest.hr,
+        "values": latest.values,
+        "value_hrs": {col: latest.value_hrs.get(col, latest.hr) for col in latest.values},
+        "grud": {
+            f: {"value": float(v), "hr": int(t)}
+            for f, v, t in zip(MODEL_INPUT_FEATURES, last_value, last_time) if not np.isnan(v)
+        },
+    }
 
 @router.post("/patient")
-def add_patient_data(data: Dict[str, Any] = Body(...), db: Session = Depends(get_db)):
+def add_patient_data(request: Request, data: Dict[str, Any] = Body(...), db: Session = Depends(get_db)):
     try:
         valid_cols = {c.name for c in PatientData.__table__.columns}
         
@@ -114,27 +164,20 @@ def add_patient_data(data: Dict[str, Any] = Body(...), db: Session = Depends(get
         if not stay_id:
              raise HTTPException(status_code=400, detail="stay_id is required")
 
-        # Get last record for this stay
-        from sqlalchemy import desc
-        last_record = db.query(PatientData)\
-            .filter(PatientData.stay_id == stay_id)\
-            .order_by(desc(PatientData.hr))\
-            .first()
+        # Last known values of this stay: one keyed read of stay_latest
+        latest = load_latest(db, [stay_id]).get(stay_id)
             
-        new_hr = (last_record.hr + 1) if last_record else 1
+        new_hr = (latest.hr + 1) if latest else 1
         
         # 2. Logic for Forward Fill (ffill)
-        # If a field is missing in new data, use value from last_record
+        # If a field is missing in new data, use value from the stay's last row
         final_data = {}
         
-        # Pre-fill with last record's data if it exists
-        if last_record:
-            # We copy all valid columns from last_record
-            for col in valid_cols:
-                if col not in ['id', 'hr', 'starttime', 'endtime']: # Don't copy PK or time
-                    val = getattr(last_record, col)
-                    if val is not None:
-                        final_data[col] = val
+        # Pre-fill with the last row's non-null values (never PK or time columns)
+        if latest:
+            for col, val in latest_row(latest).items():
+                if col in valid_cols:
+                    final_data[col] = val
                         
         # Override with new data (only if not None)
         # However, data dict might contain empty strings or None?
@@ -147,61 +190,396 @@ def add_patient_data(data: Dict[str, Any] = Body(...), db: Session = Depends(get
         # Set the calculated HR
         final_data['hr'] = new_hr
         
+        # Keep the /stats summary, the stays index and stay_latest in step, in the same transaction
+        record_insert(db, stay_id, latest.values if latest else None, final_data)
+        
+        record_stay_insert(db, final_data)
+        
+        record_latest(db, stay_id, latest, (new_hr, new_hr, *row_state(final_data)))
+        
         # Create row
         row = PatientData(**final_data)
         db.add(row)
+        db.flush()
+        row_id = row.id
         db.commit()
-        db.refresh(row)
-        return {"message": "Data added successfully", "id": row.id, "hr": new_hr}
+        _invalidate_stay(request, stay_id, new_hr)
+        _append_to_store(request, stay_id, [final_data])
+        return {"message": "Data added successfully", "id": row_id, "hr": new_hr}
+    except IntegrityError:
+        # Another writer took the same (stay_id, hr) between our read and insert
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Concurrent update of stay {stay_id}, please retry")
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error adding patient: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/predict/{stay_id}", response_model=PredictionOutput)
-def predict_patient(stay_id: int, request: Request, window_hours: int = 6, db: Session = Depends(get_db)):
-    rows = db.query(PatientData).filter(PatientData.stay_id == stay_id).order_by(PatientData.hr).all()
-    if not rows:
+@router.post("/patients/bulk")
+async def add_patient_data_bulk(request: Request, db: Session = Depends(get_db)):
+    """
+    Insert many hourly rows of many stays in one transaction. Body: JSON lines
+    (application/x-ndjson), a JSON array, or a Parquet / Arrow IPC upload.
+    Rows follow POST /patient: hr defaults to the next hour of the stay and
+    missing values are forward-filled from the previous hour.
+    """
+    started = time.perf_counter()
+    body = await request.body()
+    try:
+        df = await run_in_threadpool(read_rows, body, request.headers.get("content-type", "application/json"))
+        records_by_stay = await run_in_threadpool(ingest, db, df)
+        await run_in_threadpool(db.commit)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Some (stay_id, hr) rows already exist (concurrent update?), nothing was inserted")
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    for stay_id, records in records_by_stay.items():
+        _invalidate_stay(request, stay_id, records[0]["hr"])
+        _append_to_store(request, stay_id, records)
+    inserted = sum(len(records) for records in records_by_stay.values())
+    seconds = time.perf_counter() - started
+    return {
+        "message": "Data added successfully",
+        "inserted": inserted,
+        "stays": len(records_by_stay),
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(inserted / seconds, 1) if seconds else None,
+    }
+
+def _invalidate_stay(request: Request, stay_id: int, hr: Optional[int] = None):
+    """Drop cached predictions of a stay after its data changed (trajectory points from hr on)."""
+    cache = getattr(request.app.state, "prediction_cache", None)
+    if cache is not None:
+        cache.invalidate_stay(stay_id)
+    trajectory_cache = getattr(request.app.state, "trajectory_cache", None)
+    if trajectory_cache is not None:
+        trajectory_cache.invalidate_stay(stay_id, from_hr=hr)
+
+def _append_to_store(request: Request, stay_id: int, records: List[Dict[str, Any]]):
+    """Mirror committed rows of a stay into the feature store (a failure only costs a DB fallback)."""
+    store = getattr(request.app.state, "feature_store", None)
+    if store is None:
+        return
+    try:
+        store.append(stay_id, records)
+    except Exception as e:
+        print(f"Feature store append failed for stay {stay_id}: {e}")
+
+def _store_arrays(store, stay_ids, db: Session):
+    """
+    Feature arrays from the memory-mapped store for the stays it holds completely,
+    i.e. whose stored row count matches the stays index. Other stays are left out
+    and must be loaded from patient_data.
+    """
+    if store is None or not stay_ids:
+        return {}
+    row_counts = dict(db.query(Stay.stay_id, Stay.row_count).filter(Stay.stay_id.in_(stay_ids)).all())
+    arrays = {}
+    for stay_id in stay_ids:
+        if row_counts.get(stay_id) and store.row_count(stay_id) == row_counts[stay_id]:
+            arrays[stay_id] = store.get(stay_id)
+    return arrays
+
+def _rows_to_records(rows):
+    records = []
+    for r in rows:
+        d = r.__dict__.copy()
+        d.pop('_sa_instance_state', None)
+        records.append(d)
+    return records
+
+# Declared before /predict/{stay_id} so "batch" is not parsed as a stay_id
+@router.post("/predict/batch", response_model=BatchPredictionOutput, response_model_exclude_none=True)
+async def predict_batch(data: BatchPredictionInput, request: Request, db: Session = Depends(get_read_db)):
+    model = getattr(request.app.state, "model", None)
+    if not model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    cache = getattr(request.app.state, "prediction_cache", None)
+    
+    stay_ids = [item.stay_id for item in data.stays]
+    latest_hrs = await run_in_threadpool(_latest_hrs, db, stay_ids)
+    
+    results, missing, pending = {}, [], []
+    for item in data.stays:
+        if item.stay_id not in latest_hrs:
+            missing.append(item.stay_id)
+            continue
+        window_id = WINDOW_MAP.get(item.window_hours, 0)
+        key = (item.stay_id, latest_hrs[item.stay_id], (window_id, data.all_horizons), model.version)
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            results[item.stay_id] = cached
+        else:
+            pending.append((item.stay_id, window_id, key))
+    
+    if not pending:
+        return {"results": results, "missing": missing}
+    
+    pending_ids = [stay_id for stay_id, _, _ in pending]
+    last_n = model.context_rows(max(window_id for _, window_id, _ in pending), data.all_horizons)
+    arrays = await run_in_threadpool(_load_arrays, model, pending_ids, db, getattr(request.app.state, "feature_store", None), last_n)
+    
+    try:
+        items = [(*arrays[stay_id], window_id) for stay_id, window_id, _ in pending]
+        # Already a batch: run it as one call on the inference thread
+        scored = await _run_model(request, model.predict_arrays, items, data.all_horizons)
+        _shadow(request, model, items, data.all_horizons, scored)
+        for (stay_id, _, key), result in zip(pending, scored):
+            result = {**result, "model_version": model.version}
+            results[stay_id] = result
+            if cache is not None:
+                cache.put(key, result)
+        return {"results": results, "missing": missing}
+    except Exception as e:
+        import traceback
+        tb = traceback.format_exc()
+        print(f"Batch Prediction Error: {tb}")
+        raise HTTPException(status_code=500, detail=f"Prediction logic error: {e}")
+
+def _latest_hrs(db: Session, stay_ids):
+    return dict(
+        db.query(PatientData.stay_id, func.max(PatientData.hr))
+        .filter(PatientData.stay_id.in_(stay_ids))
+        .group_by(PatientData.stay_id)
+        .all()
+    )
+
+def _load_arrays(model, stay_ids, db: Session, store=None, last_n=None):
+    """
+    Model input arrays (X_seq, times) per stay: from the feature store where it is
+    complete, all remaining stays from patient_data in one query.
+    With last_n (windowed inference) only the trailing last_n rows are read.
+    Stays without rows are left out.
+    """
+    arrays = _store_arrays(store, stay_ids, db)
+    if last_n is not None:
+        # Zero-copy views of the stored arrays
+        arrays = {stay_id: (X_seq[-last_n:], times[-last_n:]) for stay_id, (X_seq, times) in arrays.items()}
+    db_ids = [stay_id for stay_id in stay_ids if stay_id not in arrays]
+    if db_ids:
+        arrays.update(FEATURE_MAP.load(db, db_ids, last_n))
+    return arrays
+
+async def _run_model(request: Request, fn, *args):
+    """Run a blocking model call on the inference thread (or the threadpool without a queue)."""
+    queue = getattr(request.app.state, "inference_queue", None)
+    if queue is not None:
+        return await queue.run(fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+async def _score(request: Request, model, X_seq, times, window_id: int, all_horizons: bool):
+    """Score one stay, micro-batched with concurrent requests when the inference queue is enabled."""
+    queue = getattr(request.app.state, "inference_queue", None)
+    if queue is not None:
+        result = await queue.submit(X_seq, times, window_id, all_horizons, model)
+    else:
+        result = (await run_in_threadpool(model.predict_arrays, [(X_seq, times, window_id)], all_horizons))[0]
+    if not result:
+        raise HTTPException(status_code=500, detail="Prediction returned empty")
+    _shadow(request, model, [(X_seq, times, window_id)], all_horizons, [result])
+    return {**result, "model_version": model.version}
+
+def _shadow(request: Request, model, items, all_horizons: bool, results):
+    """Hand a sample of live predictions to the shadow model, if one is set (see model_registry)."""
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is not None:
+        registry.maybe_shadow(model, items, all_horizons, results)
+
+def _predict_incremental(model, stay_id: int, window_id: int, all_horizons: bool, db: Session):
+    """
+    Incremental path: only rows newer than the cached state are read and folded
+    into the stay's GRU-D recurrence. The row-count check, the fold and the scoring
+    run as one step under the stay lock (IncrementalEngine.sync_predict), which
+    reloads the full history when the cached state is out of sync (e.g. rows
+    inserted out of order).
+    """
+    engine = model.incremental
+    query = db.query(PatientData).filter(PatientData.stay_id == stay_id)
+    
+    def count_rows():
+        return db.query(func.count(PatientData.id)).filter(PatientData.stay_id == stay_id).scalar()
+    
+    def fetch_rows(after_hr):
+        rows = query if after_hr is None else query.filter(PatientData.hr > after_hr)
+        return _rows_to_records(rows.order_by(PatientData.hr).all())
+    
+    result = engine.sync_predict(stay_id, fetch_rows, count_rows, window_id, all_horizons)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Patient data not found")
+    return result
+
+@router.delete("/predict/{stay_id}/state")
+def evict_prediction_state(stay_id: int, request: Request):
+    """Drop the cached incremental inference state of a stay (e.g. after discharge)."""
+    model = getattr(request.app.state, "model", None)
+    evicted = bool(model and model.incremental and model.incremental.evict(stay_id))
+    return {"stay_id": stay_id, "evicted": evicted}
+
+@router.post("/predict/{stay_id}", response_model=PredictionOutput, response_model_exclude_none=True)
+async def predict_patient(stay_id: int, request: Request, window_hours: int = 6, all_horizons: bool = False, db: Session = Depends(get_read_db)):
+    latest_hr = (await run_in_threadpool(_latest_hrs, db, [stay_id])).get(stay_id)
+    if latest_hr is None:
         raise HTTPException(status_code=404, detail="Patient data not found")
     
     model = getattr(request.app.state, "model", None)
     if not model:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    # Convert window_hours to window_id (0=6h, 1=12h, 2=24h)
-    window_map = {6: 0, 12: 1, 24: 2}
-    window_id = window_map.get(window_hours, 0)
+    window_id = WINDOW_MAP.get(window_hours, 0)
     
-    records = []
-    for r in rows:
-        d = r.__dict__.copy()
-        d.pop('_sa_instance_state', None)
-        records.append(d)
+    async def compute():
+        if model.incremental is not None and not model.windowed:
+            # A few GRU steps per call; the check and fold of a stay run under its state lock
+            result = await run_in_threadpool(_predict_incremental, model, stay_id, window_id, all_horizons, db)
+            return {**result, "model_version": model.version}
+        last_n = model.context_rows(window_id, all_horizons)
+        arrays = await run_in_threadpool(_load_arrays, model, [stay_id], db, getattr(request.app.state, "feature_store", None), last_n)
+        if stay_id not in arrays:
+            raise HTTPException(status_code=404, detail="Patient data not found")
+        return await _score(request, model, *arrays[stay_id], window_id, all_horizons)
         
     try:
-        result = model.predict(records, window_id=window_id)
-        if not result:
-             raise HTTPException(status_code=500, detail="Prediction returned empty")
-        return result
+        cache = getattr(request.app.state, "prediction_cache", None)
+        if cache is None:
+            return await compute()
+        return await cache.get_or_compute_async((stay_id, latest_hr, (window_id, all_horizons), model.version), compute)
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
         print(f"Prediction Error: {tb}")
         raise HTTPException(status_code=500, detail=f"Prediction logic error: {e}. Traceback: {tb}")
 
-@router.post("/predict", response_model=PredictionOutput)
-def predict_manual(data: PredictionInput, request: Request, window_hours: int = 6):
+@router.get("/predict/{stay_id}/trajectory", response_model=TrajectoryOutput)
+async def predict_trajectory(stay_id: int, request: Request, window_hours: int = 6, db: Session = Depends(get_read_db)):
+    """
+    Predictions at every hour of a stay, each from the window_hours rows ending
+    at that hour. Hours already in the trajectory cache are not recomputed, so
+    a stay that grew by one hour costs one window.
+    """
+    model = getattr(request.app.state, "model", None)
+    if not model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    window_id = WINDOW_MAP.get(window_hours, 0)
+    arrays = await run_in_threadpool(_load_arrays, model, [stay_id], db, getattr(request.app.state, "feature_store", None))
+    if stay_id not in arrays:
+        raise HTTPException(status_code=404, detail="Patient data not found")
+    X_seq, times = arrays[stay_id]
+    
+    cache = getattr(request.app.state, "trajectory_cache", None)
+    keys = [(stay_id, int(hr), window_id, model.version) for hr in times]
+    points = [cache.get(key) if cache is not None else None for key in keys]
+    missing = [i for i, point in enumerate(points) if point is None]
+    
+    if missing:
+        try:
+            scored = await _run_model(request, model.predict_trajectory, X_seq, times, window_id, missing)
+        except Exception as e:
+            import traceback
+            tb = traceback.format_exc()
+            print(f"Trajectory Prediction Error: {tb}")
+            raise HTTPException(status_code=500, detail=f"Prediction logic error: {e}")
+        for i, result in zip(missing, scored):
+            points[i] = result
+            if cache is not None:
+                cache.put(keys[i], result)
+    
+    return {
+        "stay_id": stay_id,
+        "window_hours": next(hours for hours, w in WINDOW_MAP.items() if w == window_id),
+        "points": [{**point, "hr": key[1]} for key, point in zip(keys, points)],
+        "computed": len(missing),
+        "model_version": model.version,
+    }
+
+@router.get("/cache/stats")
+def get_cache_stats(request: Request):
+    cache = getattr(request.app.state, "prediction_cache", None)
+    if cache is None:
+        return {"enabled": False}
+    stats = cache.stats()
+    trajectory_cache = getattr(request.app.state, "trajectory_cache", None)
+    if trajectory_cache is not None:
+        stats["trajectory"] = trajectory_cache.stats()
+    return stats
+
+@router.get("/inference/stats")
+def get_inference_stats(request: Request):
+    queue = getattr(request.app.state, "inference_queue", None)
+    return queue.stats() if queue is not None else {"enabled": False}
+
+def _registry(request: Request):
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is None:
+        raise HTTPException(status_code=503, detail="Model registry not configured")
+    return registry
+
+def _mutable_registry(request: Request):
+    """
+    The registry, for endpoints that change the served models. Under serve.py every
+    worker has its own registry: a change would reach only the worker that got the
+    request (and a re-forked worker starts from the parent's models), so these
+    endpoints are refused there; switch versions with MODEL_VERSION /
+    MODEL_SHADOW_VERSION and a restart instead.
+    """
+    if getattr(request.app.state, "prefork", False):
+        raise HTTPException(status_code=409, detail="Model changes are per worker under serve.py; "
+                                                    "set MODEL_VERSION / MODEL_SHADOW_VERSION and restart")
+    return _registry(request)
+
+@router.get("/models")
+def get_models(request: Request):
+    """Model versions on disk, the active one, the shadow (with its metrics) and loads in progress."""
+    return _registry(request).status()
+
+@router.post("/models/{name}/activate", status_code=202)
+def activate_model(name: str, request: Request):
+    """Load a version in the background, warm it up and swap it in."""
+    registry = _mutable_registry(request)
+    if name not in registry.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version {name}")
+    return {"name": name, "loading": registry.load_async(name, "active")}
+
+@router.post("/models/{name}/shadow", status_code=202)
+def shadow_model(name: str, request: Request, fraction: float = 0.1):
+    """Load a version in the background as the shadow, scoring `fraction` of live predictions."""
+    registry = _mutable_registry(request)
+    if name not in registry.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version {name}")
+    if not 0 < fraction <= 1:
+        raise HTTPException(status_code=400, detail="fraction must be in (0, 1]")
+    return {"name": name, "fraction": fraction, "loading": registry.load_async(name, "shadow", fraction)}
+
+@router.post("/models/shadow/promote")
+def promote_shadow_model(request: Request):
+    """Make the (already warm) shadow the active model."""
+    if not _mutable_registry(request).promote_shadow():
+        raise HTTPException(status_code=404, detail="No shadow model")
+    return _registry(request).status()["active"]
+
+@router.delete("/models/shadow")
+def clear_shadow_model(request: Request):
+    _mutable_registry(request).clear_shadow()
+    return {"shadow": None}
+
+@router.post("/predict", response_model=PredictionOutput, response_model_exclude_none=True)
+async def predict_manual(data: PredictionInput, request: Request, window_hours: int = 6, all_horizons: bool = False):
     model = getattr(request.app.state, "model", None)
     if not model:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    # Convert window_hours to window_id (0=6h, 1=12h, 2=24h)
-    window_map = {6: 0, 12: 1, 24: 2}
-    window_id = window_map.get(window_hours, 0)
+    window_id = WINDOW_MAP.get(window_hours, 0)
         
     try:
         records = [data.dict()]
-        result = model.predict(records, window_id=window_id)
-        return result
+        X_seq, times = model.records_to_array(records)
+        return await _score(request, model, X_seq, times, window_id, all_horizons)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {e}")
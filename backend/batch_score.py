@@ -0,0 +1,269 @@
+"""
+Offline batch scoring of a whole parquet extract (e.g. df_test30.parquet),
+without the database or the API: every stay is scored at every hour with the
+training-style 6h / 12h / 24h windows, like GET /predict/{stay_id}/trajectory.
+
+The extract is streamed one row group at a time (rows of a stay must be
+contiguous, e.g. sorted by stay_id; a stay may span row groups). Each row
+group becomes a float32 feature matrix column by column, is cut at stay
+boundaries into chunks of about --chunk-rows rows, and the chunks are scored
+across a process pool. Every worker loads the model once and gathers the
+windows of all stays in its chunk with one index array, so imputation and the
+encoder run on large batches; workers get cores // workers threads each.
+
+Finished chunks are written as parts next to the output (<output>.parts/)
+and skipped when the same command runs again, so an interrupted run resumes
+where it stopped. Once all chunks are done the parts are merged into the
+output parquet: one row per stay and hour, stay_id, hr and one <name>_<6|12|24>h
+column per model output (sepsis_6h, renal_24h, ...).
+
+Usage (from backend/):
+    python batch_score.py ../dataset/df_test30.parquet predictions.parquet --workers 4
+    python batch_score.py extract.parquet out.parquet --model-dir ../new_model --precision bf16
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from model_wrapper import MODEL_INPUT_FEATURES, TARGET_COLS, WINDOW_HOURS, ModelWrapper, PRECISIONS
+from threads import available_cores, limit_threads, thread_budget
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "../new_model")
+SOFA_COLS = ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]
+OUTPUT_COLUMNS = ["sepsis"] + SOFA_COLS + ["hours_beforesepsis", "hours_beforedeath", "fod"]
+
+
+def table_to_matrix(table):
+    """
+    Raw [N, F] float32 features in MODEL_INPUT_FEATURES order (NaN = missing),
+    [N] hr and [N] stay_id of an arrow table, column by column. Same values as
+    records_to_matrix() on the rows as dicts.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    N = table.num_rows
+    X = np.full((N, len(MODEL_INPUT_FEATURES)), np.nan, dtype=np.float32)
+    names = set(table.column_names)
+    for j, name in enumerate(MODEL_INPUT_FEATURES):
+        if name == "gender" and "f0_" in names:
+            f0 = table.column("f0_")
+            # M / unknown -> 0, F -> 1
+            X[:, j] = pc.is_in(f0, value_set=pa.array(["F", "Female"])).fill_null(False).to_numpy(zero_copy_only=False)
+        elif name in names and name not in TARGET_COLS:
+            column = table.column(name)
+            if pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type):
+                # Unsafe cast: stay_id (~3e7) and other large integers round to the
+                # nearest float32 like records_to_matrix, instead of raising
+                X[:, j] = pc.cast(column, pa.float32(), safe=False).to_numpy(zero_copy_only=False)
+    times = pc.cast(table.column("hr"), pa.float64()).to_numpy(zero_copy_only=False)
+    stay_ids = table.column("stay_id").to_numpy(zero_copy_only=False)
+    return X, times, stay_ids
+
+
+def stay_starts(stay_ids):
+    """[N] index of the first row of each row's stay, for rows grouped by stay."""
+    new_stay = np.ones(len(stay_ids), dtype=bool)
+    new_stay[1:] = stay_ids[1:] != stay_ids[:-1]
+    return np.maximum.accumulate(np.where(new_stay, np.arange(len(stay_ids)), 0))
+
+
+def split_chunks(stay_ids, chunk_rows):
+    """(start, end) row ranges of about chunk_rows rows, cut only at stay boundaries."""
+    boundaries = np.flatnonzero(np.r_[True, stay_ids[1:] != stay_ids[:-1]])
+    chunks, start = [], 0
+    for boundary in boundaries[1:]:
+        if boundary - start >= chunk_rows:
+            chunks.append((start, int(boundary)))
+            start = int(boundary)
+    chunks.append((start, len(stay_ids)))
+    return chunks
+
+
+def iter_row_groups(path, columns):
+    """
+    (row group, arrow table) with whole stays only, sorted by (stay_id, hr):
+    the trailing stay of a row group is carried over into the next one.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    carry = None
+    for group in range(parquet.num_row_groups):
+        table = parquet.read_row_group(group, columns=columns)
+        if carry is not None:
+            table = pa.concat_tables([carry, table])
+        if group < parquet.num_row_groups - 1 and table.num_rows:
+            stay_ids = table.column("stay_id").to_numpy(zero_copy_only=False)
+            last = np.flatnonzero(stay_ids != stay_ids[-1])
+            cut = int(last[-1]) + 1 if len(last) else 0
+            table, carry = table.slice(0, cut), table.slice(cut)
+        yield group, table.sort_by([("stay_id", "ascending"), ("hr", "ascending")])
+
+
+def served_outputs(regression_cols, y_reg, y_bin):
+    """
+    OUTPUT_COLUMNS arrays of trajectory_outputs() results, with the values the
+    API serves (ModelWrapper._format_result on every row): SOFA clipped to
+    [0, 4], hours to >= 0, fod from the SOFA total.
+    """
+    outputs = {col: y_reg[:, j].astype(np.float64) for j, col in enumerate(regression_cols)}
+    for col in SOFA_COLS:
+        outputs[col] = np.clip(outputs[col], 0.0, 4.0)
+    for col in ["hours_beforesepsis", "hours_beforedeath"]:
+        outputs[col] = np.maximum(outputs[col], 0.0)
+    outputs["sepsis"] = y_bin[:, 0].astype(np.float64)
+    outputs["fod"] = 1.0 / (1.0 + np.exp(-0.3 * (sum(outputs[col] for col in SOFA_COLS) - 8)))
+    return outputs
+
+
+# --- Worker process ---
+
+_model = None
+
+
+def init_worker(model_dir, artifact, precision, n_threads):
+    global _model
+    limit_threads(n_threads)
+    _model = ModelWrapper(model_dir, artifact=artifact, precision=precision)
+
+
+def score_chunk(part_path, X, times, stay_ids, batch_size):
+    """Score every row of the stays in one chunk at all horizons and write the part. Returns rows written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    starts = stay_starts(stay_ids)
+    columns = {"stay_id": pa.array(stay_ids), "hr": pa.array(times.astype(np.int64))}
+    for window_id, hours in enumerate(WINDOW_HOURS):
+        y_reg, y_bin = _model.trajectory_outputs(X, times, window_id, batch_size=batch_size, starts=starts)
+        outputs = served_outputs(_model.regression_cols, y_reg, y_bin)
+        for col in OUTPUT_COLUMNS:
+            columns[f"{col}_{hours}h"] = pa.array(outputs[col].astype(np.float32))
+    table = pa.table(columns)
+    # Renamed into place only once complete, so a part on disk is always whole
+    pq.write_table(table, part_path + ".tmp")
+    os.replace(part_path + ".tmp", part_path)
+    return table.num_rows
+
+
+# --- Driver ---
+
+def check_progress(parts_dir, settings, restart):
+    """Resume only a run with the same input, model and chunking (else --restart)."""
+    progress_path = os.path.join(parts_dir, "progress.json")
+    if os.path.exists(progress_path) and not restart:
+        with open(progress_path) as f:
+            previous = json.load(f)
+        if previous != settings:
+            changed = sorted(k for k in settings if previous.get(k) != settings[k])
+            raise SystemExit(f"{parts_dir} belongs to a different run ({', '.join(changed)} changed); "
+                             "use --restart to discard it")
+    elif os.path.exists(parts_dir):
+        shutil.rmtree(parts_dir)
+    os.makedirs(parts_dir, exist_ok=True)
+    with open(progress_path, "w") as f:
+        json.dump(settings, f, indent=2)
+
+
+def merge_parts(parts_dir, output, model_version):
+    import pyarrow.parquet as pq
+
+    parts = sorted(name for name in os.listdir(parts_dir) if name.endswith(".parquet"))
+    writer = None
+    for name in parts:
+        table = pq.read_table(os.path.join(parts_dir, name))
+        if writer is None:
+            schema = table.schema.with_metadata({"model_version": model_version})
+            writer = pq.ParquetWriter(output + ".tmp", schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is None:
+        return 0
+    writer.close()
+    os.replace(output + ".tmp", output)
+    return len(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="parquet extract with stay_id, hr and the feature columns")
+    parser.add_argument("output", help="predictions parquet to write")
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--artifact", default="auto")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--workers", type=int, default=available_cores())
+    parser.add_argument("--chunk-rows", type=int, default=20_000, help="rows per task (cut at stay boundaries)")
+    parser.add_argument("--batch-size", type=int, default=512, help="windows per forward pass")
+    parser.add_argument("--restart", action="store_true", help="discard the progress of a previous run")
+    parser.add_argument("--keep-parts", action="store_true", help="keep <output>.parts/ after merging")
+    args = parser.parse_args()
+
+    import pyarrow.parquet as pq
+
+    schema_names = set(pq.read_schema(args.input).names)
+    missing = {"stay_id", "hr"} - schema_names
+    if missing:
+        parser.error(f"{args.input} has no {', '.join(sorted(missing))} column")
+    columns = [name for name in ["stay_id", "hr", "f0_"] + MODEL_INPUT_FEATURES if name in schema_names]
+    columns = list(dict.fromkeys(columns))
+
+    # The model version tags the output; the workers load their own copies
+    model_version = ModelWrapper(args.model_dir, artifact=args.artifact, precision=args.precision).version
+    stat = os.stat(args.input)
+    parts_dir = args.output + ".parts"
+    check_progress(parts_dir, {
+        "input": os.path.abspath(args.input), "input_size": stat.st_size, "input_mtime": stat.st_mtime,
+        "model_version": model_version, "chunk_rows": args.chunk_rows,
+    }, args.restart)
+
+    n_threads = thread_budget(args.workers)
+    print(f"{args.workers} workers x {n_threads} threads, model {model_version}")
+    started = time.perf_counter()
+    rows_scored = rows_skipped = 0
+    seen_stays = set()
+    pending = set()
+    # Spawned, not forked: each worker sets its thread budget before torch starts any pool
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker,
+                             initargs=(args.model_dir, args.artifact, args.precision, n_threads)) as pool:
+        for group, table in iter_row_groups(args.input, columns):
+            X, times, stay_ids = table_to_matrix(table)
+            stays = set(np.unique(stay_ids).tolist())
+            if stays & seen_stays:
+                raise SystemExit(f"Stays {sorted(stays & seen_stays)[:5]} reappear in row group {group}; "
+                                 "sort the extract by stay_id first")
+            seen_stays |= stays
+            for k, (start, end) in enumerate(split_chunks(stay_ids, args.chunk_rows)):
+                part_path = os.path.join(parts_dir, f"part-{group:06d}-{k:04d}.parquet")
+                if os.path.exists(part_path):
+                    rows_skipped += end - start
+                    continue
+                # Bounded read-ahead: at most two chunks queued per worker
+                while len(pending) >= 2 * args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    rows_scored += sum(future.result() for future in done)
+                pending.add(pool.submit(score_chunk, part_path, X[start:end], times[start:end],
+                                        stay_ids[start:end], args.batch_size))
+            elapsed = time.perf_counter() - started
+            print(f"row group {group}: {rows_scored} rows scored ({rows_scored / max(elapsed, 1e-9):.0f} rows/s), "
+                  f"{rows_skipped} already done")
+        for future in pending:
+            rows_scored += future.result()
+
+    elapsed = time.perf_counter() - started
+    n_parts = merge_parts(parts_dir, args.output, model_version)
+    if not args.keep_parts:
+        shutil.rmtree(parts_dir)
+    print(f"Scored {rows_scored} rows of {len(seen_stays)} stays in {elapsed:.1f}s "
+          f"({rows_scored / max(elapsed, 1e-9):.0f} rows/s, {rows_skipped} rows resumed); "
+          f"{n_parts} parts merged into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""
+Micro-benchmarks for the prediction backend.
+
+Usage (from backend/):
+    python benchmark.py batch --model-dir ../new_model
+    python benchmark.py store --stays 32
+    python benchmark.py queue --clients 1 8 64
+    python benchmark.py window --hours 24 168 720 2000
+    python benchmark.py trajectory --hours 48 168 720
+    python benchmark.py history --hours 504
+    python benchmark.py preprocess --hours 24 168 720
+    python benchmark.py startup        # after python export_model.py
+    python benchmark.py serve --workers 1 2 4
+    python benchmark.py dataset --stays 2000 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from model_wrapper import ModelWrapper, MODEL_INPUT_FEATURES, WINDOW_HOURS
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "../new_model")
+SOFA_COLS = ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]
+
+
+def synthetic_records(rng, T, stay_id=1, missing_rate=0.7):
+    """Hourly records shaped like PatientData rows, starting at the hr=-1 baseline."""
+    records = []
+    for t in range(T):
+        rec = {col: (float(rng.normal(50, 20)) if rng.random() > missing_rate else None)
+               for col in MODEL_INPUT_FEATURES}
+        rec.update(stay_id=stay_id, hr=t - 1, age=65, f0_="M")
+        records.append(rec)
+    return records
+
+
+def timeit(fn, repeat=5):
+    """Best-of-N wall time in seconds (after one warm-up call)."""
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_batch(model, args):
+    rng = np.random.default_rng(0)
+    print(f"{'stays':>6} {'T':>5} {'single (s)':>11} {'batch (s)':>10} {'stays/s single':>15} {'stays/s batch':>14} {'speedup':>8}")
+    for n_stays in args.stays:
+        items = [(synthetic_records(rng, args.hours, stay_id=i), i % 3) for i in range(n_stays)]
+        t_single = timeit(lambda: [model.predict(records, window_id) for records, window_id in items], args.repeat)
+        t_batch = timeit(lambda: model.predict_batch(items), args.repeat)
+        print(f"{n_stays:>6} {args.hours:>5} {t_single:>11.4f} {t_batch:>10.4f} "
+              f"{n_stays / t_single:>15.1f} {n_stays / t_batch:>14.1f} {t_single / t_batch:>7.1f}x")
+
+
+def bench_store(model, args):
+    """Per-stay predict latency: ORM rows from patient_data vs the memory-mapped feature store."""
+    from database import SessionLocal, PatientData
+    from feature_store import FeatureStore
+
+    db = SessionLocal()
+    try:
+        stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().limit(args.stays)]
+        if not stay_ids:
+            print("patient_data is empty")
+            return
+        with tempfile.TemporaryDirectory() as root:
+            store = FeatureStore(root)
+            start = time.perf_counter()
+            n_rows = store.build(db)
+            print(f"built store: {n_rows} rows in {time.perf_counter() - start:.2f}s")
+
+            def from_db():
+                for sid in stay_ids:
+                    rows = db.query(PatientData).filter(PatientData.stay_id == sid).order_by(PatientData.hr).all()
+                    records = []
+                    for r in rows:
+                        d = r.__dict__.copy()
+                        d.pop('_sa_instance_state', None)
+                        records.append(d)
+                    model.predict(records)
+                db.expunge_all()
+
+            def from_store():
+                for sid in stay_ids:
+                    X_seq, times = store.get(sid)
+                    model.predict_arrays([(X_seq, times, 0)])
+
+            t_db = timeit(from_db, args.repeat) / len(stay_ids)
+            t_store = timeit(from_store, args.repeat) / len(stay_ids)
+            print(f"{'stays':>6} {'db (ms/stay)':>13} {'store (ms/stay)':>16} {'speedup':>8}")
+            print(f"{len(stay_ids):>6} {t_db * 1000:>13.2f} {t_store * 1000:>16.2f} {t_db / t_store:>7.1f}x")
+    finally:
+        db.close()
+
+
+def bench_queue(model, args):
+    """Concurrent clients: one forward pass per request on a threadpool vs the micro-batching queue."""
+    from concurrent.futures import ThreadPoolExecutor
+    from inference_queue import InferenceQueue
+
+    rng = np.random.default_rng(0)
+    stays = [model.records_to_array(synthetic_records(rng, args.hours, stay_id=i)) for i in range(64)]
+
+    async def run_clients(n_clients, score):
+        latencies = []
+
+        async def client(c):
+            for r in range(args.requests):
+                X_seq, times = stays[(c * args.requests + r) % len(stays)]
+                start = time.perf_counter()
+                await score(X_seq, times)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client(c) for c in range(n_clients)])
+        return np.array(latencies), time.perf_counter() - start
+
+    async def bench(n_clients):
+        # Today's path: every request runs its own batch-of-one on Starlette's threadpool (40 threads)
+        pool = ThreadPoolExecutor(max_workers=40)
+        loop = asyncio.get_running_loop()
+        direct = lambda X_seq, times: loop.run_in_executor(pool, model.predict_arrays, [(X_seq, times, 0)])
+        queue = InferenceQueue(lambda: model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        rows = []
+        for name, score in [("direct", direct), ("queue", queue.submit)]:
+            await run_clients(n_clients, score)  # warm-up
+            lat, wall = await run_clients(n_clients, score)
+            rows.append((name, lat, wall))
+        pool.shutdown()
+        queue.stop()
+        return rows, queue.stats()["avg_batch"]
+
+    print(f"{'clients':>7} {'path':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'req/s':>8} {'avg batch':>10}")
+    for n_clients in args.clients:
+        rows, avg_batch = asyncio.run(bench(n_clients))
+        for name, lat, wall in rows:
+            print(f"{n_clients:>7} {name:>7} {np.percentile(lat, 50) * 1000:>9.1f} {np.percentile(lat, 99) * 1000:>9.1f} "
+                  f"{len(lat) / wall:>8.1f} {avg_batch if name == 'queue' else 1:>10}")
+
+
+# Runs in a fresh interpreter so imports and page cache effects are part of the measurement
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import numpy as np
+from model_wrapper import ModelWrapper
+imported = time.perf_counter()
+model = ModelWrapper(sys.argv[1], artifact=sys.argv[2], runtime=sys.argv[3])
+loaded = time.perf_counter()
+from benchmark import synthetic_records
+X_seq, times = model.records_to_array(synthetic_records(np.random.default_rng(0), 48))
+first = time.perf_counter()
+model.predict_arrays([(X_seq, times, 0)])
+first_done = time.perf_counter()
+model.predict_arrays([(X_seq, times, 0)])
+second_done = time.perf_counter()
+print(json.dumps({"import": imported - started, "load": loaded - imported,
+                  "first": first_done - first, "second": second_done - first_done}))
+"""
+
+
+def bench_window(model, args):
+    """Latency vs stay length, full-history vs windowed mode, and how far the windowed outputs drift."""
+    rng = np.random.default_rng(0)
+    print(f"{'T':>6} {'full (ms)':>10} {'windowed (ms)':>14} {'speedup':>8} {'max |dp sepsis|':>16} {'max |dSOFA|':>12}")
+    for T in args.hours:
+        items = [(*model.records_to_array(synthetic_records(rng, T, stay_id=i)), i % 3) for i in range(args.stays)]
+        model.windowed = False
+        full = model.predict_arrays(items, all_horizons=True)
+        t_full = timeit(lambda: model.predict_arrays(items, all_horizons=True), args.repeat)
+        model.windowed = True
+        windowed = model.predict_arrays(items, all_horizons=True)
+        t_windowed = timeit(lambda: model.predict_arrays(items, all_horizons=True), args.repeat)
+        model.windowed = False
+        d_prob = max(abs(a["sepsis"] - b["sepsis"]) for a, b in zip(full, windowed))
+        d_sofa = max(abs(sum(a[c] for c in SOFA_COLS) - sum(b[c] for c in SOFA_COLS)) for a, b in zip(full, windowed))
+        print(f"{T:>6} {t_full * 1000:>10.2f} {t_windowed * 1000:>14.2f} {t_full / t_windowed:>7.1f}x "
+              f"{d_prob:>16.4f} {d_sofa:>12.3f}")
+
+
+def bench_trajectory(model, args):
+    """Risk-over-time for a whole stay: one predict() per hour vs one batched predict_trajectory()."""
+    rng = np.random.default_rng(0)
+    print(f"{'T':>6} {'per hour (s)':>13} {'trajectory (s)':>15} {'speedup':>8}")
+    for T in args.hours:
+        records = synthetic_records(rng, T)
+        X_seq, times = model.records_to_array(records)
+        n = WINDOW_HOURS[0]
+        t_loop = timeit(lambda: [model.predict(records[max(0, t - n + 1):t + 1], 0) for t in range(T)], args.repeat)
+        t_traj = timeit(lambda: model.predict_trajectory(X_seq, times, 0), args.repeat)
+        print(f"{T:>6} {t_loop:>13.3f} {t_traj:>15.3f} {t_loop / t_traj:>7.1f}x")
+
+
+def bench_history(args):
+    """GET /patient/{stay_id} payload size and encode time per format, for one long synthetic stay."""
+    from fastapi.encoders import jsonable_encoder
+    from database import PatientData
+    from history import HISTORY_COLUMNS, parse_fields, rows_payload, columnar_payload, arrow_payload
+
+    rng = np.random.default_rng(0)
+    records = [{name: rec.get(name) for name in HISTORY_COLUMNS}
+               for rec in synthetic_records(rng, args.hours, stay_id=30000000)]
+    for i, rec in enumerate(records):
+        rec["id"] = i + 1
+    rows = [tuple(rec.get(name) for name in HISTORY_COLUMNS) for rec in records]
+    orm_rows = [PatientData(**rec) for rec in records]
+    fields = parse_fields(args.fields)
+    projected = [tuple(rec.get(name) for name in fields) for rec in records]
+
+    def encode_json(payload_fn, columns, data):
+        return lambda: json.dumps(payload_fn(columns, data)).encode()
+
+    cases = [
+        ("ORM + jsonable_encoder (before)", lambda: json.dumps(jsonable_encoder(orm_rows)).encode()),
+        ("rows", encode_json(rows_payload, HISTORY_COLUMNS, rows)),
+        ("columnar", encode_json(columnar_payload, HISTORY_COLUMNS, rows)),
+        (f"columnar fields={len(fields) - 1}", encode_json(columnar_payload, fields, projected)),
+        ("arrow", lambda: arrow_payload(HISTORY_COLUMNS, rows)),
+        (f"arrow fields={len(fields) - 1}", lambda: arrow_payload(fields, projected)),
+    ]
+    print(f"{args.hours} hourly rows, {len(HISTORY_COLUMNS)} columns")
+    print(f"{'format':>32} {'bytes':>10} {'encode (ms)':>12}")
+    for name, encode in cases:
+        try:
+            size = len(encode())
+        except ImportError:
+            print(f"{name:>32} {'(needs pyarrow)':>23}")
+            continue
+        print(f"{name:>32} {size:>10,} {timeit(encode, args.repeat) * 1000:>12.2f}")
+
+
+def bench_preprocess(args):
+    """
+    Rows -> model input arrays: ORM rows + records_to_matrix() (pandas) vs the
+    compiled feature map (tuples into a preallocated float32 array). Conversion
+    alone on synthetic stays, then query + conversion on patient_data.
+    """
+    from database import SessionLocal, PatientData, stay_rows
+    from feature_map import FEATURE_MAP
+    from model_wrapper import records_to_matrix
+
+    rng = np.random.default_rng(0)
+    print("conversion only (synthetic stay)")
+    print(f"{'T':>6} {'records_to_matrix (ms)':>23} {'feature map (ms)':>17} {'speedup':>8}")
+    for hours in args.hours:
+        records = synthetic_records(rng, hours)
+        X, _ = records_to_matrix(records)
+        rows = [(1, *[None if np.isnan(v) else float(v) for v in x]) for x in X]
+        assert np.array_equal(FEATURE_MAP.fill(rows), X, equal_nan=True)
+        t_before = timeit(lambda: records_to_matrix(records), args.repeat)
+        t_after = timeit(lambda: FEATURE_MAP.fill(rows), args.repeat)
+        print(f"{hours:>6} {t_before * 1000:>23.2f} {t_after * 1000:>17.2f} {t_before / t_after:>7.1f}x")
+
+    db = SessionLocal()
+    try:
+        stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().limit(args.stays)]
+        if not stay_ids:
+            print("patient_data is empty, skipping the query + conversion comparison")
+            return
+
+        def before():
+            records_by_stay = {}
+            for r in stay_rows(db, stay_ids):
+                d = r.__dict__.copy()
+                d.pop('_sa_instance_state', None)
+                records_by_stay.setdefault(r.stay_id, []).append(d)
+            arrays = {stay_id: records_to_matrix(records) for stay_id, records in records_by_stay.items()}
+            db.expunge_all()
+            return arrays
+
+        n_rows = sum(len(times) for _, times in FEATURE_MAP.load(db, stay_ids).values())
+        t_before = timeit(before, args.repeat)
+        t_after = timeit(lambda: FEATURE_MAP.load(db, stay_ids), args.repeat)
+        print(f"query + conversion ({len(stay_ids)} stays, {n_rows} rows, one query)")
+        print(f"{'ORM + records_to_matrix (ms)':>29} {'feature map (ms)':>17} {'speedup':>8}")
+        print(f"{t_before * 1000:>29.2f} {t_after * 1000:>17.2f} {t_before / t_after:>7.1f}x")
+    finally:
+        db.close()
+
+
+def bench_startup(args):
+    """Cold start: import, artifact load and first/second inference, pickle vs compiled artifact."""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = [("pickle", "eager"), ("compiled", "eager"), ("compiled", "torchscript")]
+    print(f"{'artifact':>9} {'runtime':>12} {'import (s)':>11} {'load (s)':>9} {'1st (ms)':>9} {'2nd (ms)':>9} {'total (s)':>10}")
+    for artifact, runtime in paths:
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, args.model_dir, artifact, runtime],
+                                 cwd=backend_dir, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{artifact:>9} {runtime:>12} failed: {out.stderr.strip().splitlines()[-1]}")
+                break
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        if not runs:
+            continue
+        best = {k: min(r[k] for r in runs) for k in runs[0]}
+        total = best["import"] + best["load"] + best["first"]
+        print(f"{artifact:>9} {runtime:>12} {best['import']:>11.2f} {best['load']:>9.3f} "
+              f"{best['first'] * 1000:>9.1f} {best['second'] * 1000:>9.1f} {total:>10.2f}")
+
+
+SERVE_PAYLOAD = json.dumps({"hr": 0, "age": 65, "f0_": "M", "heart_rate_max": 110, "sbp_min": 85}).encode()
+
+
+def _serve_load(port, clients, seconds):
+    """Closed-loop POST /predict (manual input, not cached) from `clients` threads. Returns latencies."""
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            conn.request("POST", "/predict", SERVE_PAYLOAD, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+        conn.close()
+        return latencies
+
+    with ThreadPoolExecutor(clients) as pool:
+        return [lat for lats in pool.map(lambda _: client(), range(clients)) for lat in lats]
+
+
+def bench_serve(args):
+    """Memory per worker and throughput of serve.py as the worker count grows (Linux)."""
+    import signal
+    import urllib.request
+    from serve import memory_mb
+    from threads import thread_budget
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'model':>9} {'workers':>7} {'threads':>7} {'worker pss (MiB)':>16} {'worker private':>14} {'total pss':>9} "
+          f"{'req/s':>7} {'p50 (ms)':>8} {'p99 (ms)':>8}")
+    runs = [(preload, n) for n in args.workers for preload in (True, False)]
+    for preload, n_workers in runs:
+        mode = "preload" if preload else "per-worker"
+        env = {**os.environ, "MODEL_PATH": os.path.abspath(args.model_dir), "RISK_SCHEDULER_INTERVAL": "0"}
+        proc = subprocess.Popen([sys.executable, "serve.py", "--workers", str(n_workers), "--port", str(args.port),
+                                 "--log-level", "warning", "--report-after", "0"] + ([] if preload else ["--no-preload"]),
+                                cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            # Ready once every worker has forked and the socket answers
+            for _ in range(600):
+                try:
+                    with open(f"/proc/{proc.pid}/task/{proc.pid}/children") as f:
+                        children = [int(pid) for pid in f.read().split()]
+                    urllib.request.urlopen(f"http://127.0.0.1:{args.port}/", timeout=1).read()
+                    if len(children) == n_workers:
+                        break
+                except OSError:
+                    pass
+                time.sleep(0.1)
+            else:
+                print(f"{mode:>9} {n_workers:>7} failed to start")
+                continue
+            latencies = _serve_load(args.port, args.clients, args.seconds)
+            workers = [memory_mb(pid) for pid in children]
+            parent = memory_mb(proc.pid)
+            pss = np.mean([w["pss"] for w in workers])
+            private = np.mean([w["private"] for w in workers])
+            total = parent["pss"] + sum(w["pss"] for w in workers)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{mode:>9} {n_workers:>7} {thread_budget(n_workers):>7} {pss:>16.1f} {private:>14.1f} {total:>9.1f} "
+                  f"{len(latencies) / args.seconds:>7.1f} {p50:>8.2f} {p99:>8.2f}")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+
+
+def legacy_window_samples(stay_ids, times, window_sizes=WINDOW_HOURS, horizon=1):
+    """The notebook's TemporalWindowDataset.__init__: one (hist, target, times_hist, w) tuple per sample."""
+    import pandas as pd
+
+    samples = []
+    df = pd.DataFrame({"stay_id": stay_ids, "time": times, "idx": np.arange(len(stay_ids))})
+    for stay_id, g in df.groupby("stay_id"):
+        g = g.sort_values("time")
+        idxs = g["idx"].values
+        tvals = g["time"].values
+        for w in window_sizes:
+            if len(idxs) <= w + horizon:
+                continue
+            for i in range(w, len(idxs) - horizon):
+                samples.append((idxs[i - w:i], idxs[i + horizon], tvals[i - w:i], w))
+    return samples
+
+
+def _build_in_child(build, stay_ids, times):
+    """Build time and RSS growth of one sample index, in a forked process so runs do not share a heap."""
+    import multiprocessing
+    from serve import memory_mb
+
+    def run(conn):
+        rss_before = memory_mb(os.getpid())["rss"]
+        started = time.perf_counter()
+        samples = build(stay_ids, times)
+        seconds = time.perf_counter() - started
+        conn.send((seconds, memory_mb(os.getpid())["rss"] - rss_before, len(samples)))
+        conn.send(samples.nbytes() / 2 ** 20 if hasattr(samples, "nbytes") else None)
+
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.get_context("fork").Process(target=run, args=(child,))
+    proc.start()
+    result = parent.recv() + (parent.recv(),)
+    proc.join()
+    return result
+
+
+def bench_dataset(args):
+    """
+    Training sample index: the notebook's per-sample tuples vs training.window_index.
+    RSS growth of the build includes heap the allocator keeps after temporaries
+    are freed; "held" is what the index arrays themselves occupy.
+    """
+    from training import TemporalWindowDataset, window_index
+
+    rng = np.random.default_rng(0)
+    print(f"{'stays':>7} {'rows':>9} {'samples':>10} {'tuples (s)':>11} {'tuples (MiB)':>13} "
+          f"{'index (s)':>10} {'index (MiB)':>12} {'held (MiB)':>11} {'speedup':>8}")
+    for n_stays in args.stays:
+        lengths = rng.integers(1, 2 * args.hours, size=n_stays)
+        stay_ids = np.repeat(rng.permutation(n_stays) + 30_000_000, lengths)
+        times = np.concatenate([np.arange(n) - 1 for n in lengths]).astype(np.float64)
+        t_before, mb_before, n_before, _ = _build_in_child(legacy_window_samples, stay_ids, times)
+        t_after, mb_after, _, held = _build_in_child(
+            lambda s, t: TemporalWindowDataset(np.empty((len(s), 1)), None, s, t, None), stay_ids, times)
+        print(f"{n_stays:>7} {len(stay_ids):>9} {n_before:>10} {t_before:>11.2f} {mb_before:>13.1f} "
+              f"{t_after:>10.3f} {mb_after:>12.1f} {held:>11.1f} {t_before / t_after:>7.0f}x")
+
+    # Same samples as the notebook, in the same order (small case)
+    stay_ids, times = stay_ids[:5000], times[:5000]
+    legacy = legacy_window_samples(stay_ids, times)
+    order, start, window_id, target = window_index(stay_ids, times)
+    rows = np.arange(len(stay_ids)) if order is None else order
+    assert len(legacy) == len(start)
+    for (hist, tgt, _, w), s, wid, t in zip(legacy, start, window_id, target):
+        assert WINDOW_HOURS[wid] == w and t == tgt and np.array_equal(rows[s:s + w], hist)
+    print(f"index matches the notebook's {len(legacy)} samples on {len(stay_ids)} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("batch", help="N single-stay predict() calls vs one predict_batch()")
+    p.add_argument("--stays", type=int, nargs="+", default=[1, 8, 32, 64])
+    p.add_argument("--hours", type=int, default=48)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("store", help="predict() from patient_data rows vs from the feature store")
+    p.add_argument("--stays", type=int, default=32)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("queue", help="p50/p99 latency and throughput: threadpool vs micro-batching queue")
+    p.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    p.add_argument("--requests", type=int, default=20, help="requests per client")
+    p.add_argument("--hours", type=int, default=48)
+    p.add_argument("--max-batch", type=int, default=32)
+    p.add_argument("--max-wait-ms", type=float, default=5.0)
+    p.set_defaults(func=bench_queue)
+
+    p = sub.add_parser("window", help="full-history vs 6/12/24h windowed inference by stay length")
+    p.add_argument("--hours", type=int, nargs="+", default=[24, 168, 720, 2000])
+    p.add_argument("--stays", type=int, default=8)
+    p.set_defaults(func=bench_window)
+
+    p = sub.add_parser("trajectory", help="hourly risk trajectory: per-hour predict() vs one batched pass")
+    p.add_argument("--hours", type=int, nargs="+", default=[48, 168, 720])
+    p.set_defaults(func=bench_trajectory)
+
+    p = sub.add_parser("history", help="patient history payload size and encode time by format")
+    p.add_argument("--hours", type=int, default=21 * 24)
+    p.add_argument("--fields", default="heart_rate_max,sbp_max,dbp_max,resp_rate_max,spo2_min,temperature_max")
+    p.set_defaults(func=bench_history, needs_model=False)
+
+    p = sub.add_parser("preprocess", help="rows -> model input arrays: records_to_matrix vs the compiled feature map")
+    p.add_argument("--hours", type=int, nargs="+", default=[24, 168, 720])
+    p.add_argument("--stays", type=int, default=32)
+    p.set_defaults(func=bench_preprocess, needs_model=False)
+
+    p = sub.add_parser("startup", help="cold start timings: pickle vs compiled artifact (fresh process each)")
+    p.set_defaults(func=bench_startup, needs_model=False)
+
+    p = sub.add_parser("serve", help="serve.py memory per worker and throughput by worker count")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--port", type=int, default=8799)
+    p.set_defaults(func=bench_serve, needs_model=False)
+
+    p = sub.add_parser("dataset", help="training sample index: notebook tuples vs vectorized window_index")
+    p.add_argument("--stays", type=int, nargs="+", default=[2000, 20000])
+    p.add_argument("--hours", type=int, default=72, help="mean stay length")
+    p.set_defaults(func=bench_dataset, needs_model=False)
+
+    args = parser.parse_args()
+    if not getattr(args, "needs_model", True):
+        args.func(args)
+        return
+    model = ModelWrapper(args.model_dir)
+    args.func(model, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Accuracy of the deployed ModelWrapper on a labelled dataset: sepsis AUROC /
+AUPRC and MAE / RMSE of every regression output (SOFA components, hours before
+sepsis / death, SOFA total) per horizon, written to a JSON report together with
+the scoring throughput.
+
+Samples are built like the notebook's TemporalWindowDataset: for every stay
+and head w (6/12/24h), each full window of w rows i-w .. i-1 is scored and
+compared with the labels of row i + `--horizon`, which is horizon + 1 rows
+after the window's last row (two with the default horizon of 1, as in
+training). Stays with at most w + horizon rows have no samples for that
+head. The samples of all stays are located with index arithmetic over one
+feature matrix and scored in large batches; metrics are computed over whole
+arrays.
+
+Labelled data comes from patient_data (DATABASE_URL, the default) or from a
+parquet extract such as df_test30.parquet.
+
+Usage (from backend/):
+    python evaluate.py --output eval_report.json
+    python evaluate.py --parquet ../dataset/df_test30.parquet --max-stays 2000 --model-dir ../new_model
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from model_wrapper import ModelWrapper, PRECISIONS, WINDOW_HOURS
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "../new_model")
+SOFA_COLS = ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]
+REGRESSION_COLS = SOFA_COLS + ["hours_beforesepsis", "hours_beforedeath"]
+LABEL_COLS = ["sepsis"] + REGRESSION_COLS
+
+
+def load_parquet(path, max_stays=None):
+    """X [N, F], times [N], stay_ids [N] and labels [N, len(LABEL_COLS)] of a labelled extract."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    from batch_score import table_to_matrix
+
+    table = pq.read_table(path)
+    if max_stays:
+        stay_ids = pc.unique(table.column("stay_id"))[:max_stays]
+        table = table.filter(pc.is_in(table.column("stay_id"), value_set=stay_ids))
+    table = table.sort_by([("stay_id", "ascending"), ("hr", "ascending")])
+    X, times, stay_ids = table_to_matrix(table)
+    labels = np.full((table.num_rows, len(LABEL_COLS)), np.nan)
+    for j, col in enumerate(LABEL_COLS):
+        if col in table.column_names:
+            labels[:, j] = pc.cast(table.column(col), pa.float64()).to_numpy(zero_copy_only=False)
+    return X, times, stay_ids, labels
+
+
+def load_database(max_stays=None):
+    """Same arrays from patient_data: the served features (FEATURE_MAP) plus the stored labels."""
+    from database import PatientData, SessionLocal, stay_rows
+    from feature_map import FEATURE_MAP
+
+    NAN = float("nan")
+    label_columns = [PatientData.__table__.c[col] for col in LABEL_COLS]
+    with SessionLocal() as db:
+        query = db.query(PatientData.stay_id).distinct().order_by(PatientData.stay_id)
+        stay_ids = [stay_id for (stay_id,) in (query.limit(max_stays) if max_stays else query)]
+        rows = stay_rows(db, stay_ids, columns=FEATURE_MAP.columns + label_columns)
+    n = 1 + FEATURE_MAP.n_features
+    X = FEATURE_MAP.fill([row[:n] for row in rows])
+    labels = np.array([[NAN if v is None else v for v in row[n:]] for row in rows], dtype=np.float64)
+    stay_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    return X, X[:, FEATURE_MAP.hr_index].astype(np.float64), stay_ids, labels.reshape(len(rows), len(LABEL_COLS))
+
+
+def window_samples(stay_ids, w, horizon):
+    """
+    Last rows of the full w-row windows and their target rows, for rows grouped
+    by stay: TemporalWindowDataset's (hist = rows i-w .. i-1, target = row i + horizon).
+    """
+    N = len(stay_ids)
+    new_stay = np.r_[True, stay_ids[1:] != stay_ids[:-1]]
+    starts = np.maximum.accumulate(np.where(new_stay, np.arange(N), 0))
+    stay_end = np.r_[np.flatnonzero(new_stay)[1:], N]
+    ends = np.repeat(stay_end, np.diff(np.r_[np.flatnonzero(new_stay), N]))
+    i = np.arange(N)
+    local = i - starts
+    valid = (local >= w) & (i + horizon < ends)
+    return i[valid] - 1, i[valid] + horizon, starts
+
+
+def regression_metrics(pred, true):
+    ok = ~np.isnan(true)
+    if not ok.any():
+        return {"n": 0, "mae": None, "rmse": None}
+    err = pred[ok] - true[ok]
+    return {"n": int(ok.sum()), "mae": float(np.abs(err).mean()), "rmse": float(np.sqrt((err ** 2).mean()))}
+
+
+def sepsis_metrics(prob, true):
+    ok = ~np.isnan(true)
+    y = true[ok] > 0.5
+    entry = {"n": int(ok.sum()), "prevalence": float(y.mean()) if ok.any() else None, "auroc": None, "auprc": None}
+    # Both classes are needed for a ranking metric
+    if y.any() and not y.all():
+        entry["auroc"] = float(roc_auc_score(y, prob[ok]))
+        entry["auprc"] = float(average_precision_score(y, prob[ok]))
+    return entry
+
+
+def evaluate(model, X, times, stay_ids, labels, horizon=1, batch_size=512):
+    """Per-horizon metrics (see module docstring) and timings."""
+    report = {}
+    for window_id, hours in enumerate(WINDOW_HOURS):
+        positions, targets, starts = window_samples(stay_ids, hours, horizon)
+        started = time.perf_counter()
+        y_reg, y_bin = model.trajectory_outputs(X, times, window_id, positions, batch_size, starts)
+        seconds = time.perf_counter() - started
+        # Served values: SOFA clipped to [0, 4], hours to >= 0 (as in _format_result)
+        pred = dict(zip(model.regression_cols, y_reg.T))
+        for col in SOFA_COLS:
+            pred[col] = np.clip(pred[col], 0.0, 4.0)
+        for col in ["hours_beforesepsis", "hours_beforedeath"]:
+            pred[col] = np.maximum(pred[col], 0.0)
+        true = {col: labels[targets, j] for j, col in enumerate(LABEL_COLS)}
+
+        regression = {col: regression_metrics(pred[col], true[col]) for col in REGRESSION_COLS}
+        regression["sofa_total"] = regression_metrics(
+            sum(pred[col] for col in SOFA_COLS), sum(true[col] for col in SOFA_COLS))
+        report[f"{hours}h"] = {
+            "samples": int(len(positions)),
+            "stays": int(len(np.unique(stay_ids[positions]))),
+            "scoring_seconds": seconds,
+            "samples_per_second": len(positions) / seconds if seconds > 0 else None,
+            "sepsis": sepsis_metrics(y_bin[:, 0], true["sepsis"]),
+            "regression": regression,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'horizon':>7} {'samples':>8} {'samples/s':>10} {'auroc':>7} {'auprc':>7} {'prev':>6}  "
+          + " ".join(f"{col[:6]:>7}" for col in SOFA_COLS) + f" {'total':>7}   (MAE)")
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else format("-", spec[:spec.index(".")] + "s")
+    for name, entry in report.items():
+        sepsis, regression = entry["sepsis"], entry["regression"]
+        print(f"{name:>7} {entry['samples']:>8} {fmt(entry['samples_per_second'], '>10.0f')} "
+              f"{fmt(sepsis['auroc'], '>7.4f')} {fmt(sepsis['auprc'], '>7.4f')} {fmt(sepsis['prevalence'], '>6.3f')}  "
+              + " ".join(fmt(regression[col]["mae"], ">7.3f") for col in SOFA_COLS)
+              + f" {fmt(regression['sofa_total']['mae'], '>7.3f')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--artifact", default="auto")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--parquet", help="labelled extract to evaluate on (default: patient_data)")
+    parser.add_argument("--max-stays", type=int, default=None)
+    parser.add_argument("--horizon", type=int, default=1, help="target row i+horizon for history rows i-w..i-1 (training: 1)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--output", default="eval_report.json")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.parquet:
+        X, times, stay_ids, labels = load_parquet(args.parquet, args.max_stays)
+        source = os.path.abspath(args.parquet)
+    else:
+        X, times, stay_ids, labels = load_database(args.max_stays)
+        from database import engine
+        source = engine.url.render_as_string(hide_password=True)
+    load_seconds = time.perf_counter() - started
+    print(f"Loaded {len(X)} rows of {len(np.unique(stay_ids))} stays in {load_seconds:.2f}s")
+
+    model = ModelWrapper(args.model_dir, artifact=args.artifact, precision=args.precision)
+    started = time.perf_counter()
+    horizons = evaluate(model, X, times, stay_ids, labels, args.horizon, args.batch_size)
+    total_seconds = time.perf_counter() - started
+    print_report(horizons)
+
+    report = {
+        "model_version": model.version,
+        "model_dir": os.path.abspath(args.model_dir),
+        "precision": args.precision,
+        "source": source,
+        "rows": int(len(X)),
+        "stays": int(len(np.unique(stay_ids))),
+        "horizon_rows": args.horizon,
+        "load_seconds": load_seconds,
+        "evaluate_seconds": total_seconds,
+        "horizons": horizons,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Evaluated in {total_seconds:.1f}s; report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Export a trained model directory to the fast-loading compiled artifact.
+
+Writes <model_dir>/compiled/:
+    manifest.json   architecture, tensor/scaler tables (name, shape, byte offset), source version
+    weights.f32     every state_dict tensor as flat float32, 64-byte aligned
+    scalers.f64     scaler_X / scaler_y_reg mean_ and scale_, global feature mean
+    encoder.pt      TorchScript trace of the GRU -> Transformer -> pooling stage
+
+ModelWrapper memory-maps weights.f32 and scalers.f64 instead of unpickling
+model_joblib.pkl and the joblib scalers (MODEL_RUNTIME=torchscript also uses
+encoder.pt). Both runtimes are checked against the pickle path; a failed
+check restores the previous export.
+
+Usage (from backend/):
+    python export_model.py --model-dir ../new_model
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import torch
+
+from model_wrapper import ModelWrapper, ARCHITECTURE, COMPILED_DIR
+
+ALIGN = 64
+
+
+def write_flat(path, arrays, dtype):
+    """Write named arrays back to back (ALIGN-byte aligned). Returns the manifest table."""
+    table = []
+    offset = 0
+    with open(path, "wb") as f:
+        for name, arr in arrays.items():
+            data = np.ascontiguousarray(arr, dtype=dtype)
+            pad = -offset % ALIGN
+            f.write(b"\0" * pad)
+            offset += pad
+            table.append({"name": name, "shape": list(data.shape), "offset": offset})
+            f.write(data.tobytes())
+            offset += data.nbytes
+    return table
+
+
+def scaler_arrays(name, scaler):
+    if getattr(scaler, "mean_", None) is None or getattr(scaler, "scale_", None) is None:
+        raise ValueError(f"{name} has no mean_/scale_; only StandardScaler-style scalers can be exported")
+    return {f"{name}.mean_": scaler.mean_, f"{name}.scale_": scaler.scale_}
+
+
+class _Encoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x, mask, delta):
+        return self.model.encode(x, mask, delta)
+
+
+def trace_encoder(model, n_features):
+    """Trace encode() on a padded example; shapes stay dynamic (no shape-dependent control flow)."""
+    x = torch.randn(2, 12, n_features)
+    mask = (torch.rand(2, 12, n_features) > 0.5).float()
+    mask[1, 8:] = 0
+    delta = torch.rand(2, 12, n_features)
+    with torch.no_grad():
+        return torch.jit.trace(_Encoder(model).eval(), (x, mask, delta), check_trace=False)
+
+
+def verify(reference, exported, n_stays=8, tol=1e-4):
+    """Compare predictions of the exported artifact with the pickle-loaded model."""
+    from benchmark import synthetic_records
+
+    rng = np.random.default_rng(0)
+    items = [(synthetic_records(rng, int(rng.integers(2, 60)), stay_id=i), i % 3) for i in range(n_stays)]
+    want = reference.predict_batch(items, all_horizons=True)
+    got = exported.predict_batch(items, all_horizons=True)
+    worst = 0.0
+    for a, b in zip(want, got):
+        for key, value in a.items():
+            if isinstance(value, float):
+                worst = max(worst, abs(value - b[key]))
+    if worst > tol:
+        raise RuntimeError(f"Exported model differs from the pickle path by {worst:.2e}")
+    return worst
+
+
+def export(model_dir):
+    started = time.perf_counter()
+    wrapper = ModelWrapper(model_dir, artifact="pickle")
+    out_dir = os.path.join(model_dir, COMPILED_DIR)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    state = wrapper.model.state_dict()
+    non_float = [name for name, t in state.items() if not t.is_floating_point()]
+    if non_float:
+        raise ValueError(f"Non-float tensors cannot go into weights.f32: {non_float}")
+    tensors = write_flat(os.path.join(tmp_dir, "weights.f32"),
+                         {name: t.detach().cpu().numpy() for name, t in state.items()}, np.float32)
+
+    scalers = {**scaler_arrays("scaler_X", wrapper.scaler_X),
+               **scaler_arrays("scaler_y_reg", wrapper.scaler_y_reg),
+               "global_feat_mean": wrapper.global_feat_mean}
+    scaler_table = write_flat(os.path.join(tmp_dir, "scalers.f64"), scalers, np.float64)
+
+    trace_encoder(wrapper.model, wrapper.n_features).save(os.path.join(tmp_dir, "encoder.pt"))
+
+    manifest = {
+        "format_version": 1,
+        "source_version": wrapper.version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "torch_version": torch.__version__,
+        "n_features": wrapper.n_features,
+        "architecture": ARCHITECTURE,
+        "tensors": tensors,
+        "scalers": scaler_table,
+        "encoder": "encoder.pt",
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap in the new export, keeping the previous one until both runtimes check out
+    backup_dir = out_dir + ".old"
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, backup_dir)
+    os.replace(tmp_dir, out_dir)
+    try:
+        for runtime in ("eager", "torchscript"):
+            worst = verify(wrapper, ModelWrapper(model_dir, artifact="compiled", runtime=runtime))
+            print(f"Verified {runtime} runtime: max abs diff {worst:.2e}")
+    except Exception:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        if os.path.exists(backup_dir):
+            os.replace(backup_dir, out_dir)
+        raise
+    shutil.rmtree(backup_dir, ignore_errors=True)
+
+    size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    print(f"Exported {len(tensors)} tensors to {out_dir} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=os.path.join(os.path.dirname(__file__), "../new_model"))
+    args = parser.parse_args()
+    export(args.model_dir)
+
+
+if __name__ == "__main__":
+    main()
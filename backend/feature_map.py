@@ -0,0 +1,75 @@
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import case, null
+
+from database import PatientData, stay_rows
+from model_wrapper import MODEL_INPUT_FEATURES, TARGET_COLS
+
+# =============================================================================
+# patient_data rows -> model input arrays without pandas
+#
+# The mapping from PatientData columns to MODEL_INPUT_FEATURES is fixed, so it
+# is compiled once into one SQL column expression per feature, in feature
+# order: the column itself, gender decoded from f0_ in SQL (unknown = 0, as
+# records_to_matrix does) and NULL for features patient_data does not have and
+# for target columns. Rows come back as plain tuples (stay_id first) and are
+# written straight into one preallocated float32 [N, F] array; each stay is a
+# contiguous slice of it. Same values as records_to_matrix() on the ORM rows.
+# =============================================================================
+
+
+def _feature_column(table, name):
+    if name == "gender":
+        return case((table.c.f0_.in_(("M", "Male")), 0), (table.c.f0_.in_(("F", "Female")), 1), else_=0)
+    if name in table.c and name not in TARGET_COLS:
+        return table.c[name]
+    return null()
+
+
+class FeatureMap:
+    """Compiled PatientData column -> model input mapping (see module comment)."""
+
+    def __init__(self, features=MODEL_INPUT_FEATURES):
+        table = PatientData.__table__
+        self.features = list(features)
+        self.n_features = len(self.features)
+        self.hr_index = self.features.index("hr")
+        # Selected columns: stay_id (for splitting stays), then one per feature
+        self.columns = [table.c.stay_id] + [_feature_column(table, name) for name in self.features]
+
+    def fill(self, rows, out=None):
+        """
+        Write feature tuples (stay_id first, as selected by `columns`) into a
+        float32 [N, F] array (NaN = missing). out is reused when given.
+        """
+        X = out if out is not None else np.empty((len(rows), self.n_features), dtype=np.float32)
+        if len(rows):
+            # All cells into one object array without a Python loop per cell, then one
+            # C-level cast (None -> NaN); stay_id is sliced off
+            cells = np.fromiter(chain.from_iterable(rows), dtype=object, count=len(rows) * (1 + self.n_features))
+            X[:] = cells.reshape(len(rows), 1 + self.n_features)[:, 1:]
+        return X
+
+    def split(self, rows, X):
+        """stay_id -> (X_seq [T, F], times [T]) views of X for rows ordered by (stay_id, hr)."""
+        arrays = {}
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end][0] != rows[start][0]:
+                X_seq = X[start:end]
+                arrays[rows[start][0]] = (X_seq, X_seq[:, self.hr_index].astype(np.float64))
+                start = end
+        return arrays
+
+    def load(self, db, stay_ids, last_n=None):
+        """
+        Model input arrays per stay straight from patient_data (one query), as
+        stay_id -> (X_seq [T, F] float32, times [T] float64). Stays without rows are left out.
+        """
+        rows = stay_rows(db, stay_ids, last_n, columns=self.columns)
+        return self.split(rows, self.fill(rows))
+
+
+# Built once at import
+FEATURE_MAP = FeatureMap()
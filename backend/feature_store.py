@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from database import PatientData
+from model_wrapper import MODEL_INPUT_FEATURES, records_to_matrix
+from feature_map import FEATURE_MAP
+
+# =============================================================================
+# Columnar per-stay feature store
+#
+# Raw model inputs (float32, MODEL_INPUT_FEATURES order, NaN = missing) are
+# kept in memory-mapped files so a stay's history is a zero-copy slice
+# instead of ORM rows -> dicts -> DataFrame -> numeric matrix.
+#
+# Layout of the store directory:
+#   meta.json        n_features, base row/stay counts
+#   base_X.f32       [N, F] rows sorted by (stay_id, hr)
+#   base_hr.f64      [N] hr of every base row
+#   base_index.npz   offset table: sorted stay_ids, starts, counts
+#   tail.bin         append log of rows written after the last build
+#                    (fixed-size records: stay_id, hr, x[F])
+#
+# The tail is re-read whenever the file grows, so rows appended by another
+# worker process become visible too. Callers should still compare row_count()
+# with the stays index and fall back to the database on a mismatch.
+# =============================================================================
+
+N_FEATURES = len(MODEL_INPUT_FEATURES)
+STORED_COLUMNS = PatientData.__table__.columns.keys()
+TAIL_DTYPE = np.dtype([("stay_id", "<i8"), ("hr", "<f8"), ("x", "<f4", (N_FEATURES,))])
+
+
+class FeatureStore:
+    """Memory-mapped feature matrices indexed by stay_id, with an append log for new rows."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._tail_fd = None
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    @property
+    def built(self):
+        return os.path.exists(self._path("meta.json"))
+
+    def _load(self):
+        """(Re)open the base files and replay the tail log."""
+        self.base_X = None
+        self.base_hr = None
+        self.stay_ids = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._tail = {}  # stay_id -> list of (hr, x)
+        self._tail_rows = 0
+        self._tail_offset = 0
+
+        if not self.built:
+            return
+
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        if meta["n_features"] != N_FEATURES:
+            raise ValueError(f"Feature store has {meta['n_features']} features, model expects {N_FEATURES}")
+
+        n_rows = meta["n_rows"]
+        if n_rows:
+            self.base_X = np.memmap(self._path("base_X.f32"), dtype=np.float32, mode="r", shape=(n_rows, N_FEATURES))
+            self.base_hr = np.memmap(self._path("base_hr.f64"), dtype=np.float64, mode="r", shape=(n_rows,))
+        index = np.load(self._path("base_index.npz"))
+        self.stay_ids, self.starts, self.counts = index["stay_ids"], index["starts"], index["counts"]
+        self._read_tail()
+
+    def _read_tail(self):
+        """Pick up tail records appended since the last read (by us or another process)."""
+        path = self._path("tail.bin")
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        n_new = (size - self._tail_offset) // TAIL_DTYPE.itemsize
+        if n_new <= 0:
+            return
+        new = np.fromfile(path, dtype=TAIL_DTYPE, count=n_new, offset=self._tail_offset)
+        for rec in new:
+            self._tail.setdefault(int(rec["stay_id"]), []).append((float(rec["hr"]), rec["x"]))
+        self._tail_offset += n_new * TAIL_DTYPE.itemsize
+        self._tail_rows += n_new
+
+    def _base_slice(self, stay_id):
+        i = np.searchsorted(self.stay_ids, stay_id)
+        if i < len(self.stay_ids) and self.stay_ids[i] == stay_id:
+            start, count = int(self.starts[i]), int(self.counts[i])
+            return self.base_X[start:start + count], self.base_hr[start:start + count]
+        return None, None
+
+    def row_count(self, stay_id):
+        with self._lock:
+            self._read_tail()
+            X, _ = self._base_slice(stay_id)
+            return (0 if X is None else len(X)) + len(self._tail.get(stay_id, ()))
+
+    def tail_rows(self):
+        return self._tail_rows
+
+    def get(self, stay_id):
+        """
+        Feature history of a stay as (X [T, F] float32, times [T] float64), ordered by hr.
+        Base rows are a zero-copy view of the memory map; only stays with appended
+        rows are copied. Returns (None, None) for unknown stays.
+        """
+        with self._lock:
+            self._read_tail()
+            X, hr = self._base_slice(stay_id)
+            tail = self._tail.get(stay_id)
+
+        if not tail:
+            return X, hr
+
+        tail_hr = np.array([t for t, _ in tail], dtype=np.float64)
+        tail_X = np.stack([x for _, x in tail]).astype(np.float32)
+        if X is None:
+            return tail_X, tail_hr
+        return np.concatenate([X, tail_X]), np.concatenate([hr, tail_hr])
+
+    def append(self, stay_id, records):
+        """Append new hourly rows (PatientData column dicts, ordered by hr) of one stay."""
+        # As the rows are stored and FEATURE_MAP reads them back: patient_data
+        # columns only, absent ones NULL (so a missing f0_ decodes to gender 0)
+        X, times = records_to_matrix([{col: r.get(col) for col in STORED_COLUMNS} for r in records])
+        if X is None:
+            return
+        rows = np.zeros(len(X), dtype=TAIL_DTYPE)
+        rows["stay_id"] = stay_id
+        rows["hr"] = times
+        rows["x"] = X
+
+        with self._lock:
+            if self._tail_fd is None:
+                os.makedirs(self.root, exist_ok=True)
+                self._tail_fd = os.open(self._path("tail.bin"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            # One write per call keeps each batch of records contiguous in the log
+            os.write(self._tail_fd, rows.tobytes())
+            self._read_tail()
+
+    def build(self, db, chunk_stays=2000):
+        """
+        Rebuild the base files from patient_data (drops the tail log).
+        Stays are streamed in chunks ordered by (stay_id, hr), so memory stays bounded.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().order_by(PatientData.stay_id)]
+
+        tmp_X, tmp_hr = self._path("base_X.f32.tmp"), self._path("base_hr.f64.tmp")
+        indexed, starts, counts = [], [], []
+        n_rows = 0
+        with open(tmp_X, "wb") as fx, open(tmp_hr, "wb") as fh:
+            for i in range(0, len(stay_ids), chunk_stays):
+                chunk = stay_ids[i:i + chunk_stays]
+                for sid, (X, times) in FEATURE_MAP.load(db, chunk).items():
+                    fx.write(np.ascontiguousarray(X, dtype=np.float32).tobytes())
+                    fh.write(np.asarray(times, dtype=np.float64).tobytes())
+                    indexed.append(sid)
+                    starts.append(n_rows)
+                    counts.append(len(X))
+                    n_rows += len(X)
+
+        with self._lock:
+            if self._tail_fd is not None:
+                os.close(self._tail_fd)
+                self._tail_fd = None
+            os.replace(tmp_X, self._path("base_X.f32"))
+            os.replace(tmp_hr, self._path("base_hr.f64"))
+            np.savez(self._path("base_index.npz"),
+                     stay_ids=np.array(indexed, dtype=np.int64),
+                     starts=np.array(starts, dtype=np.int64),
+                     counts=np.array(counts, dtype=np.int64))
+            if os.path.exists(self._path("tail.bin")):
+                os.remove(self._path("tail.bin"))
+            with open(self._path("meta.json"), "w") as f:
+                json.dump({"n_features": N_FEATURES, "n_rows": n_rows, "n_stays": len(starts)}, f)
+            self._load()
+        return n_rows
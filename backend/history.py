@@ -0,0 +1,105 @@
+import io
+
+from sqlalchemy import select
+
+from database import PatientData
+
+# =============================================================================
+# Patient history payloads for GET /patient/{stay_id}
+#
+# History is read as plain tuples of only the requested columns (no ORM
+# objects) and encoded in one of three formats:
+#   rows      [{column: value}, ...], the original shape
+#   columnar  {"hr": [...], "columns": {column: [[start, [values...]], ...]}}
+#             each column is a list of its non-null runs, with start indexing
+#             into "hr"; all-null columns are left out entirely
+#   arrow     Arrow IPC stream of the projected columns (needs pyarrow)
+# =============================================================================
+
+HISTORY_COLUMNS = [c.name for c in PatientData.__table__.columns]
+FORMATS = ("rows", "columnar", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MAX_PAGE = 10_000
+
+
+def parse_fields(fields):
+    """Comma-separated column names -> selected columns, hr first (None = every column)."""
+    if not fields:
+        return HISTORY_COLUMNS
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in HISTORY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ["hr"] + [name for name in dict.fromkeys(names) if name != "hr"]
+
+
+def read_history(db, stay_id, columns, hr_from=None, hr_to=None, cursor=None, limit=None):
+    """
+    Rows of one stay ordered by hr as tuples in `columns` order (hr included).
+    cursor is the last hr of the previous page.
+
+    Returns:
+        (rows, next_cursor), next_cursor is None on the last page
+    """
+    table = PatientData.__table__
+    query = select(*[table.c[name] for name in columns])\
+        .where(table.c.stay_id == stay_id)\
+        .order_by(table.c.hr)
+    if hr_from is not None:
+        query = query.where(table.c.hr >= hr_from)
+    if hr_to is not None:
+        query = query.where(table.c.hr <= hr_to)
+    if cursor is not None:
+        query = query.where(table.c.hr > cursor)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    rows = db.execute(query).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][columns.index("hr")]
+    return rows, next_cursor
+
+
+def rows_payload(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def null_runs(values):
+    """[[start, [values...]], ...] for each run of non-null values."""
+    runs = []
+    current = None
+    for i, value in enumerate(values):
+        if value is None:
+            current = None
+        elif current is None:
+            current = [value]
+            runs.append([i, current])
+        else:
+            current.append(value)
+    return runs
+
+
+def columnar_payload(columns, rows):
+    by_column = dict(zip(columns, zip(*rows))) if rows else {name: () for name in columns}
+    payload = {"hr": list(by_column["hr"]), "columns": {}}
+    for name in columns:
+        if name == "hr":
+            continue
+        runs = null_runs(by_column[name])
+        if runs:
+            payload["columns"][name] = runs
+    return payload
+
+
+def arrow_payload(columns, rows):
+    """Arrow IPC stream bytes of the projected columns."""
+    import pyarrow as pa
+
+    by_column = dict(zip(columns, zip(*rows))) if rows else {name: () for name in columns}
+    table = pa.table({name: pa.array(list(by_column[name])) for name in columns})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,135 @@
+import numpy as np
+
+# =============================================================================
+# Vectorized GRU-D imputation
+#
+# The trained model expects, per feature f and timestep t:
+#   mask[t, f]     = 1 if the value was observed
+#   delta[t, f]    = times[t] - time of the last observation of f (0 if observed)
+#   X_filled[t, f] = observed value, or gamma * X_filled[t-1, f] + (1 - gamma) * mean[f]
+#                    with gamma = exp(-delta[t, f])
+# Before the first observation the "last value" is the global mean and the
+# "last time" is times[0].
+#
+# Because every missing step decays the previous *filled* value towards the
+# mean, a run of missing steps after an observation x_obs collapses to
+#   X_filled[t] = mean + (x_obs - mean) * exp(-sum(delta over the run))
+# which lets us replace the per-feature/per-timestep loop with cumulative
+# array operations over the whole block.
+# =============================================================================
+
+
+def _feature_mean(global_feat_mean, n_features):
+    """Global mean per feature, padded with 0.0 like the original loop."""
+    mean = np.zeros(n_features, dtype=np.float64)
+    n = min(n_features, len(global_feat_mean))
+    mean[:n] = np.asarray(global_feat_mean, dtype=np.float64)[:n]
+    return mean
+
+
+def grud_impute_batch(X, times, global_feat_mean, lengths=None):
+    """
+    GRU-D imputation for a right-padded batch of stays.
+
+    Args:
+        X: [B, T, F] raw feature values with NaN for missing entries
+        times: [B, T] observation time (hr) of every timestep
+        global_feat_mean: [F] fallback mean per feature
+        lengths: optional [B] number of valid timesteps per stay; padded
+            positions come back as zeros in all three outputs
+
+    Returns:
+        X_filled, mask, delta as float32 [B, T, F] arrays
+    """
+    X = np.asarray(X, dtype=np.float32)
+    B, T, F = X.shape
+    times = np.asarray(times, dtype=np.float64).reshape(B, T)
+
+    mask = ~np.isnan(X)
+    if lengths is not None:
+        valid = np.arange(T)[None, :] < np.asarray(lengths)[:, None]  # [B, T]
+        mask &= valid[:, :, None]
+
+    # Index of the last observation at or before t (0 if none yet, which
+    # reproduces last_time = times[0] before the first observation).
+    step_idx = np.arange(T)[None, :, None]
+    last_idx = np.maximum.accumulate(np.where(mask, step_idx, 0), axis=1)  # [B, T, F]
+
+    last_time = np.take_along_axis(times[:, :, None], last_idx, axis=1)
+    delta = (times[:, :, None] - last_time).astype(np.float32)
+    delta[mask] = 0.0
+    if lengths is not None:
+        delta[~valid] = 0.0
+
+    # Total decay applied since the last observation = sum of deltas in the run
+    cum_delta = np.cumsum(delta, axis=1, dtype=np.float64)
+    decay = cum_delta - np.take_along_axis(cum_delta, last_idx, axis=1)
+
+    mean = _feature_mean(global_feat_mean, F)[None, None, :]
+    seen = np.logical_or.accumulate(mask, axis=1)
+    last_val = np.take_along_axis(X, last_idx, axis=1).astype(np.float64)
+    base = np.where(seen, last_val, mean)
+
+    X_filled = mean + (base - mean) * np.exp(-decay)
+    X_filled = np.where(mask, X, X_filled).astype(np.float32)
+
+    if lengths is not None:
+        X_filled[~valid] = 0.0
+
+    return X_filled, mask, delta
+
+
+def grud_impute(X, times, global_feat_mean):
+    """
+    GRU-D imputation for a single stay.
+
+    Args:
+        X: [T, F] raw feature values with NaN for missing entries
+        times: [T] observation time (hr) of every timestep
+        global_feat_mean: [F] fallback mean per feature
+
+    Returns:
+        X_filled, mask, delta as float32 [T, F] arrays
+    """
+    X = np.asarray(X, dtype=np.float32)
+    X_filled, mask, delta = grud_impute_batch(X[None], np.asarray(times)[None], global_feat_mean)
+    return X_filled[0], mask[0], delta[0]
+
+
+def grud_last_state(X_filled, mask, times):
+    """
+    Recurrence state after the last row of a stay, for continuing with grud_step.
+
+    Returns:
+        last_filled [F] (the last filled value, observed or decayed) and
+        last_obs_time [F] (time of the last observation, times[0] if never observed)
+    """
+    T = len(times)
+    seen = mask.any(axis=0)
+    last_idx = np.where(seen, T - 1 - np.argmax(mask[::-1], axis=0), 0)
+    return X_filled[-1].astype(np.float64), np.asarray(times, dtype=np.float64)[last_idx]
+
+
+def grud_step(x, time, last_filled, last_obs_time, global_feat_mean):
+    """
+    Advance the GRU-D imputation by a single timestep.
+
+    Args:
+        x: [F] raw values at this timestep (NaN = missing)
+        time: hr of this timestep
+        last_filled, last_obs_time: state from grud_last_state or a previous step.
+            For the first row of a stay use the global mean and the row's own time.
+
+    Returns:
+        (x_filled, mask, delta) for this row and the updated (last_filled, last_obs_time)
+    """
+    x = np.asarray(x, dtype=np.float32)
+    mean = _feature_mean(global_feat_mean, len(x))
+    mask = ~np.isnan(x)
+
+    delta = np.where(mask, 0.0, time - last_obs_time).astype(np.float32)
+    gamma = np.exp(-delta.astype(np.float64))
+    x_filled = np.where(mask, x, gamma * last_filled + (1 - gamma) * mean).astype(np.float32)
+
+    last_obs_time = np.where(mask, time, last_obs_time)
+    return (x_filled, mask, delta), (x_filled.astype(np.float64), last_obs_time)
@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import torch
+
+from imputation import grud_impute, grud_last_state, grud_step
+
+# =============================================================================
+# Incremental per-stay inference
+#
+# A full prediction re-imputes and re-runs the GRU over every hour since
+# admission. The GRU-D recurrence only depends on the previous step, so we
+# keep, per stay:
+#   - last filled value / last observation time per feature (imputation state)
+#   - the GRU hidden state
+#   - the per-step projections z fed to the Transformer
+# A new hour then costs one imputation step and one GRU step; only the
+# Transformer + attention pooling is recomputed, over the cached z window.
+# =============================================================================
+
+
+class StayState:
+    """Recurrence state for one stay."""
+
+    def __init__(self, max_context=None):
+        self.last_hr = None
+        self.n_rows = 0
+        self.last_filled = None
+        self.last_obs_time = None
+        self.hidden = None
+        self.z = deque(maxlen=max_context)  # [d_model] tensors
+        self.time_mask = deque(maxlen=max_context)  # bool per step
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """Forget the folded history (before a full reload). The caller holds the lock."""
+        self.last_hr = None
+        self.n_rows = 0
+        self.last_filled = None
+        self.last_obs_time = None
+        self.hidden = None
+        self.z.clear()
+        self.time_mask.clear()
+
+
+class IncrementalEngine:
+    """
+    Per-stay incremental inference on top of a ModelWrapper.
+
+    Args:
+        wrapper: the loaded ModelWrapper
+        max_stays: LRU bound on cached stays
+        idle_seconds: stays not touched for this long are evicted
+        max_context: number of recent steps the Transformer attends over.
+            None keeps the whole stay, which matches a full recompute exactly;
+            a bound makes the attention stage O(1) as well.
+    """
+
+    def __init__(self, wrapper, max_stays=1024, idle_seconds=6 * 3600, max_context=None):
+        self.wrapper = wrapper
+        self.max_stays = max_stays
+        self.idle_seconds = idle_seconds
+        self.max_context = max_context
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def get_state(self, stay_id):
+        with self._lock:
+            return self._states.get(stay_id)
+
+    def last_hr(self, stay_id):
+        """Last hr folded into the cached state, or None if the stay is not cached."""
+        state = self.get_state(stay_id)
+        return state.last_hr if state else None
+
+    def n_rows(self, stay_id):
+        state = self.get_state(stay_id)
+        return state.n_rows if state else 0
+
+    def evict(self, stay_id):
+        """Drop the cached state of a stay (e.g. on discharge). Returns True if it was cached."""
+        with self._lock:
+            return self._states.pop(stay_id, None) is not None
+
+    def evict_idle(self):
+        """Evict stays idle for longer than idle_seconds. Returns the number evicted."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [sid for sid, st in self._states.items() if st.last_used < cutoff]
+            for sid in idle:
+                del self._states[sid]
+        return len(idle)
+
+    def _state_for(self, stay_id, reset=False):
+        with self._lock:
+            state = None if reset else self._states.get(stay_id)
+            if state is None:
+                state = StayState(self.max_context)
+                self._states[stay_id] = state
+            self._states.move_to_end(stay_id)
+            while len(self._states) > self.max_stays:
+                self._states.popitem(last=False)
+        return state
+
+    def update(self, stay_id, records, reset=False):
+        """
+        Fold new hourly records (ordered by hr) into the stay state. Records not
+        newer than the state's last_hr are skipped, so the same rows are never
+        folded twice. With reset=True (or an uncached stay) the records must be
+        the full history.
+        """
+        if self.get_state(stay_id) is None:
+            self.evict_idle()
+        state = self._state_for(stay_id, reset=reset)
+        with state.lock:
+            self._fold(state, records)
+        return state
+
+    def sync(self, stay_id, fetch_rows, count_rows):
+        """
+        Bring the cached state of a stay up to date with the database, as one
+        step under the stay lock: concurrent requests for the same stay never
+        fold the same rows twice or act on a row count read before another
+        request's fold.
+
+        Args:
+            fetch_rows: fetch_rows(after_hr) -> records with hr > after_hr ordered
+                by hr (after_hr=None: the whole stay)
+            count_rows: count_rows() -> number of stored rows of the stay
+        Returns:
+            The state, or None (and nothing cached) when the stay has no rows.
+            The state is rebuilt from the full history when the row count shows
+            it is out of sync (e.g. rows inserted out of order).
+        """
+        state = self._state_for_sync(stay_id)
+        with state.lock:
+            return self._sync(state, stay_id, fetch_rows, count_rows)
+
+    def sync_predict(self, stay_id, fetch_rows, count_rows, window_id=0, all_horizons=False):
+        """
+        sync() and score the synced state under the same stay lock, so the
+        result covers exactly the rows counted, even if the LRU evicts the stay
+        meanwhile. Returns None when the stay has no rows.
+        """
+        state = self._state_for_sync(stay_id)
+        with state.lock:
+            if self._sync(state, stay_id, fetch_rows, count_rows) is None:
+                return None
+            pooled = self._attend(state)
+        return self.wrapper.score_pooled(pooled, [window_id], all_horizons)[0]
+
+    def _state_for_sync(self, stay_id):
+        if self.get_state(stay_id) is None:
+            self.evict_idle()
+        return self._state_for(stay_id)
+
+    def _sync(self, state, stay_id, fetch_rows, count_rows):
+        """Body of sync(). The caller holds state.lock."""
+        total = count_rows()
+        if not total:
+            self.evict(stay_id)
+            return None
+        if state.hidden is not None:
+            new_records = fetch_rows(state.last_hr)
+            if state.n_rows + len(new_records) == total:
+                self._fold(state, new_records)
+                return state
+        state.clear()
+        self._fold(state, fetch_rows(None))
+        return state
+
+    def _fold(self, state, records):
+        """Impute + GRU-step records into the state. The caller holds state.lock."""
+        if state.last_hr is not None:
+            records = [r for r in records if r.get("hr") is None or r["hr"] > state.last_hr]
+        X_seq, times = self.wrapper.records_to_array(records)
+        if X_seq is None:
+            return
+
+        with torch.no_grad():
+            if state.hidden is None:
+                # First load: impute the whole history at once
+                X_filled, mask, delta = grud_impute(X_seq, times, self.wrapper.global_feat_mean)
+                state.last_filled, state.last_obs_time = grud_last_state(X_filled, mask, times)
+            else:
+                rows = []
+                for x, t in zip(X_seq, times):
+                    step, (state.last_filled, state.last_obs_time) = grud_step(
+                        x, t, state.last_filled, state.last_obs_time, self.wrapper.global_feat_mean
+                    )
+                    rows.append(step)
+                X_filled, mask, delta = (np.stack(col) for col in zip(*rows))
+
+            X = torch.tensor(self.wrapper.scale_features(X_filled), dtype=torch.float32).unsqueeze(0)
+            mask_t = torch.tensor(mask.astype(float), dtype=torch.float32).unsqueeze(0)
+            delta_t = torch.tensor(delta, dtype=torch.float32).unsqueeze(0)
+
+            with self.wrapper.autocast():
+                z, state.hidden = self.wrapper.model.recurrent(
+                    X.to(self.wrapper.device), mask_t.to(self.wrapper.device),
+                    delta_t.to(self.wrapper.device), state.hidden
+                )
+            state.z.extend(z[0])
+            state.time_mask.extend((mask_t[0].sum(dim=-1) > 0).tolist())
+            state.last_hr = times[-1]
+            state.n_rows += len(times)
+            state.last_used = time.monotonic()
+
+    def predict(self, stay_id, window_id=0, all_horizons=False):
+        """Score the cached state of a stay. Returns None if the stay is not cached."""
+        state = self.get_state(stay_id)
+        if state is None:
+            return None
+        with state.lock:
+            pooled = self._attend(state)
+        if pooled is None:
+            return None
+        return self.wrapper.score_pooled(pooled, [window_id], all_horizons)[0]
+
+    def _attend(self, state):
+        """Pooled encoding [1, d_model] of the folded steps (None if empty). The caller holds state.lock."""
+        if not state.z:
+            return None
+        with torch.no_grad():
+            z = torch.stack(list(state.z)).unsqueeze(0)
+            time_mask = torch.tensor([list(state.time_mask)], dtype=torch.bool, device=z.device)
+            with self.wrapper.autocast():
+                pooled = self.wrapper.model.attend(z, time_mask).float()
+        state.last_used = time.monotonic()
+        return pooled
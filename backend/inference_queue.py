@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# =============================================================================
+# Dynamic micro-batching
+#
+# Handlers await submit() instead of running a forward pass themselves. A
+# collector task on the event loop gathers requests that arrive within
+# max_wait_ms (up to max_batch) and hands them to one dedicated inference
+# thread as a single padded predict_arrays() call. While that batch runs, new
+# requests queue up and form the next batch, so batches grow with load and a
+# lone request waits at most max_wait_ms.
+# =============================================================================
+
+
+class InferenceQueue:
+    """
+    Single-threaded inference worker fed by an asyncio queue.
+
+    Args:
+        get_model: callable returning the current ModelWrapper (or None)
+        max_batch: most stays per forward pass
+        max_wait_ms: how long the first request of a batch waits for company
+    """
+
+    def __init__(self, get_model, max_batch=32, max_wait_ms=5.0):
+        self.get_model = get_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        # One thread owns all torch work, so requests never compete for intra-op threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_worker(self):
+        """Start the collector on the running event loop (again, if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._collect())
+
+    async def submit(self, X_seq, times, window_id=0, all_horizons=False, model=None):
+        """
+        Score one stay (arrays as from ModelWrapper.records_to_array) in the next batch.
+        model pins the ModelWrapper to use (default: get_model() when the batch runs),
+        so a request keeps the version it started with across a model swap.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(((X_seq, times, window_id), all_horizons, model, future))
+        return await future
+
+    async def run(self, fn, *args):
+        """Run an arbitrary model call (e.g. a ready-made batch) on the inference thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Take whatever is already queued without waiting
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - self._loop.time()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _collect(self):
+        while True:
+            batch = await self._next_batch()
+            current = self.get_model()
+            # predict_arrays takes one model and one all_horizons flag per call
+            groups = {}
+            for item, all_horizons, model, future in batch:
+                if not future.cancelled():
+                    groups.setdefault((model or current, all_horizons), []).append((item, future))
+
+            for (model, all_horizons), entries in groups.items():
+                try:
+                    if model is None:
+                        raise RuntimeError("Model not loaded")
+                    started = time.perf_counter()
+                    results = await self.run(model.predict_arrays, [item for item, _ in entries], all_horizons)
+                    self._record(len(entries), time.perf_counter() - started)
+                except Exception as e:
+                    for _, future in entries:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(entries, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    def _record(self, size, seconds):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.max_seen = max(self.max_seen, size)
+            self.busy_seconds += seconds
+
+    def stop(self):
+        if self._task is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_seen,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+            }
@@ -0,0 +1,154 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from database import PatientData
+from stats import record_insert
+from stay_index import record_stay_rows
+from stay_latest import NO_FILL, frame_states, latest_row, load_latest, record_latest
+
+# =============================================================================
+# Bulk ingestion for POST /patients/bulk
+#
+# Same row semantics as POST /patient, for many rows of many stays at once:
+# rows without an hr continue the stay's hour count, and missing values are
+# forward-filled from the stay's previous hour. Rows are sorted by
+# (stay_id, hr) and filled with one grouped ffill over the whole batch, seeded
+# with each stay's last row as kept in stay_latest (one keyed query). The
+# stays index, stay_latest and /stats summary get one update per stay, and
+# everything is written in the caller's single transaction. Bulk rows must be
+# newer than what a stay already has.
+# =============================================================================
+
+JSON_LINES_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-lines"}
+PARQUET_TYPES = {"application/vnd.apache.parquet", "application/x-parquet"}
+ARROW_TYPES = {"application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file"}
+
+STAY_VALUE_COLS = ["subject_id", "age", "f0_", "sepsis"]
+
+
+def read_rows(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    Parse an upload into a DataFrame: JSON lines, a JSON array (or {"rows": [...]}),
+    Parquet or Arrow IPC (file or stream). Parquet and Arrow need pyarrow.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in PARQUET_TYPES or body[:4] == b"PAR1":
+        import pyarrow.parquet as pq
+        return pq.read_table(io.BytesIO(body)).to_pandas()
+    if media_type in ARROW_TYPES or body[:6] == b"ARROW1":
+        import pyarrow as pa
+        reader = pa.ipc.open_file if body[:6] == b"ARROW1" else pa.ipc.open_stream
+        return reader(pa.BufferReader(body)).read_all().to_pandas()
+    if media_type in JSON_LINES_TYPES:
+        return pd.DataFrame.from_records([json.loads(line) for line in body.splitlines() if line.strip()])
+    if media_type == "application/json":
+        data = json.loads(body)
+        if isinstance(data, dict):
+            data = data.get("rows")
+        if not isinstance(data, list):
+            raise ValueError('JSON body must be a list of rows or {"rows": [...]}')
+        return pd.DataFrame.from_records(data)
+    raise ValueError(f"Unsupported content type {media_type!r}: use JSON lines, JSON, Parquet or Arrow")
+
+
+def prepare_rows(df: pd.DataFrame, previous: dict) -> pd.DataFrame:
+    """
+    Assign missing hrs, validate, sort by (stay_id, hr) and forward-fill per stay.
+
+    Args:
+        df: uploaded rows (unknown columns are ignored)
+        previous: stay_id -> non-null column values of the stay's last row, including hr
+    Returns:
+        The new rows with every patient_data column except id
+    """
+    db_cols = [c.name for c in PatientData.__table__.columns if c.name != "id"]
+    if "stay_id" not in df.columns or df["stay_id"].isna().any():
+        raise ValueError("stay_id is required on every row")
+    df = df.reindex(columns=db_cols)
+    df["stay_id"] = df["stay_id"].astype(np.int64)
+    df["hr"] = pd.to_numeric(df["hr"], errors="raise").astype("float64")
+
+    last_hr = df["stay_id"].map({stay_id: row["hr"] for stay_id, row in previous.items()}).astype("float64")
+    # Rows without hr continue after the stay's stored and explicitly given hours
+    missing = df["hr"].isna()
+    if missing.any():
+        base = np.fmax(df.groupby("stay_id")["hr"].transform("max"), last_hr).fillna(0)
+        step = df[missing].groupby("stay_id").cumcount() + 1
+        df.loc[missing, "hr"] = base[missing] + step
+
+    stale = df["hr"] <= last_hr
+    if stale.any():
+        keys = df.loc[stale, ["stay_id", "hr"]].head(5).astype(int).values.tolist()
+        raise ValueError(f"Rows must be newer than the stay's last stored hr, got (stay_id, hr) {keys}")
+    duplicated = df.duplicated(["stay_id", "hr"])
+    if duplicated.any():
+        keys = df.loc[duplicated, ["stay_id", "hr"]].head(5).astype(int).values.tolist()
+        raise ValueError(f"Duplicate (stay_id, hr) in upload: {keys}")
+    df["hr"] = df["hr"].astype(np.int64)
+
+    # Seed each stay's fill with its last row, then one grouped ffill
+    seeds = pd.DataFrame.from_records([previous[s] for s in df["stay_id"].unique() if s in previous], columns=db_cols)
+    df["_new"] = True
+    seeds["_new"] = False
+    combined = pd.concat([seeds, df], ignore_index=True).sort_values(["stay_id", "hr"], kind="stable")
+    fill_cols = [c for c in db_cols if c not in NO_FILL]
+    combined[fill_cols] = combined.groupby("stay_id", sort=False)[fill_cols].ffill()
+    return combined[combined["_new"].astype(bool)].drop(columns="_new").reset_index(drop=True)
+
+
+def _to_tuples(df: pd.DataFrame):
+    """Row tuples with native Python values and None for missing."""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def _insert(db, columns, rows):
+    """Raw executemany of row tuples on SQLite (no per-row parameter dicts), Core insert elsewhere."""
+    if db.get_bind().dialect.name == "sqlite":
+        sql = f"INSERT INTO patient_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        db.connection().exec_driver_sql(sql, rows)
+    else:
+        db.execute(PatientData.__table__.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def ingest(db, df: pd.DataFrame):
+    """
+    Insert uploaded rows in the caller's transaction (not committed here).
+
+    Returns:
+        stay_id -> inserted column dicts in hr order
+    """
+    stay_ids = [int(s) for s in pd.unique(df["stay_id"].dropna())] if "stay_id" in df.columns else []
+    latest = load_latest(db, stay_ids) if stay_ids else {}
+    rows = prepare_rows(df, {
+        stay_id: {**latest_row(state), "stay_id": stay_id, "hr": state.hr} for stay_id, state in latest.items()
+    })
+    if rows.empty:
+        return {}
+
+    # One stats and one stays index update per stay (stats first: it reads the old maxima)
+    summary = rows.groupby("stay_id").agg(
+        n_rows=("hr", "size"), first_hr=("hr", "min"), last_hr=("hr", "max"),
+        **{col: (col, "max") for col in STAY_VALUE_COLS}
+    )
+    for stay_id, row in zip(summary.index.tolist(), _to_tuples(summary)):
+        values = dict(zip(summary.columns, row))
+        prev = latest.get(stay_id)
+        record_insert(db, stay_id, prev.values if prev else None, values)
+        record_stay_rows(db, stay_id, values["n_rows"], values["first_hr"], values["last_hr"], values)
+
+    # Columns nobody filled are left to their NULL default instead of bound per row
+    rows = rows.loc[:, rows.notna().any()]
+    columns = list(rows.columns)
+    values = _to_tuples(rows)
+    _insert(db, columns, values)
+    for stay_id, state in frame_states(rows).items():
+        record_latest(db, stay_id, latest.get(stay_id), state)
+
+    records_by_stay = {}
+    for row in values:
+        record = dict(zip(columns, row))
+        records_by_stay.setdefault(record["stay_id"], []).append(record)
+    return records_by_stay
@@ -1,8 +1,13 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
-from api import router
-from model_wrapper import ModelWrapper
+from database import init_db, SessionLocal
+from api import router, WINDOW_MAP, CURSOR_HEADER
+from model_registry import ModelRegistry
+from feature_map import FEATURE_MAP
+from prediction_cache import PredictionCache
+from feature_store import FeatureStore
+from risk_scheduler import RiskScheduler
+from inference_queue import InferenceQueue
 import os
 
 app = FastAPI(title="Sepsis Prediction API", version="1.0.0")
@@ -14,25 +19,139 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by the frontend cross-origin: /patients and the patient history page with it
+    expose_headers=[CURSOR_HEADER],
 )
 
 app.include_router(router)
 
+def configure_model(model):
+    """Inference modes from the environment, applied to every loaded model version."""
+    if model.n_features != FEATURE_MAP.n_features:
+        print(f"WARNING: Feature count mismatch. Model expects {model.n_features}, "
+              f"feature map has {FEATURE_MAP.n_features}.")
+    if os.environ.get("WINDOWED_INFERENCE", "0") == "1":
+        # Last 6/12/24 rows per head, as in training; takes precedence over incremental mode
+        model.enable_windowed()
+        print("Windowed inference enabled")
+    elif os.environ.get("INCREMENTAL_INFERENCE", "0") == "1":
+        max_context = os.environ.get("INCREMENTAL_CONTEXT")
+        model.enable_incremental(
+            max_stays=int(os.environ.get("INCREMENTAL_MAX_STAYS", "1024")),
+            max_context=int(max_context) if max_context else None
+        )
+        print("Incremental inference enabled")
+
+def open_feature_store():
+    """Memory-mapped feature store for model inputs, built if missing (None when FEATURE_STORE_DIR is unset)."""
+    store_dir = os.environ.get("FEATURE_STORE_DIR")
+    if not store_dir:
+        return None
+    store = FeatureStore(store_dir)
+    if not store.built or os.environ.get("FEATURE_STORE_REBUILD", "0") == "1":
+        print(f"Building feature store at {store_dir}...")
+        db = SessionLocal()
+        try:
+            n_rows = store.build(db)
+        finally:
+            db.close()
+        print(f"Feature store built: {n_rows} rows")
+    return store
+
+def load_models():
+    """
+    Create the model registry and load the serving version. Runs once: serve.py
+    calls it in the parent process so forked workers share the loaded weights.
+    """
+    if getattr(app.state, "model_registry", None) is not None:
+        return app.state.model_registry
+    print("Loading Model...")
+    # One model directory or a directory of versioned model directories (see model_registry.py)
+    model_path = os.environ.get("MODEL_PATH", os.path.join(os.path.dirname(__file__), "../new_model"))
+    if not os.path.isabs(model_path):
+        model_path = os.path.join(os.path.dirname(__file__), model_path)
+    app.state.model = None
+    app.state.model_registry = ModelRegistry(
+        model_path,
+        configure=configure_model,
+        # A plain attribute swap: in-flight requests keep the model they already hold
+        on_activate=lambda model: setattr(app.state, "model", model),
+        # Prefers the compiled/ export (python export_model.py) when it is up to date
+        artifact=os.environ.get("MODEL_ARTIFACT", "auto"),
+        runtime=os.environ.get("MODEL_RUNTIME", "eager"),
+        # int8 / bf16 only after validate_precision.py passed on held-out stays
+        precision=os.environ.get("MODEL_PRECISION", "fp32")
+    )
+    try:
+        app.state.model_registry.load()
+        shadow_version = os.environ.get("MODEL_SHADOW_VERSION")
+        if shadow_version:
+            # Synchronous here (no loader thread yet), so it is also safe before a fork
+            app.state.model_registry.load(
+                shadow_version, "shadow", float(os.environ.get("MODEL_SHADOW_FRACTION", "0.1"))
+            )
+    except FileNotFoundError as e:
+        print(f"WARNING: {e}")
+    return app.state.model_registry
+
 @app.on_event("startup")
 def on_startup():
     # Helper: Ensure the cwd is correct for relative paths if needed, 
     # but using absolute based on __file__ is safer.
-    print("Initializing Database...")
-    init_db()
+    # serve.py workers: the parent already migrated and analyzed the database
+    if not getattr(app.state, "db_initialized", False):
+        print("Initializing Database...")
+        init_db()
     
-    print("Loading Model...")
-    model_dir = os.path.join(os.path.dirname(__file__), "../new_model")
-    # Check if model dir exists
-    if os.path.exists(model_dir):
-        app.state.model = ModelWrapper(model_dir)
-    else:
-        print(f"WARNING: Model directory not found at {model_dir}")
-        app.state.model = None
+    app.state.prediction_cache = PredictionCache(
+        max_entries=int(os.environ.get("PREDICTION_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.environ.get("PREDICTION_CACHE_TTL", "300"))
+    )
+    
+    # Per-hour points of GET /predict/{stay_id}/trajectory
+    app.state.trajectory_cache = PredictionCache(
+        max_entries=int(os.environ.get("TRAJECTORY_CACHE_SIZE", "100000")),
+        ttl_seconds=float(os.environ.get("TRAJECTORY_CACHE_TTL", "3600"))
+    )
+    
+    app.state.feature_store = open_feature_store()
+    
+    load_models()
+    
+    # Micro-batching inference worker for the predict endpoints (0 disables)
+    app.state.inference_queue = None
+    max_batch = int(os.environ.get("INFERENCE_MAX_BATCH", "32"))
+    if max_batch > 0:
+        app.state.inference_queue = InferenceQueue(
+            get_model=lambda: app.state.model,
+            max_batch=max_batch,
+            max_wait_ms=float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5"))
+        )
+    
+    # Background ward-wide risk scoring into patient_risk (0 disables)
+    interval = float(os.environ.get("RISK_SCHEDULER_INTERVAL", "300"))
+    app.state.risk_scheduler = None
+    if interval > 0 and app.state.model is not None:
+        app.state.risk_scheduler = RiskScheduler(
+            get_model=lambda: app.state.model,
+            interval_seconds=interval,
+            batch_size=int(os.environ.get("RISK_SCHEDULER_BATCH", "64")),
+            window_id=WINDOW_MAP.get(int(os.environ.get("RISK_WINDOW_HOURS", "6")), 0)
+        )
+        app.state.risk_scheduler.start()
+        print(f"Risk scheduler started (every {interval:.0f}s)")
+
+@app.on_event("shutdown")
+def on_shutdown():
+    scheduler = getattr(app.state, "risk_scheduler", None)
+    if scheduler is not None:
+        scheduler.stop()
+    queue = getattr(app.state, "inference_queue", None)
+    if queue is not None:
+        queue.stop()
+    registry = getattr(app.state, "model_registry", None)
+    if registry is not None:
+        registry.stop()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,282 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_wrapper import ModelWrapper, COMPILED_DIR
+
+# =============================================================================
+# Hot-swappable model versions
+#
+# MODEL_PATH is either one model directory (model_joblib.pkl + scalers and/or
+# compiled/) or a directory of versioned model directories, e.g.
+#   models/2024-05-01/   models/2024-06-12/   ...
+# Versions are loaded on a background thread, warmed with a dummy batch and
+# only then swapped in with a single reference assignment: requests in flight
+# finish on the model they started with, new requests see the new one.
+#
+# A loaded version can instead run as a shadow: a sampled fraction of live
+# predictions is re-scored by it off the request path, and the registry keeps
+# its latency next to the active model's plus the output differences.
+# =============================================================================
+
+SHADOW_MAX_PENDING = 64
+SHADOW_LATENCY_SAMPLES = 10_000
+WARMUP_LENGTHS = (1, 24)
+
+
+def is_model_dir(path):
+    return os.path.exists(os.path.join(path, "model_joblib.pkl")) or \
+        os.path.exists(os.path.join(path, COMPILED_DIR, "manifest.json"))
+
+
+def warmup(model):
+    """One dummy batch through every head (and the all-horizons path) before taking traffic."""
+    rng = np.random.default_rng(0)
+    items = []
+    for window_id in range(3):
+        for T in WARMUP_LENGTHS:
+            X = rng.normal(size=(T, model.n_features)).astype(np.float32)
+            X[rng.random(X.shape) < 0.7] = np.nan
+            items.append((X, np.arange(T, dtype=np.float64) - 1, window_id))
+    started = time.perf_counter()
+    model.predict_arrays(items)
+    model.predict_arrays(items[:1], True)
+    return time.perf_counter() - started
+
+
+class ShadowStats:
+    """Latency of both models and |active - shadow| per output over the shadowed predictions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.scored = 0
+        self.dropped = 0
+        self.errors = 0
+        self.active_ms = deque(maxlen=SHADOW_LATENCY_SAMPLES)
+        self.shadow_ms = deque(maxlen=SHADOW_LATENCY_SAMPLES)
+        self.diff_sum = {}
+        self.diff_max = {}
+
+    def record(self, active_seconds, shadow_seconds, active, shadow):
+        with self._lock:
+            self.scored += 1
+            self.active_ms.append(active_seconds * 1000)
+            self.shadow_ms.append(shadow_seconds * 1000)
+            for key, value in active.items():
+                if isinstance(value, (int, float)) and key in shadow:
+                    diff = abs(value - shadow[key])
+                    self.diff_sum[key] = self.diff_sum.get(key, 0.0) + diff
+                    self.diff_max[key] = max(self.diff_max.get(key, 0.0), diff)
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        def latency(values):
+            if not values:
+                return None
+            p50, p99 = np.percentile(values, [50, 99])
+            return {"p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3)}
+
+        with self._lock:
+            return {
+                "scored": self.scored,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "active_latency": latency(self.active_ms),
+                "shadow_latency": latency(self.shadow_ms),
+                "mean_abs_diff": {k: round(v / self.scored, 6) for k, v in self.diff_sum.items()},
+                "max_abs_diff": {k: round(v, 6) for k, v in self.diff_max.items()},
+            }
+
+
+class ModelRegistry:
+    """
+    Active model version plus an optional shadow candidate.
+
+    Args:
+        path: one model directory, or a directory of versioned model directories
+        configure: called with every loaded ModelWrapper before warmup (inference modes)
+        on_activate: called with the new active model right after a swap
+        artifact, runtime, precision: passed to ModelWrapper
+    """
+
+    def __init__(self, path, configure=None, on_activate=None, artifact="auto", runtime="eager", precision="fp32"):
+        self.path = path
+        self.configure = configure
+        self.on_activate = on_activate
+        self.artifact = artifact
+        self.runtime = runtime
+        self.precision = precision
+        self._lock = threading.Lock()
+        self.active = None
+        self.active_name = None
+        self.shadow = None
+        self.shadow_name = None
+        self.shadow_fraction = 0.0
+        self.shadow_stats = None
+        self.loading = {}
+        self.last_error = None
+        # Background loads and shadow scoring never run on a request thread
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_pending = 0
+
+    # --- Versions on disk ---
+
+    def versions(self):
+        """Version name -> model directory, oldest first (by directory mtime)."""
+        if is_model_dir(self.path):
+            return {os.path.basename(os.path.normpath(self.path)): self.path}
+        if not os.path.isdir(self.path):
+            return {}
+        dirs = [os.path.join(self.path, name) for name in os.listdir(self.path)]
+        dirs = [d for d in dirs if os.path.isdir(d) and is_model_dir(d)]
+        dirs.sort(key=lambda d: (os.path.getmtime(d), os.path.basename(d)))
+        return {os.path.basename(d): d for d in dirs}
+
+    def default_version(self):
+        """MODEL_VERSION if set, else the newest version directory."""
+        versions = self.versions()
+        wanted = os.environ.get("MODEL_VERSION")
+        if wanted:
+            return wanted if wanted in versions else None
+        return next(reversed(versions), None)
+
+    # --- Loading and swapping ---
+
+    def _load(self, name):
+        directory = self.versions().get(name)
+        if directory is None:
+            raise FileNotFoundError(f"Unknown model version {name!r} under {self.path}")
+        model = ModelWrapper(directory, artifact=self.artifact, runtime=self.runtime, precision=self.precision)
+        if self.configure is not None:
+            self.configure(model)
+        print(f"Model {name} ({model.version}) warmed up in {warmup(model) * 1000:.0f}ms")
+        return model
+
+    def _activate(self, name, model):
+        with self._lock:
+            self.active, self.active_name = model, name
+            if self.shadow_name == name:
+                self.shadow, self.shadow_name, self.shadow_fraction = None, None, 0.0
+        if self.on_activate is not None:
+            self.on_activate(model)
+        print(f"Active model is now {name} ({model.version})")
+
+    def _set_shadow(self, name, model, fraction):
+        with self._lock:
+            self.shadow, self.shadow_name = model, name
+            self.shadow_fraction = fraction
+            self.shadow_stats = ShadowStats()
+
+    def load(self, name=None, role="active", fraction=0.1):
+        """Load a version synchronously (startup) as the active model or the shadow."""
+        name = name or self.default_version()
+        if name is None:
+            raise FileNotFoundError(f"No model versions under {self.path}")
+        model = self._load(name)
+        if role == "shadow":
+            self._set_shadow(name, model, fraction)
+        else:
+            self._activate(name, model)
+        return model
+
+    def load_async(self, name, role="active", fraction=0.1):
+        """Start loading a version in the background; returns False if it is already loading."""
+        with self._lock:
+            if name in self.loading:
+                return False
+            self.loading[name] = role
+
+        def run():
+            try:
+                self.load(name, role, fraction)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{name}: {e}"
+                print(f"Model load failed: {self.last_error}")
+            finally:
+                with self._lock:
+                    self.loading.pop(name, None)
+
+        self._loader.submit(run)
+        return True
+
+    def promote_shadow(self):
+        """Make the shadow the active model (no reload). Returns False without a shadow."""
+        with self._lock:
+            name, model = self.shadow_name, self.shadow
+        if model is None:
+            return False
+        self._activate(name, model)
+        return True
+
+    def clear_shadow(self):
+        with self._lock:
+            self.shadow, self.shadow_name, self.shadow_fraction = None, None, 0.0
+
+    # --- Shadow scoring ---
+
+    def maybe_shadow(self, model, items, all_horizons, results):
+        """
+        Re-score a sampled fraction of live predictions with the shadow model in
+        the background. items/results are one predict_arrays() call of the active
+        model and the results it served. Both models are timed on the shadow
+        thread so their latencies are comparable (queue waits excluded).
+        """
+        with self._lock:
+            shadow, fraction, stats = self.shadow, self.shadow_fraction, self.shadow_stats
+            if shadow is None or shadow is model or random.random() >= fraction:
+                return
+            dropped = self._shadow_pending >= SHADOW_MAX_PENDING
+            if not dropped:
+                self._shadow_pending += 1
+        if dropped:
+            stats.count("dropped")
+            return
+
+        def run():
+            try:
+                started = time.perf_counter()
+                model.predict_arrays(items, all_horizons)
+                active_seconds = time.perf_counter() - started
+                started = time.perf_counter()
+                shadow_results = shadow.predict_arrays(items, all_horizons)
+                shadow_seconds = time.perf_counter() - started
+                # Per-stay latency, comparable across batch sizes
+                for active, candidate in zip(results, shadow_results):
+                    stats.record(active_seconds / len(items), shadow_seconds / len(items), active, candidate)
+            except Exception:
+                stats.count("errors")
+            finally:
+                with self._lock:
+                    self._shadow_pending -= 1
+
+        self._shadow_executor.submit(run)
+
+    def status(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "versions": list(self.versions()),
+                "active": {"name": self.active_name, "version": self.active.version} if self.active else None,
+                "shadow": {
+                    "name": self.shadow_name,
+                    "version": self.shadow.version,
+                    "fraction": self.shadow_fraction,
+                    **self.shadow_stats.snapshot(),
+                } if self.shadow else None,
+                "loading": dict(self.loading),
+                "last_error": self.last_error,
+            }
+
+    def stop(self):
+        self._loader.shutdown(wait=False)
+        self._shadow_executor.shutdown(wait=False)
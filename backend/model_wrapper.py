@@ -3,7 +3,13 @@ import torch.nn as nn
 import numpy as np
 import pandas as pd
 import joblib
+import json
 import os
+import time
+from contextlib import nullcontext
+
+from imputation import grud_impute_batch
+from incremental import IncrementalEngine
 
 # =============================================================================
 # EXACT 121 features expected by the model (ALPHABETICALLY SORTED)
@@ -38,6 +44,16 @@ MODEL_INPUT_FEATURES = [
     'wbc_max', 'wbc_min', 'weight'
 ]
 
+# Window sizes (hours) of the 3 heads, indexed by window_id
+WINDOW_HOURS = (6, 12, 24)
+
+# Inference precision modes (see ModelWrapper.set_precision)
+PRECISIONS = ("fp32", "int8", "bf16")
+# Submodules quantized in int8 mode: the GRU, to_dmodel and each Transformer
+# layer's feed-forward Linears. Attention projections and the window heads stay
+# fp32 because MultiheadAttention and apply_heads use their weight tensors directly.
+INT8_FEED_FORWARD = ("linear1", "linear2")
+
 # --- Model Definitions (Copied from Notebook) ---
 
 class TemporalAttnPool(nn.Module):
@@ -83,35 +99,288 @@ class GRUDTransformer(nn.Module):
         self.bin_heads = nn.ModuleList([nn.Linear(d_model, bin_dim) for _ in range(3)])
         self.heads = nn.ModuleList(list(self.reg_heads) + list(self.bin_heads))
 
-    def forward(self, x, mask, delta, window_id=None):
+    def recurrent(self, x, mask, delta, h0=None):
+        """GRU stage. Returns per-step projections z [B, T, d_model] and the final hidden state."""
         inp = torch.cat([x, mask, delta], dim=-1)
-        h, _ = self.gru(inp)
+        h, h_n = self.gru(inp, h0)
         z = self.to_dmodel(h)
+        return z, h_n
 
-        time_mask = mask.sum(dim=-1) > 0
+    def attend(self, z, time_mask):
+        """Transformer + attention pooling over z [B, T, d_model]. Returns [B, d_model]."""
         z = self.transformer(z, src_key_padding_mask=~time_mask)
         pooled = self.attn_pool(z, padding_mask=time_mask)
+        return pooled
+
+    def encode(self, x, mask, delta):
+        """Shared GRU -> Transformer -> attention pooling stage. Returns [B, d_model]."""
+        z, _ = self.recurrent(x, mask, delta)
+        time_mask = mask.sum(dim=-1) > 0
+        return self.attend(z, time_mask)
+
+    def apply_heads(self, pooled, window_id):
+        """
+        Apply the window head selected per sample in one batched op.
+        Head weights are stacked to [3, out, d_model] and gathered by window_id,
+        so the state_dict layout (reg_heads.*, bin_heads.*) stays unchanged.
+        """
+        W_reg = torch.stack([head.weight for head in self.reg_heads])
+        b_reg = torch.stack([head.bias for head in self.reg_heads])
+        W_bin = torch.stack([head.weight for head in self.bin_heads])
+        b_bin = torch.stack([head.bias for head in self.bin_heads])
+
+        y_reg_out = torch.einsum("bd,bod->bo", pooled, W_reg[window_id]) + b_reg[window_id]
+        y_bin_out = torch.einsum("bd,bod->bo", pooled, W_bin[window_id]) + b_bin[window_id]
+        return y_reg_out, y_bin_out
+
+    def apply_all_heads(self, pooled):
+        """All window heads at once: returns y_reg [B, 3, reg_dim] and y_bin [B, 3, bin_dim]."""
+        W_reg = torch.stack([head.weight for head in self.reg_heads])
+        b_reg = torch.stack([head.bias for head in self.reg_heads])
+        W_bin = torch.stack([head.weight for head in self.bin_heads])
+        b_bin = torch.stack([head.bias for head in self.bin_heads])
+
+        y_reg_out = torch.einsum("bd,hod->bho", pooled, W_reg) + b_reg
+        y_bin_out = torch.einsum("bd,hod->bho", pooled, W_bin) + b_bin
+        return y_reg_out, y_bin_out
+
+    def forward(self, x, mask, delta, window_id=None):
+        pooled = self.encode(x, mask, delta)
 
         # For inference, use window_id=0 (6-hour window) by default
         if window_id is None:
             window_id = torch.zeros(x.size(0), dtype=torch.long, device=x.device)
 
-        y_reg_out = torch.zeros(x.size(0), self.reg_heads[0].out_features, device=x.device)
-        y_bin_out = torch.zeros(x.size(0), self.bin_heads[0].out_features, device=x.device)
+        return self.apply_heads(pooled, window_id)
 
-        for i, w_id in enumerate(window_id):
-            y_reg_out[i] = self.reg_heads[w_id](pooled[i])
-            y_bin_out[i] = self.bin_heads[w_id](pooled[i])
 
-        return y_reg_out, y_bin_out
+# --- Record conversion ---
+
+# Never model inputs, even when present on a record
+TARGET_COLS = [
+    "respiration", "coagulation", "liver", "cardiovascular",
+    "cns", "renal", "hours_beforesepsis", "sepsis",
+    "fod", "hours_beforedeath"
+]
+
+def records_to_matrix(records: list):
+    """
+    Convert patient records (dicts) to the raw [T, F] feature matrix in
+    MODEL_INPUT_FEATURES order (NaN = missing) plus the [T] hr timeline.
+    """
+    if not records:
+        return None, None
+        
+    df = pd.DataFrame(records)
+    
+    # Map gender (f0_) to numeric
+    if 'f0_' in df.columns:
+        df['gender'] = df['f0_'].map({'M': 0, 'F': 1, 'Male': 0, 'Female': 1})
+        df['gender'] = df['gender'].fillna(0)
+    elif 'gender' not in df.columns:
+        df['gender'] = np.nan
+        
+    # Add missing columns
+    if 'weight' not in df.columns:
+        df['weight'] = np.nan
+        
+    # Nullify target columns (prevent data leakage)
+    for col in TARGET_COLS:
+        if col in df.columns:
+            df[col] = np.nan
+    
+    # Ensure all required features exist
+    for col in MODEL_INPUT_FEATURES:
+        if col not in df.columns:
+            df[col] = np.nan
+            
+    X_df = df[MODEL_INPUT_FEATURES]
+    X_seq = X_df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+    
+    T = X_seq.shape[0]
+    
+    # Get time column (hr) for delta calculation
+    if 'hr' in df.columns:
+        times = df['hr'].values.astype(float)
+    else:
+        times = np.arange(T, dtype=float)
+        
+    return X_seq, times
 
 
 # --- Wrapper Class ---
 
+# Architecture hyperparameters shared by training, the pickle loader and the compiled artifact
+ARCHITECTURE = dict(hidden_size=64, d_model=128, nhead=4, num_layers=2)
+
+# Sub-directory of a model dir holding the export_model.py artifact
+COMPILED_DIR = "compiled"
+
+
+class ArrayScaler:
+    """StandardScaler stand-in rebuilt from exported mean_/scale_ arrays (no sklearn import)."""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (X - self.mean_) / self.scale_
+
+    def inverse_transform(self, X):
+        return X * self.scale_ + self.mean_
+
+
+def read_flat(path, table, dtype):
+    """
+    Arrays described by a manifest table ({name, shape, offset}) from one flat file.
+    The file is memory-mapped copy-on-write, so the returned arrays share pages
+    with the OS cache (and with forked workers) until written.
+    """
+    flat = np.memmap(path, dtype=dtype, mode="c")
+    itemsize = np.dtype(dtype).itemsize
+    arrays = {}
+    for entry in table:
+        start = entry["offset"] // itemsize
+        size = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[entry["name"]] = flat[start:start + size].reshape(entry["shape"])
+    return arrays
+
+
 class ModelWrapper:
-    def __init__(self, model_dir):
+    def __init__(self, model_dir, artifact="auto", runtime="eager", precision="fp32"):
+        """
+        Args:
+            model_dir: directory with model_joblib.pkl + scalers (and optionally compiled/)
+            artifact: "auto" prefers an up-to-date compiled/ export, "pickle" or "compiled" force one
+            runtime: "eager" or "torchscript" (traced encoder from the compiled artifact)
+            precision: "fp32", "int8" (dynamic quantization) or "bf16" (autocast), see set_precision
+        """
         self.device = torch.device("cpu")
         print(f"Loading model artifacts from {model_dir}...")
+        started = time.perf_counter()
+        
+        self.reg_dim = 8  # respiration, coagulation, liver, cardiovascular, cns, renal, hours_beforesepsis, hours_beforedeath
+        self.bin_dim = 1  # sepsis (binary)
+        # Traced GRU -> Transformer -> pooling graph, used instead of model.encode when set
+        self.encoder = None
+        
+        # Version tag (artifact directory + weights mtime), used in cache keys
+        model_path = os.path.join(model_dir, "model_joblib.pkl")
+        model_mtime = int(os.path.getmtime(model_path)) if os.path.exists(model_path) else 0
+        self.version = f"{os.path.basename(os.path.normpath(model_dir))}-{model_mtime}"
+        
+        compiled_dir = os.path.join(model_dir, COMPILED_DIR)
+        manifest = None
+        if artifact != "pickle" and os.path.exists(os.path.join(compiled_dir, "manifest.json")):
+            with open(os.path.join(compiled_dir, "manifest.json")) as f:
+                manifest = json.load(f)
+            if artifact == "auto" and model_mtime and manifest["source_version"] != self.version:
+                print("Compiled artifact is older than model_joblib.pkl; run export_model.py again. Using the pickle.")
+                manifest = None
+        elif artifact == "compiled":
+            raise FileNotFoundError(f"No compiled artifact in {compiled_dir}; run export_model.py first")
+        
+        if manifest is not None:
+            self._load_compiled(compiled_dir, manifest, runtime)
+        else:
+            self._load_pickle(model_dir, model_path)
+        self.load_seconds = time.perf_counter() - started
+        print(f"Model loaded from {self.artifact} artifact in {self.load_seconds:.2f}s")
+        
+        self.model.to(self.device)
+        self.model.eval()
+        self.precision = "fp32"
+        self.set_precision(precision)
+        
+        # Output columns - regression outputs (scaled)
+        self.regression_cols = [
+            "respiration", "coagulation", "liver", "cardiovascular",
+            "cns", "renal", "hours_beforesepsis", "hours_beforedeath"
+        ]
+        # Binary output (logit -> sigmoid)
+        self.binary_cols = ["sepsis"]
+
+        # Per-stay incremental inference (see enable_incremental)
+        self.incremental = None
+        # Last-w-rows inference per head (see enable_windowed)
+        self.windowed = False
+
+    def set_precision(self, precision):
+        """
+        Select the inference precision (once, from fp32):
+          fp32  the trained weights as they are
+          int8  GRU, to_dmodel and Transformer Linear layers dynamically quantized
+                (int8 weights, activations quantized per batch)
+          bf16  encoder run under CPU bf16 autocast (the notebook trained under
+                bf16 autocast); pooled encodings go back to fp32 for the heads
+        The precision is appended to the version tag, so cached and stored
+        predictions of different modes never mix. validate_precision.py measures
+        the drift against fp32.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+        if precision == self.precision:
+            return
+        if self.precision != "fp32":
+            raise ValueError(f"Precision is already {self.precision}; load the model again to change it")
+        if self.encoder is not None:
+            # The traced graph is fp32; precision modes apply to the eager modules
+            print(f"{precision} precision uses the eager encoder instead of the TorchScript trace")
+            self.encoder = None
+        if precision == "int8":
+            from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+            targets = ["gru", "to_dmodel"] + [
+                f"transformer.layers.{i}.{name}"
+                for i in range(len(self.model.transformer.layers)) for name in INT8_FEED_FORWARD
+            ]
+            quantize_dynamic(self.model, {name: default_dynamic_qconfig for name in targets},
+                             dtype=torch.qint8, inplace=True)
+        # The fused fp32 Transformer fast path takes neither quantized Linears nor
+        # bf16 activations (CPU autocast does not switch it off); these flags only
+        # gate that path, the layers compute the same function without it
+        self.model.transformer.use_nested_tensor = False
+        for layer in self.model.transformer.layers:
+            layer.activation_relu_or_gelu = 0
+        self.precision = precision
+        self.version = f"{self.version}-{precision}"
+
+    def autocast(self):
+        """Context for encoder calls: bf16 autocast in bf16 mode, nothing otherwise."""
+        if self.precision == "bf16":
+            return torch.autocast("cpu", dtype=torch.bfloat16)
+        return nullcontext()
+
+    def encode(self, X, mask, delta):
+        """Pooled encodings [B, d_model] (fp32) of preprocessed tensors, in the selected precision."""
+        encode = self.encoder if self.encoder is not None else self.model.encode
+        with self.autocast():
+            pooled = encode(X.to(self.device), mask.to(self.device), delta.to(self.device))
+        return pooled.float()
+
+    def _load_compiled(self, compiled_dir, manifest, runtime):
+        """Flat float32 weights + scaler arrays written by export_model.py: no unpickling, no sklearn."""
+        self.artifact = "compiled"
+        self.version = manifest["source_version"]
+        
+        scalers = read_flat(os.path.join(compiled_dir, "scalers.f64"), manifest["scalers"], np.float64)
+        self.scaler_X = ArrayScaler(scalers["scaler_X.mean_"], scalers["scaler_X.scale_"])
+        self.scaler_y_reg = ArrayScaler(scalers["scaler_y_reg.mean_"], scalers["scaler_y_reg.scale_"])
+        self.global_feat_mean = np.asarray(scalers["global_feat_mean"])
+        self.n_features = manifest["n_features"]
+        
+        self.model = GRUDTransformer(
+            n_features=self.n_features, reg_dim=self.reg_dim, bin_dim=self.bin_dim, **manifest["architecture"]
+        )
+        weights = read_flat(os.path.join(compiled_dir, "weights.f32"), manifest["tensors"], np.float32)
+        # assign=True adopts the memory-mapped arrays instead of copying them into fresh parameters
+        self.model.load_state_dict({name: torch.from_numpy(arr) for name, arr in weights.items()}, assign=True)
+        
+        if runtime == "torchscript":
+            self.encoder = torch.jit.load(os.path.join(compiled_dir, manifest["encoder"]), map_location="cpu").eval()
+
+    def _load_pickle(self, model_dir, model_path):
+        self.artifact = "pickle"
         
         # Load scalers and global mean from new model files
         self.scaler_X = joblib.load(os.path.join(model_dir, "scaler_X.pkl"))
@@ -120,24 +389,18 @@ class ModelWrapper:
         
         # Model parameters
         self.n_features = self.scaler_X.mean_.shape[0] if hasattr(self.scaler_X, "mean_") else 121
-        self.reg_dim = 8  # respiration, coagulation, liver, cardiovascular, cns, renal, hours_beforesepsis, hours_beforedeath
-        self.bin_dim = 1  # sepsis (binary)
         
         print(f"Initializing model with n_features={self.n_features}, reg_dim={self.reg_dim}, bin_dim={self.bin_dim}")
         
         # Initialize model architecture
         self.model = GRUDTransformer(
             n_features=self.n_features,
-            hidden_size=64,
-            d_model=128,
-            nhead=4,
-            num_layers=2,
             reg_dim=self.reg_dim,
-            bin_dim=self.bin_dim
+            bin_dim=self.bin_dim,
+            **ARCHITECTURE
         )
         
         # Load model weights - try different formats
-        model_path = os.path.join(model_dir, "model_joblib.pkl")
         weights_loaded = False
         
         # Custom unpickler to handle CUDA tensors on CPU-only machines
@@ -180,169 +443,326 @@ class ModelWrapper:
                 weights_loaded = True
             except Exception as e:
                 print(f"torch.load failed: {e}")
-             
-        self.model.to(self.device)
-        self.model.eval()
 
-        # Output columns - regression outputs (scaled)
-        self.regression_cols = [
-            "respiration", "coagulation", "liver", "cardiovascular",
-            "cns", "renal", "hours_beforesepsis", "hours_beforedeath"
-        ]
-        # Binary output (logit -> sigmoid)
-        self.binary_cols = ["sepsis"]
+    def enable_incremental(self, max_stays=1024, idle_seconds=6 * 3600, max_context=None):
+        """
+        Keep per-stay GRU-D recurrence state so a new hour costs one GRU step.
+        With max_context the Transformer only attends over the last max_context
+        steps, which changes the outputs: "-context<n>" is appended to the
+        version tag, like the precision in set_precision.
+        """
+        if max_context and self.incremental is None:
+            self.version = f"{self.version}-context{max_context}"
+        self.incremental = IncrementalEngine(
+            self, max_stays=max_stays, idle_seconds=idle_seconds, max_context=max_context
+        )
+        return self.incremental
 
-    def preprocess_sequence(self, records: list):
+    def records_to_array(self, records: list):
         """
-        Preprocess patient records for model input with GRU-D style imputation.
+        Convert patient records (dicts) to the raw [T, F] feature matrix in
+        MODEL_INPUT_FEATURES order (NaN = missing) plus the [T] hr timeline.
         """
-        if not records:
-            return None, None, None
-            
-        df = pd.DataFrame(records)
-        
-        # Map gender (f0_) to numeric
-        if 'f0_' in df.columns:
-            df['gender'] = df['f0_'].map({'M': 0, 'F': 1, 'Male': 0, 'Female': 1})
-            df['gender'] = df['gender'].fillna(0)
-        elif 'gender' not in df.columns:
-            df['gender'] = np.nan
-            
-        # Add missing columns
-        if 'weight' not in df.columns:
-            df['weight'] = np.nan
-            
-        # Nullify target columns (prevent data leakage)
-        target_cols = [
-            "respiration", "coagulation", "liver", "cardiovascular",
-            "cns", "renal", "hours_beforesepsis", "sepsis",
-            "fod", "hours_beforedeath"
-        ]
-        for col in target_cols:
-            if col in df.columns:
-                df[col] = np.nan
-        
-        # Ensure all required features exist
-        for col in MODEL_INPUT_FEATURES:
-            if col not in df.columns:
-                df[col] = np.nan
-                
-        X_df = df[MODEL_INPUT_FEATURES]
-        X_seq = X_df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
-        
-        T, F = X_seq.shape
-        
-        if F != self.n_features:
-            print(f"WARNING: Feature count mismatch. Expected {self.n_features}, got {F}.")
-            
-        # GRU-D style imputation
-        mask = ~np.isnan(X_seq)
-        X_filled = np.zeros_like(X_seq)
-        delta = np.zeros_like(X_seq)
-        
-        # Get time column (hr) for delta calculation
-        if 'hr' in df.columns:
-            times = df['hr'].values.astype(float)
-        else:
-            times = np.arange(T, dtype=float)
-            
-        for f in range(F):
-            mean_val = self.global_feat_mean[f] if f < len(self.global_feat_mean) else 0.0
-            last_val = mean_val
-            last_time = times[0] if len(times) > 0 else 0
-            
-            for t in range(T):
-                if mask[t, f]:
-                    delta[t, f] = 0.0
-                    last_val = X_seq[t, f]
-                    last_time = times[t]
-                    X_filled[t, f] = last_val
-                else:
-                    if t > 0:
-                        delta[t, f] = times[t] - last_time
-                    else:
-                        delta[t, f] = 0.0
-                        
-                    gamma = np.exp(-delta[t, f])
-                    X_filled[t, f] = gamma * last_val + (1 - gamma) * mean_val
-                    last_val = X_filled[t, f]
-                    
-        # Scale features
+        X_seq, times = records_to_matrix(records)
+        if X_seq is not None and X_seq.shape[1] != self.n_features:
+            print(f"WARNING: Feature count mismatch. Expected {self.n_features}, got {X_seq.shape[1]}.")
+        return X_seq, times
+
+    def scale_features(self, X_filled):
+        """Apply scaler_X to imputed [N, F] rows."""
         X_scaled = self.scaler_X.transform(X_filled)
         
         # Handle NaN/Inf from scaling (zero-variance features produce NaN)
-        X_scaled = np.nan_to_num(X_scaled, nan=0.0, posinf=0.0, neginf=0.0)
+        return np.nan_to_num(X_scaled, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def preprocess_batch(self, sequences: list):
+        """
+        Impute, scale and right-pad several stays into [B, T_max, F] tensors.
+
+        Args:
+            sequences: List of (X_seq [T, F], times [T]) from records_to_array
+        """
+        lengths = np.array([len(X_seq) for X_seq, _ in sequences])
+        B, T_max, F = len(sequences), int(lengths.max()), sequences[0][0].shape[1]
+
+        X_pad = np.full((B, T_max, F), np.nan, dtype=np.float32)
+        times_pad = np.zeros((B, T_max), dtype=np.float64)
+        for b, (X_seq, times) in enumerate(sequences):
+            X_pad[b, :lengths[b]] = X_seq
+            times_pad[b, :lengths[b]] = times
+
+        return self.preprocess_padded(X_pad, times_pad, lengths)
+
+    def preprocess_padded(self, X_pad, times_pad, lengths):
+        """
+        Impute, scale and convert an already right-padded batch.
+
+        Args:
+            X_pad: [B, T, F] raw values (NaN = missing); padding contents are ignored
+            times_pad: [B, T] hr timeline
+            lengths: [B] valid rows per sequence
+        """
+        B, T_max, F = X_pad.shape
+
+        # GRU-D style imputation (vectorized, see imputation.py)
+        X_filled, mask, delta = grud_impute_batch(X_pad, times_pad, self.global_feat_mean, lengths=lengths)
+
+        X_scaled = self.scale_features(X_filled.reshape(B * T_max, F)).reshape(B, T_max, F)
+
+        # Padding stays all-zero, as in the training collate_fn
+        X_scaled[np.arange(T_max)[None, :] >= lengths[:, None]] = 0.0
         
-        # Convert to tensors [1, T, F]
-        X_tensor = torch.tensor(X_scaled, dtype=torch.float32).unsqueeze(0)
-        mask_tensor = torch.tensor(mask.astype(float), dtype=torch.float32).unsqueeze(0)
-        delta_tensor = torch.tensor(delta, dtype=torch.float32).unsqueeze(0)
+        X_tensor = torch.tensor(X_scaled, dtype=torch.float32)
+        mask_tensor = torch.tensor(mask.astype(float), dtype=torch.float32)
+        delta_tensor = torch.tensor(delta, dtype=torch.float32)
         
         return X_tensor, mask_tensor, delta_tensor
 
-    def predict(self, records: list, window_id: int = 0):
+    def preprocess_sequence(self, records: list):
         """
-        Run prediction and return all 10 outputs.
+        Preprocess patient records for model input with GRU-D style imputation.
+        Returns [1, T, F] tensors.
+        """
+        X_seq, times = self.records_to_array(records)
+        if X_seq is None:
+            return None, None, None
+        return self.preprocess_batch([(X_seq, times)])
+
+    def _format_result(self, y_reg_original, y_bin_prob):
+        """Turn one row of (inverse-scaled) regression outputs + sepsis probability into the API dict."""
+        result = {}
+        
+        # Regression outputs
+        for i, col in enumerate(self.regression_cols):
+            val = float(y_reg_original[i])
+            # Clip SOFA scores to valid range [0, 4]
+            if col in ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]:
+                val = max(0.0, min(4.0, val))
+            # Clip hours to non-negative
+            elif col in ["hours_beforesepsis", "hours_beforedeath"]:
+                val = max(0.0, val)
+            result[col] = val
+        
+        # Binary output (sepsis probability)
+        result["sepsis"] = float(y_bin_prob[0])
+        
+        # FOD (failure of organ dysfunction) - calculate from SOFA
+        # High SOFA total indicates higher mortality risk
+        sofa_sum = sum([
+            result.get("respiration", 0),
+            result.get("coagulation", 0),
+            result.get("liver", 0),
+            result.get("cardiovascular", 0),
+            result.get("cns", 0),
+            result.get("renal", 0)
+        ])
+        # Map SOFA to mortality probability using sigmoid
+        # SOFA >= 11 has ~50% mortality in studies
+        result["fod"] = 1.0 / (1.0 + np.exp(-0.3 * (sofa_sum - 8)))
+        
+        return result
+
+    def predict_batch(self, items: list, all_horizons: bool = False):
+        """
+        Score several stays in a single padded forward pass.
         
         Args:
-            records: List of patient records
-            window_id: Prediction window (0=6h, 1=12h, 2=24h)
+            items: List of (records, window_id) pairs
+            all_horizons: Also return every window head (see score_pooled)
+            
+        Returns:
+            List of result dicts in the same order (None for empty records)
         """
-        if not records:
+        arrays = []
+        for records, window_id in items:
+            X_seq, times = self.records_to_array(records)
+            arrays.append((X_seq, times, window_id))
+        return self.predict_arrays(arrays, all_horizons)
+
+    def enable_windowed(self):
+        """
+        Score each window head on only the last 6/12/24 rows, imputed from the window
+        start, exactly like the training windows (TemporalWindowDataset). Cost no longer
+        grows with the length of the stay. "-windowed" is appended to the version tag,
+        so cached and stored full-history predictions are not reused.
+        """
+        if not self.windowed:
+            self.windowed = True
+            self.version = f"{self.version}-windowed"
+
+    def context_rows(self, window_id: int = 0, all_horizons: bool = False):
+        """Trailing rows a prediction needs (None = the whole stay)."""
+        if not self.windowed:
             return None
+        return max(WINDOW_HOURS) if all_horizons else WINDOW_HOURS[max(0, min(2, window_id))]
+
+    def predict_arrays(self, items: list, all_horizons: bool = False):
+        """
+        Like predict_batch, for stays already in array form.
+        
+        Args:
+            items: List of (X_seq [T, F], times [T], window_id); X_seq may be None
+        """
+        if self.windowed:
+            return self._predict_windowed(items, all_horizons)
+        return self._predict_context(items, all_horizons)
+
+    def _predict_windowed(self, items: list, all_horizons: bool = False):
+        """
+        Windowed mode: each requested head sees only its own trailing window. With
+        all_horizons the three windows of a stay go through one padded batch.
+        """
+        windows, owners = [], []
+        for i, (X_seq, times, window_id) in enumerate(items):
+            if X_seq is None or len(X_seq) == 0:
+                continue
+            window_id = max(0, min(2, window_id))
+            for w in (range(len(WINDOW_HOURS)) if all_horizons else [window_id]):
+                n = WINDOW_HOURS[w]
+                windows.append((X_seq[-n:], times[-n:], w))
+                owners.append((i, w))
+        
+        results = [None] * len(items)
+        scored = self._predict_context(windows)
+        if not all_horizons:
+            for (i, _), result in zip(owners, scored):
+                results[i] = result
+            return results
         
-        # Validate window_id
-        window_id = max(0, min(2, window_id))  # Clamp to [0, 1, 2]
+        horizons_by_item = {}
+        for (i, w), result in zip(owners, scored):
+            horizons_by_item.setdefault(i, {})[f"{WINDOW_HOURS[w]}h"] = result
+        for i, horizons in horizons_by_item.items():
+            window_id = max(0, min(2, items[i][2]))
+            result = dict(horizons[f"{WINDOW_HOURS[window_id]}h"])
+            result["horizons"] = horizons
+            results[i] = result
+        return results
+
+    def _predict_context(self, items: list, all_horizons: bool = False):
+        """One padded forward pass over the given sequences as they are."""
+        results = [None] * len(items)
+        sequences, window_ids, positions = [], [], []
+        for i, (X_seq, times, window_id) in enumerate(items):
+            if X_seq is None or len(X_seq) == 0:
+                continue
+            sequences.append((X_seq, times))
+            window_ids.append(window_id)
+            positions.append(i)
             
-        with torch.no_grad():
-            X, mask, delta = self.preprocess_sequence(records)
-            if X is None:
-                return None
-                
-            X = X.to(self.device)
-            mask = mask.to(self.device)
-            delta = delta.to(self.device)
+        if not sequences:
+            return results
             
-            # Use specified window_id (0=6h, 1=12h, 2=24h)
-            window_tensor = torch.tensor([window_id], dtype=torch.long, device=self.device)
+        with torch.no_grad():
+            X, mask, delta = self.preprocess_batch(sequences)
+            pooled = self.encode(X, mask, delta)
+            scored = self.score_pooled(pooled, window_ids, all_horizons)
             
-            y_reg_out, y_bin_out = self.model(X, mask, delta, window_tensor)
+        for row, i in enumerate(positions):
+            results[i] = scored[row]
+        return results
+
+    def head_outputs(self, pooled, window_ids: list):
+        """
+        Raw head outputs of pooled encodings [B, d_model] as arrays: inverse-scaled
+        regression outputs [B, len(regression_cols)] (unclipped) and sepsis
+        probabilities [B, 1].
+        """
+        with torch.no_grad():
+            window_tensor = torch.tensor(window_ids, dtype=torch.long, device=self.device)
+            y_reg_out, y_bin_out = self.model.apply_heads(pooled, window_tensor)
             
             # Inverse transform regression outputs
-            y_reg_np = y_reg_out.cpu().numpy()
-            y_reg_original = self.scaler_y_reg.inverse_transform(y_reg_np)
+            y_reg_original = self.scaler_y_reg.inverse_transform(y_reg_out.cpu().numpy())
             
             # Apply sigmoid to binary output (trained with BCEWithLogitsLoss)
             y_bin_np = torch.sigmoid(y_bin_out).cpu().numpy()
+        return y_reg_original, y_bin_np
+
+    def score_pooled(self, pooled, window_ids: list, all_horizons: bool = False):
+        """
+        Run the window heads on pooled encodings [B, d_model] and format one result per row.
+        With all_horizons=True every head is evaluated from the same encoding and the
+        result gains a "horizons" section keyed by window ("6h", "12h", "24h").
+        """
+        # Clamp to [0, 1, 2]
+        window_ids = [max(0, min(2, w)) for w in window_ids]
+        
+        if not all_horizons:
+            y_reg_original, y_bin_np = self.head_outputs(pooled, window_ids)
+            return [self._format_result(y_reg_original[row], y_bin_np[row]) for row in range(len(window_ids))]
+        
+        with torch.no_grad():
+            y_reg_out, y_bin_out = self.model.apply_all_heads(pooled)  # [B, 3, *]
+            B, H, R = y_reg_out.shape
+            y_reg_original = self.scaler_y_reg.inverse_transform(
+                y_reg_out.reshape(B * H, R).cpu().numpy()
+            ).reshape(B, H, R)
+            y_bin_np = torch.sigmoid(y_bin_out).cpu().numpy()
             
-            result = {}
-            
-            # Regression outputs
-            for i, col in enumerate(self.regression_cols):
-                val = float(y_reg_original[0, i])
-                # Clip SOFA scores to valid range [0, 4]
-                if col in ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]:
-                    val = max(0.0, min(4.0, val))
-                # Clip hours to non-negative
-                elif col in ["hours_beforesepsis", "hours_beforedeath"]:
-                    val = max(0.0, val)
-                result[col] = val
-            
-            # Binary output (sepsis probability)
-            result["sepsis"] = float(y_bin_np[0, 0])
-            
-            # FOD (failure of organ dysfunction) - calculate from SOFA
-            # High SOFA total indicates higher mortality risk
-            sofa_sum = sum([
-                result.get("respiration", 0),
-                result.get("coagulation", 0),
-                result.get("liver", 0),
-                result.get("cardiovascular", 0),
-                result.get("cns", 0),
-                result.get("renal", 0)
-            ])
-            # Map SOFA to mortality probability using sigmoid
-            # SOFA >= 11 has ~50% mortality in studies
-            result["fod"] = 1.0 / (1.0 + np.exp(-0.3 * (sofa_sum - 8)))
-            
-            return result
+        results = []
+        for row, window_id in enumerate(window_ids):
+            horizons = {
+                f"{hours}h": self._format_result(y_reg_original[row, h], y_bin_np[row, h])
+                for h, hours in enumerate(WINDOW_HOURS)
+            }
+            result = dict(horizons[f"{WINDOW_HOURS[window_id]}h"])
+            result["horizons"] = horizons
+            results.append(result)
+        return results
+
+    def predict_trajectory(self, X_seq, times, window_id: int = 0, positions=None, batch_size: int = 256,
+                           starts=None):
+        """
+        Score a stay at every hour: row t gets the training-style window of the
+        last 6/12/24 rows ending at t (shorter at the start of the stay).
+        
+        Args:
+            X_seq, times: the stay as from records_to_array
+            window_id: 0=6h, 1=12h, 2=24h
+            positions: row indices to score (default: all rows)
+            starts: [len(X_seq)] first row of the stay each row belongs to, when
+                X_seq holds several stays back to back (default: one stay)
+        
+        Returns:
+            One result dict per position, in order
+        """
+        y_reg, y_bin = self.trajectory_outputs(X_seq, times, window_id, positions, batch_size, starts)
+        return [self._format_result(y_reg[row], y_bin[row]) for row in range(len(y_reg))]
+
+    def trajectory_outputs(self, X_seq, times, window_id: int = 0, positions=None, batch_size: int = 256,
+                           starts=None):
+        """
+        predict_trajectory as arrays (see head_outputs), for bulk scoring.
+        Windows are gathered from X_seq with one index array per chunk, imputed
+        and encoded batch_size at a time.
+        """
+        window_id = max(0, min(2, window_id))
+        n = WINDOW_HOURS[window_id]
+        ends = np.arange(len(X_seq)) if positions is None else np.asarray(positions, dtype=np.int64)
+        y_reg = np.empty((len(ends), len(self.regression_cols)), dtype=np.float32)
+        y_bin = np.empty((len(ends), len(self.binary_cols)), dtype=np.float32)
+        for chunk in range(0, len(ends), batch_size):
+            end = ends[chunk:chunk + batch_size]
+            lengths = np.minimum(end + 1 - (0 if starts is None else starts[end]), n)
+            # [B, n] row indices of each window, right-padded by repeating its last row
+            idx = np.minimum((end - lengths + 1)[:, None] + np.arange(n)[None, :], end[:, None])
+            with torch.no_grad():
+                X, mask, delta = self.preprocess_padded(X_seq[idx], times[idx], lengths)
+                pooled = self.encode(X, mask, delta)
+                y_reg[chunk:chunk + len(end)], y_bin[chunk:chunk + len(end)] = \
+                    self.head_outputs(pooled, [window_id] * len(end))
+        return y_reg, y_bin
+
+    def predict(self, records: list, window_id: int = 0, all_horizons: bool = False):
+        """
+        Run prediction and return all 10 outputs.
+        
+        Args:
+            records: List of patient records
+            window_id: Prediction window (0=6h, 1=12h, 2=24h)
+            all_horizons: Also return the 6h/12h/24h heads from the same encoder run
+        """
+        if not records:
+            return None
+        return self.predict_batch([(records, window_id)], all_horizons)[0]
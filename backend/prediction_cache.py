@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# =============================================================================
+# Prediction result cache
+#
+# Keys are (stay_id, latest hr, window_hours, model version), so a new hourly
+# row naturally produces a new key; invalidate_stay() additionally drops the
+# stale entries as soon as POST /patient writes to the stay. The trajectory
+# cache keys single hours, (stay_id, hr, window_id, model version), and only
+# loses the hours a write can affect.
+# Concurrent requests for the same key share one computation (coalescing).
+# =============================================================================
+
+
+class PredictionCache:
+    """
+    Bounded in-memory LRU cache with TTL expiry and request coalescing.
+
+    Args:
+        max_entries: LRU bound on cached predictions
+        ttl_seconds: entries older than this are recomputed
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._by_stay = {}  # stay_id -> set of keys
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_stay.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_stay[key[0]]
+
+    def _lookup(self, key):
+        """Fresh cached value or None. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        """Insert and enforce the LRU bound. Caller holds the lock."""
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        self._by_stay.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, or run compute() once and cache it.
+        Callers arriving while the same key is being computed wait for that result.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # Only cache if the stay was not invalidated while we were computing
+            if self._inflight.pop(key, None) is future and value is not None:
+                self._store(key, value)
+        future.set_result(value)
+        return value
+
+    async def get_or_compute_async(self, key, compute):
+        """
+        get_or_compute for async handlers: compute is a coroutine function, and
+        waiters await the in-flight result instead of blocking a thread.
+        Shares coalescing with the sync variant.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if self._inflight.pop(key, None) is future and value is not None:
+                self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def invalidate_stay(self, stay_id, from_hr=None):
+        """
+        Drop cached predictions of a stay (called when new data is written).
+        With from_hr only entries keyed at that hr or later go, which keeps
+        per-hour results that cannot see the new row.
+        """
+        with self._lock:
+            stale = lambda key: key[0] == stay_id and (from_hr is None or key[1] >= from_hr)
+            keys = {key for key in self._by_stay.get(stay_id, ()) if stale(key)}
+            for key in keys:
+                self._drop(key)
+            for key in [k for k in self._inflight if stale(k)]:
+                del self._inflight[key]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_stay.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
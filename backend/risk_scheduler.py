@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import or_
+
+from database import SessionLocal, PatientRisk, Stay
+from feature_map import FEATURE_MAP
+
+SOFA_COLS = ["respiration", "coagulation", "liver", "cardiovascular", "cns", "renal"]
+
+
+class RiskScheduler:
+    """
+    Periodically scores every stay whose data changed since its last score and
+    materializes the results into patient_risk, so ward-wide risk ranking is an
+    index lookup instead of on-demand model calls.
+
+    A stay is re-scored when its latest hr or row count in the stays index
+    differs from what was recorded at scoring time, or when the active model
+    version changed.
+
+    Args:
+        get_model: callable returning the current ModelWrapper (or None)
+        interval_seconds: pause between scoring runs
+        batch_size: stays per padded forward pass
+        window_id: prediction window used for the ranking (0=6h, 1=12h, 2=24h)
+    """
+
+    def __init__(self, get_model, session_factory=SessionLocal, interval_seconds=300, batch_size=64, window_id=0):
+        self.get_model = get_model
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.window_id = window_id
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None  # {"started_at", "scored", "seconds"}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="risk-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Risk scheduler error: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def dirty_stays(self, db, model_version):
+        """stay_ids with no score, or whose data/model changed since they were scored."""
+        rows = db.query(Stay.stay_id)\
+            .outerjoin(PatientRisk, PatientRisk.stay_id == Stay.stay_id)\
+            .filter(or_(
+                PatientRisk.stay_id.is_(None),
+                PatientRisk.scored_hr != Stay.last_hr,
+                PatientRisk.row_count != Stay.row_count,
+                PatientRisk.model_version != model_version,
+            ))\
+            .all()
+        return [r.stay_id for r in rows]
+
+    def score_stays(self, db, model, stay_ids):
+        """Score one batch of stays and upsert their patient_risk rows."""
+        # Windowed inference only needs the trailing rows of each stay
+        arrays = FEATURE_MAP.load(db, stay_ids, model.context_rows(self.window_id))
+        versions = {r.stay_id: (r.last_hr, r.row_count)
+                    for r in db.query(Stay.stay_id, Stay.last_hr, Stay.row_count).filter(Stay.stay_id.in_(stay_ids))}
+
+        stays = list(arrays)
+        results = model.predict_arrays([(*arrays[s], self.window_id) for s in stays])
+        scored_at = datetime.now(timezone.utc).isoformat()
+
+        for stay_id, result in zip(stays, results):
+            _, times = arrays[stay_id]
+            # Data version as seen by dirty_stays()
+            scored_hr, row_count = versions.get(stay_id, (int(times[-1]), len(times)))
+            db.merge(PatientRisk(
+                stay_id=stay_id,
+                scored_hr=scored_hr,
+                row_count=row_count,
+                model_version=model.version,
+                scored_at=scored_at,
+                sepsis_prob=result["sepsis"],
+                sofa_total=sum(result[c] for c in SOFA_COLS),
+                **{c: result[c] for c in SOFA_COLS},
+            ))
+        db.commit()
+        return len(stays)
+
+    def run_once(self):
+        """One scoring pass over all changed stays. Returns the number of stays scored."""
+        model = self.get_model()
+        if model is None:
+            return 0
+
+        started = time.perf_counter()
+        scored = 0
+        db = self.session_factory()
+        try:
+            stay_ids = self.dirty_stays(db, model.version)
+            for i in range(0, len(stay_ids), self.batch_size):
+                if self._stop.is_set():
+                    break
+                scored += self.score_stays(db, model, stay_ids[i:i + self.batch_size])
+        finally:
+            db.close()
+
+        self.last_run = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "scored": scored,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if scored:
+            print(f"Risk scheduler: scored {scored} stays in {self.last_run['seconds']}s")
+        return scored
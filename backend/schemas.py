@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 class PredictionInput(BaseModel):
     # Demographics & Meta
@@ -138,7 +138,7 @@ class PredictionInput(BaseModel):
     ntprobnp_min: Optional[float] = None
     ntprobnp_max: Optional[float] = None
 
-class PredictionOutput(BaseModel):
+class HorizonPrediction(BaseModel):
     sepsis: float
     respiration: float
     coagulation: float
@@ -149,3 +149,30 @@ class PredictionOutput(BaseModel):
     hours_beforesepsis: float
     fod: float
     hours_beforedeath: float
+
+class PredictionOutput(HorizonPrediction):
+    # Per-window outputs ("6h", "12h", "24h"), only with all_horizons=true
+    horizons: Optional[Dict[str, HorizonPrediction]] = None
+    model_version: Optional[str] = None  # ModelWrapper.version that produced the prediction
+
+class TrajectoryPoint(HorizonPrediction):
+    hr: int
+
+class TrajectoryOutput(BaseModel):
+    stay_id: int
+    window_hours: int
+    points: List[TrajectoryPoint]  # one per hour, oldest first
+    computed: int  # points not served from the trajectory cache
+    model_version: str
+
+class BatchPredictionItem(BaseModel):
+    stay_id: int
+    window_hours: int = 6
+
+class BatchPredictionInput(BaseModel):
+    stays: List[BatchPredictionItem]
+    all_horizons: bool = False
+
+class BatchPredictionOutput(BaseModel):
+    results: Dict[int, PredictionOutput]  # keyed by stay_id
+    missing: List[int] = []  # stay_ids with no data
@@ -0,0 +1,258 @@
+"""
+Streaming import of hourly patient parquet files into patient_data.
+
+Parquet record batches are converted column-wise to native Python values
+(pyarrow, no per-cell Python checks) and inserted with a raw executemany under
+bulk-load SQLite pragmas (SQLAlchemy Core inserts on other databases). On an
+empty table the patient_data indexes are dropped for the load and rebuilt
+afterwards by database.migrate(). The stays index, stay_latest and /stats
+summary are rebuilt at the end.
+
+Usage (from backend/):
+    python seed.py                                   # ../dataset/df_test30.parquet into an empty DB
+    python seed.py --append new_admissions.parquet   # add rows to an existing DB
+"""
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+
+from sqlalchemy import text
+
+from database import engine, migrate, SessionLocal, PatientData
+
+DEFAULT_PARQUET = os.path.join(os.path.dirname(__file__), "../dataset/df_test30.parquet")
+
+# Connection settings for the load only; previous values are restored afterwards.
+# The database stays in WAL mode (see database.py), which already suits bulk appends.
+BULK_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": "-262144",  # KiB (256 MiB page cache)
+    "temp_store": "MEMORY",
+}
+
+GENDER_MAP = {0: "M", 1: "F", "M": "M", "F": "F"}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (ru_maxrss is KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _gender_mostly_null(parquet):
+    """
+    Whether more than 90% of a file's 'gender' column is null, decided once
+    for the whole file: from the row group statistics when every row group
+    has them, else by reading that one column.
+    """
+    metadata = parquet.metadata
+    j = parquet.schema_arrow.get_field_index("gender")
+    stats = [metadata.row_group(g).column(j).statistics for g in range(metadata.num_row_groups)]
+    if all(s is not None and s.has_null_count for s in stats):
+        n_null = sum(s.null_count for s in stats)
+    else:
+        n_null = parquet.read(columns=["gender"]).column("gender").null_count
+    return n_null > 0.9 * metadata.num_rows
+
+
+def _gender_column(batch, rng, random_gender):
+    """f0_ values derived from the parquet 'gender' column, as a Python list."""
+    if random_gender:
+        # Same fallback as the original seeder: a mostly empty gender column is imputed randomly
+        return np.where(rng.integers(0, 2, size=batch.num_rows) == 0, "M", "F").tolist()
+    return [GENDER_MAP.get(g) for g in batch.column("gender").to_pylist()]
+
+
+def batch_columns(batch, columns, rng, random_gender=False):
+    """
+    Convert one pyarrow RecordBatch to per-column Python lists in `columns` order.
+    NaN/inf become None, timestamps become strings. random_gender: impute f0_
+    randomly instead of deriving it from 'gender' (see _gender_mostly_null).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    out = []
+    for name in columns:
+        if name == "f0_" and "f0_" not in batch.schema.names:
+            out.append(_gender_column(batch, rng, random_gender))
+            continue
+
+        col = batch.column(name)
+        if pa.types.is_floating(col.type):
+            col = pc.if_else(pc.is_finite(col), col, pa.scalar(None, col.type))
+        elif pa.types.is_timestamp(col.type) or pa.types.is_date(col.type):
+            if pa.types.is_timestamp(col.type):
+                col = col.cast(pa.timestamp("s", col.type.tz), safe=False)
+            col = pc.strftime(col, format="%Y-%m-%d %H:%M:%S")
+        out.append(col.to_pylist())
+    return out
+
+
+def _set_pragmas(cursor, pragmas):
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+        cursor.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+
+def _parquet_batches(path, db_cols, batch_size, rng):
+    """Target columns of one parquet file and an iterator of per-column value lists."""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    names = set(parquet.schema_arrow.names)
+    columns = [c for c in db_cols if c in names or (c == "f0_" and "gender" in names)]
+    derive_gender = "f0_" in columns and "f0_" not in names
+    read_cols = [c for c in columns if c in names] + (["gender"] if derive_gender else [])
+    random_gender = derive_gender and _gender_mostly_null(parquet)
+    batches = (batch_columns(batch, columns, rng, random_gender)
+               for batch in parquet.iter_batches(batch_size=batch_size, columns=read_cols))
+    return columns, batches
+
+
+def _report(total, started):
+    elapsed = time.perf_counter() - started
+    print(f"Inserted {total} records... ({total / elapsed:,.0f} rows/s, peak RSS {peak_rss_mb():.0f} MiB)")
+
+
+def _load_sqlite(paths, db_cols, batch_size, rng, started):
+    """
+    Raw DBAPI executemany under bulk-load pragmas, one transaction per file:
+    a file that fails part-way is rolled back, files before it stay loaded.
+    """
+    total = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        previous = _set_pragmas(cursor, BULK_PRAGMAS)
+        try:
+            for path in paths:
+                columns, batches = _parquet_batches(path, db_cols, batch_size, rng)
+                sql = f"INSERT INTO patient_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                file_rows = 0
+                for values in batches:
+                    cursor.executemany(sql, zip(*values))
+                    file_rows += len(values[0])
+                    total += len(values[0])
+                    _report(total, started)
+                raw.commit()
+                print(f"Loaded {file_rows} rows from {path}")
+        except BaseException:
+            raw.rollback()
+            raise
+        finally:
+            _set_pragmas(cursor, previous)
+            # Fold the load back into the main file instead of leaving a huge -wal
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cursor.close()
+    finally:
+        raw.close()
+    return total
+
+
+def _load_generic(paths, db_cols, batch_size, rng, started):
+    """Other databases (e.g. PostgreSQL): Core executemany, batched into multi-row INSERTs by the driver dialect."""
+    total = 0
+    table = PatientData.__table__
+    for path in paths:
+        columns, batches = _parquet_batches(path, db_cols, batch_size, rng)
+        file_rows = 0
+        with engine.begin() as conn:
+            for values in batches:
+                conn.execute(table.insert(), [dict(zip(columns, row)) for row in zip(*values)])
+                file_rows += len(values[0])
+                total += len(values[0])
+                _report(total, started)
+        print(f"Loaded {file_rows} rows from {path}")
+    return total
+
+
+def import_parquet(paths, append=False, batch_size=50_000, seed=0):
+    """
+    Stream parquet files into patient_data. Returns the number of rows inserted.
+    SQLite loads use raw executemany with bulk-load pragmas; other databases go
+    through SQLAlchemy Core.
+
+    Args:
+        paths: parquet files, loaded in order (each is committed on its own)
+        append: allow loading into a non-empty table
+        batch_size: rows per record batch / executemany call
+        seed: RNG seed for the gender imputation fallback
+    """
+    db_cols = [c.name for c in PatientData.__table__.columns if c.name != "id"]
+    db = SessionLocal()
+    try:
+        existing = db.query(PatientData.id).first() is not None
+    finally:
+        db.close()
+    if existing and not append:
+        raise ValueError("patient_data is not empty; pass append=True (--append) to add rows")
+
+    # Rebuilding the indexes once is cheaper than maintaining them per row, but
+    # only when the whole table is being loaded
+    indexes = list(PatientData.__table__.indexes) if not existing else []
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+    # Stale fallback index from migrate(), if any
+    if indexes:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_patient_data_stay_hr"))
+
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    load = _load_sqlite if engine.dialect.name == "sqlite" else _load_generic
+    total = load(paths, db_cols, batch_size, rng, started)
+
+    if indexes:
+        index_start = time.perf_counter()
+        migrate()
+        print(f"Built indexes in {time.perf_counter() - index_start:.1f}s")
+
+    elapsed = time.perf_counter() - started
+    print(f"Import complete: {total} rows in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:,.0f} rows/s, peak RSS {peak_rss_mb():.0f} MiB)")
+    return total
+
+
+def rebuild_derived():
+    """Rebuild the stays index, stay_latest and the /stats summary after an import."""
+    from stats import rebuild_summary
+    from stay_index import rebuild_stays
+    from stay_latest import rebuild_stay_latest
+
+    db = SessionLocal()
+    try:
+        n_stays = rebuild_stays(db)
+        rebuild_stay_latest(db)
+        rebuild_summary(db)
+    finally:
+        db.close()
+    print(f"Rebuilt stays index and stay_latest ({n_stays} stays) and dataset summary")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_PARQUET], help="parquet files to import")
+    parser.add_argument("--append", action="store_true", help="add rows to a non-empty patient_data table")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    migrate()
+
+    missing = [p for p in args.paths if not os.path.exists(p)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+    try:
+        import_parquet(args.paths, append=args.append, batch_size=args.batch_size)
+    except ValueError as e:
+        parser.error(str(e))
+    rebuild_derived()
+
+
+if __name__ == "__main__":
+    main()
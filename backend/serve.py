@@ -0,0 +1,192 @@
+"""
+Production launcher: N uvicorn workers forked from one parent that has
+already loaded the model.
+
+The parent initializes the database, builds the feature store if needed and
+loads the model registry (weights, scalers, warmup), then freezes the GC and
+forks the workers. Each worker serves the same listening socket with its own
+event loop, caches and inference queue, while the model weights stay shared
+copy-on-write pages of the parent (memory-mapped file pages with the compiled
+export, see export_model.py). Workers get an explicit torch/BLAS thread budget
+(cores // workers by default) so N workers do not each start one thread per
+core. Only worker 0 runs the risk scheduler. Crashed workers are re-forked.
+
+Memory per worker (RSS, PSS, shared, private) is printed once the workers are
+up and again on SIGUSR1 (kill -USR1 <parent pid>).
+
+Every worker holds its own model registry, so the model-changing endpoints
+(POST /models/{name}/activate, /models/{name}/shadow, /models/shadow/promote,
+DELETE /models/shadow) answer 409 here: a change would only reach one worker.
+Select versions with MODEL_VERSION / MODEL_SHADOW_VERSION and restart.
+
+Usage (from backend/):
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 2 --threads-per-worker 2
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from threads import THREAD_ENV_VARS, available_cores, limit_threads, thread_budget
+
+
+def memory_mb(pid):
+    """RSS / PSS / shared / private memory of a process in MiB (Linux smaps_rollup)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "shared": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+        "private": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def memory_report(parent_pid, workers):
+    """Print memory per process; PSS splits shared pages across the processes using them."""
+    print(f"{'process':>10} {'pid':>8} {'rss (MiB)':>10} {'pss (MiB)':>10} {'shared':>8} {'private':>8}")
+    total_pss = 0.0
+    for name, pid in [("parent", parent_pid)] + [(f"worker {i}", pid) for pid, i in sorted(workers.items(), key=lambda w: w[1])]:
+        mem = memory_mb(pid)
+        if mem is None:
+            continue
+        total_pss += mem["pss"]
+        print(f"{name:>10} {pid:>8} {mem['rss']:>10.1f} {mem['pss']:>10.1f} {mem['shared']:>8.1f} {mem['private']:>8.1f}")
+    print(f"total PSS {total_pss:.1f} MiB")
+    sys.stdout.flush()
+
+
+def listen(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, sock, app, n_threads, log_level):
+    """Body of a forked worker: thread budget, then one uvicorn server on the shared socket."""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    limit_threads(n_threads)
+    if index > 0:
+        # One ward-wide scorer per deployment
+        os.environ["RISK_SCHEDULER_INTERVAL"] = "0"
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def preload(models=True):
+    """
+    Everything the workers share, loaded once in the parent. Returns the app.
+    With models=False every worker loads its own copy on startup (for comparison).
+    """
+    # Loading runs single-threaded: no OpenMP pool exists yet when the workers are forked
+    limit_threads(1)
+    import main
+    from database import init_db, engine
+
+    init_db()
+    # Workers skip init_db() on startup, and refuse per-worker model changes (see api.py)
+    main.app.state.db_initialized = True
+    main.app.state.prefork = True
+    main.open_feature_store()
+    # Built (or rebuilt) by the parent; workers only open it
+    os.environ["FEATURE_STORE_REBUILD"] = "0"
+    if models:
+        main.load_models()
+    # No pooled connections may cross the fork
+    engine.dispose()
+    # Objects loaded so far move to a permanent generation, so collections in
+    # the workers do not write to (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=available_cores())
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="default: cores // workers")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-preload", action="store_true", help="load the model in every worker instead (no sharing)")
+    parser.add_argument("--report-after", type=float, default=5.0,
+                        help="seconds after start to print memory per worker (0 disables)")
+    args = parser.parse_args()
+
+    n_threads = args.threads_per_worker or thread_budget(args.workers)
+    # Before torch / numpy are imported, so their thread pools start at the budget
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+    print(f"{args.workers} workers x {n_threads} threads ({available_cores()} cores)")
+
+    app = preload(models=not args.no_preload)
+    sock = listen(args.host, args.port)
+    parent_pid = os.getpid()
+    workers = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(index, sock, app, n_threads, args.log_level)
+            finally:
+                os._exit(0)
+        workers[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: memory_report(parent_pid, workers))
+
+    for index in range(args.workers):
+        spawn(index)
+    print(f"Serving on {args.host}:{args.port} (parent pid {parent_pid})")
+
+    report_at = time.monotonic() + args.report_after if args.report_after > 0 else None
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = workers.pop(pid)
+            if not stopping:
+                print(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+                spawn(index)
+            continue
+        if report_at is not None and time.monotonic() >= report_at:
+            report_at = None
+            memory_report(parent_pid, workers)
+        time.sleep(0.2)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
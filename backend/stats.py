@@ -0,0 +1,162 @@
+from sqlalchemy import func, case, and_
+
+from database import PatientData, DatasetStats
+
+# =============================================================================
+# Dataset statistics for GET /stats
+#
+# Per stay we count age = MAX(age), gender = MAX(f0_) and sepsis = MAX(sepsis).
+# compute_stats() does a full recompute in a single scan (conditional
+# aggregation over one GROUP BY stay_id); the dataset_stats summary row is
+# maintained incrementally on insert so /stats itself is O(1).
+# =============================================================================
+
+# Summary column -> (lower exclusive, upper inclusive) age bound
+AGE_BUCKETS = {
+    "age_0_18": (None, 18),
+    "age_19_40": (18, 40),
+    "age_41_60": (40, 60),
+    "age_61_80": (60, 80),
+    "age_80_plus": (80, None),
+}
+AGE_LABELS = {
+    "age_0_18": "0-18",
+    "age_19_40": "19-40",
+    "age_41_60": "41-60",
+    "age_61_80": "61-80",
+    "age_80_plus": "80+",
+}
+MALE = ("M", "Male")
+FEMALE = ("F", "Female")
+
+COUNTER_COLS = [
+    "total_patients", "age_sum", "age_count", "male", "female", "sepsis", *AGE_BUCKETS
+]
+
+
+def _in_bucket(age, lo, hi):
+    return (lo is None or age > lo) and (hi is None or age <= hi)
+
+
+def _contribution(age, gender, sepsis):
+    """Counter deltas contributed by one stay with the given per-stay values."""
+    c = {"total_patients": 1}
+    if age is not None:
+        c["age_sum"] = age
+        c["age_count"] = 1
+        for col, (lo, hi) in AGE_BUCKETS.items():
+            if _in_bucket(age, lo, hi):
+                c[col] = 1
+    if gender in MALE:
+        c["male"] = 1
+    elif gender in FEMALE:
+        c["female"] = 1
+    if sepsis == 1:
+        c["sepsis"] = 1
+    return c
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def compute_stats(db):
+    """Full recompute of the summary counters in one scan of patient_data."""
+    per_stay = db.query(
+        func.max(PatientData.age).label("age"),
+        func.max(PatientData.f0_).label("gender"),
+        func.max(PatientData.sepsis).label("sepsis"),
+    ).group_by(PatientData.stay_id).subquery()
+
+    age = per_stay.c.age
+
+    def count_if(cond):
+        return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+    def age_cond(lo, hi):
+        conds = [age.isnot(None)]
+        if lo is not None:
+            conds.append(age > lo)
+        if hi is not None:
+            conds.append(age <= hi)
+        return and_(*conds)
+
+    row = db.query(
+        func.count().label("total_patients"),
+        func.coalesce(func.sum(age), 0).label("age_sum"),
+        func.count(age).label("age_count"),
+        count_if(per_stay.c.gender.in_(MALE)).label("male"),
+        count_if(per_stay.c.gender.in_(FEMALE)).label("female"),
+        count_if(per_stay.c.sepsis == 1).label("sepsis"),
+        *[count_if(age_cond(lo, hi)).label(col) for col, (lo, hi) in AGE_BUCKETS.items()],
+    ).select_from(per_stay).one()
+
+    return {col: getattr(row, col) or 0 for col in COUNTER_COLS}
+
+
+def rebuild_summary(db):
+    """Recompute the summary row from scratch (after seeding or for a new database)."""
+    counters = compute_stats(db)
+    db.merge(DatasetStats(id=1, **counters))
+    db.commit()
+    return counters
+
+
+def record_insert(db, stay_id, prev_values, new_data):
+    """
+    Update the summary for a row about to be inserted, in the caller's transaction.
+    Call before adding the new row to the session.
+
+    Args:
+        prev_values: the stay's last known column values (None for a new stay)
+        new_data: column values of the new row
+    """
+    new_vals = (new_data.get("age"), new_data.get("f0_"), new_data.get("sepsis"))
+    if prev_values is None:
+        delta = _contribution(*new_vals)
+    else:
+        prev_vals = (prev_values.get("age"), prev_values.get("f0_"), prev_values.get("sepsis"))
+        if new_vals == prev_vals:
+            return  # forward-filled row, per-stay values unchanged
+
+        old = db.query(
+            func.max(PatientData.age), func.max(PatientData.f0_), func.max(PatientData.sepsis)
+        ).filter(PatientData.stay_id == stay_id).one()
+        new = tuple(_max(o, n) for o, n in zip(old, new_vals))
+        if new == tuple(old):
+            return
+
+        before, after = _contribution(*old), _contribution(*new)
+        delta = {col: after.get(col, 0) - before.get(col, 0) for col in COUNTER_COLS}
+
+    # If the summary row does not exist yet, read_stats() rebuilds it on first use
+    updates = {getattr(DatasetStats, col): getattr(DatasetStats, col) + val
+               for col, val in delta.items() if val}
+    if updates:
+        db.query(DatasetStats).filter(DatasetStats.id == 1).update(updates, synchronize_session=False)
+
+
+def read_stats(db):
+    """GET /stats payload from the summary row (rebuilt on first use if missing)."""
+    summary = db.get(DatasetStats, 1)
+    counters = ({col: getattr(summary, col) or 0 for col in COUNTER_COLS}
+                if summary is not None else rebuild_summary(db))
+
+    avg_age = counters["age_sum"] / counters["age_count"] if counters["age_count"] else 0
+    return {
+        "total_patients": counters["total_patients"],
+        "avg_age": round(avg_age, 1) if avg_age else 0,
+        "gender_distribution": {
+            "Male": counters["male"],
+            "Female": counters["female"]
+        },
+        "sepsis_cases": {
+            "Sepsis": counters["sepsis"],
+            "Normal": counters["total_patients"] - counters["sepsis"]
+        },
+        "age_distribution": {AGE_LABELS[col]: counters[col] for col in AGE_BUCKETS}
+    }
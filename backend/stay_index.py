@@ -0,0 +1,97 @@
+from sqlalchemy import func, case, insert, or_, and_
+
+from database import PatientData, Stay
+
+# =============================================================================
+# Per-stay index table
+#
+# `stays` holds one compact row per stay so listing, search and emergency
+# queries never GROUP BY the wide hourly patient_data table. It is rebuilt in
+# one INSERT ... SELECT after seeding and maintained by record_stay_insert()
+# (record_stay_rows() for bulk loads) inside the same transaction as every
+# new hourly row.
+# =============================================================================
+
+# Widest integer id we expand prefix searches to (MIMIC ids are 8 digits)
+MAX_ID_DIGITS = 10
+
+
+def rebuild_stays(db):
+    """Recreate the stays table from patient_data. Returns the number of stays."""
+    db.query(Stay).delete(synchronize_session=False)
+    select = db.query(
+        PatientData.stay_id,
+        func.max(PatientData.subject_id),
+        func.max(PatientData.age),
+        func.max(PatientData.f0_),
+        func.min(PatientData.hr),
+        func.max(PatientData.hr),
+        func.count(PatientData.id),
+        func.max(PatientData.sepsis),
+    ).filter(PatientData.stay_id.isnot(None)).group_by(PatientData.stay_id)
+
+    db.execute(insert(Stay).from_select(
+        ["stay_id", "subject_id", "age", "f0_", "first_hr", "last_hr", "row_count", "sepsis"],
+        select.statement
+    ))
+    db.commit()
+    return db.query(func.count(Stay.stay_id)).scalar()
+
+
+def _greatest(col, value):
+    """SQL expression for max(col, value) that treats NULL as missing (portable, unlike MAX(a, b))."""
+    return case((col.is_(None), value), (col < value, value), else_=col)
+
+
+def _least(col, value):
+    return case((col.is_(None), value), (col > value, value), else_=col)
+
+
+def record_stay_insert(db, row_data):
+    """Fold a new hourly row into its stays entry, in the caller's transaction."""
+    hr = row_data.get("hr")
+    record_stay_rows(db, row_data["stay_id"], 1, hr, hr, row_data)
+
+
+def record_stay_rows(db, stay_id, n_rows, first_hr, last_hr, values):
+    """
+    Fold n_rows new hourly rows of one stay into its stays entry, in the caller's
+    transaction. values holds the per-stay maxima of subject_id/age/f0_/sepsis
+    over the new rows (missing or None = no value).
+    """
+    updates = {Stay.row_count: Stay.row_count + n_rows}
+    if first_hr is not None:
+        updates[Stay.first_hr] = _least(Stay.first_hr, first_hr)
+        updates[Stay.last_hr] = _greatest(Stay.last_hr, last_hr)
+    for col in ("subject_id", "age", "f0_", "sepsis"):
+        if values.get(col) is not None:
+            updates[getattr(Stay, col)] = _greatest(getattr(Stay, col), values[col])
+
+    if db.query(Stay).filter(Stay.stay_id == stay_id).update(updates, synchronize_session=False) == 0:
+        db.add(Stay(
+            stay_id=stay_id,
+            subject_id=values.get("subject_id"),
+            age=values.get("age"),
+            f0_=values.get("f0_"),
+            first_hr=first_hr,
+            last_hr=last_hr,
+            row_count=n_rows,
+            sepsis=values.get("sepsis"),
+        ))
+
+
+def prefix_ranges(column, prefix):
+    """
+    Index-friendly filter for integer ids starting with the digit string prefix:
+    "300" -> id = 300 OR id in [3000, 3010) OR id in [30000, 30100) ...
+    """
+    if not prefix.isdigit() or len(prefix) > MAX_ID_DIGITS:
+        return None
+    base = int(prefix)
+    if prefix != str(base):
+        return None  # leading zeros never match an integer id
+    ranges = []
+    for extra in range(MAX_ID_DIGITS - len(prefix) + 1):
+        scale = 10 ** extra
+        ranges.append(and_(column >= base * scale, column < (base + 1) * scale))
+    return or_(*ranges)
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, Integer
+
+from database import PatientData, StayLatest
+from model_wrapper import MODEL_INPUT_FEATURES, records_to_matrix
+
+# =============================================================================
+# Last-known values per stay
+#
+# stay_latest keeps, per stay, the latest hr and every column's last non-null
+# value with the hr it was seen at. Values seen at the latest hr are the
+# non-null columns of the stay's last row (latest_row): POST /patient
+# forward-fills a new row from them with one primary-key read instead of
+# hydrating that patient_data row, and bulk ingestion seeds its grouped ffill
+# with them. The values of earlier hours only feed the GRU-D "last value /
+# last time" of every model feature (grud_last). It is rebuilt from patient_data after seeding; a stay without
+# state is rebuilt on its next write (reads compute it without storing it).
+# =============================================================================
+
+# Not carried over from earlier hours
+NO_FILL = {"id", "stay_id", "hr", "starttime", "endtime"}
+# Model features observed on every row
+EVERY_ROW = {"stay_id", "hr", "gender"}
+# Integer columns come back as floats from pandas when a group has gaps
+INT_COLS = {c.name for c in PatientData.__table__.columns if isinstance(c.type, Integer)}
+
+
+def _native(value):
+    """JSON-safe Python scalar, None for missing."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and not np.isfinite(value)):
+        return None
+    return value
+
+
+def row_state(row_data):
+    """State contributed by one new row: (values, value_hrs) of its non-null columns."""
+    values = {col: _native(v) for col, v in row_data.items() if col not in NO_FILL}
+    return {col: v for col, v in values.items() if v is not None}, {}
+
+
+def frame_states(df: pd.DataFrame):
+    """
+    Latest state per stay of rows ordered by (stay_id, hr).
+
+    Returns:
+        stay_id -> (first_hr, hr, values, value_hrs)
+    """
+    cols = [c for c in df.columns if c not in NO_FILL]
+    observed = df[cols].notna().to_numpy()
+    seen_hr = pd.DataFrame(np.where(observed, df["hr"].to_numpy(dtype=np.float64)[:, None], np.nan),
+                           columns=cols, index=df.index)
+    seen_hr["stay_id"] = df["stay_id"]
+
+    # groupby().last() takes the last non-null value of each column
+    last_values = df.groupby("stay_id", sort=False)[cols].last().astype(object)
+    last_hrs = seen_hr.groupby("stay_id", sort=False)[cols].max()
+    bounds = df.groupby("stay_id", sort=False)["hr"].agg(["min", "max"])
+
+    states = {}
+    for stay_id, vals, hrs, (first_hr, hr) in zip(
+        bounds.index.tolist(), last_values.itertuples(index=False, name=None),
+        last_hrs.itertuples(index=False, name=None), bounds.itertuples(index=False, name=None)
+    ):
+        values, value_hrs = {}, {}
+        for col, value, value_hr in zip(cols, vals, hrs):
+            value = _native(value)
+            if value is not None:
+                values[col] = int(value) if col in INT_COLS else value
+                if value_hr != hr:
+                    value_hrs[col] = int(value_hr)
+        states[int(stay_id)] = (int(first_hr), int(hr), values, value_hrs)
+    return states
+
+
+def stays_frame(db, stay_ids):
+    """patient_data rows of the given stays as a DataFrame ordered by (stay_id, hr)."""
+    query = select(PatientData.__table__)\
+        .where(PatientData.stay_id.in_(stay_ids))\
+        .order_by(PatientData.stay_id, PatientData.hr)
+    return pd.read_sql(query, db.connection())
+
+
+def record_latest(db, stay_id, latest, state):
+    """
+    Fold the state of newer rows into a stay's stay_latest entry, in the caller's
+    transaction. latest is the current entry (None for a new stay).
+    """
+    first_hr, hr, values, value_hrs = state
+    if latest is None:
+        latest = StayLatest(stay_id=stay_id, first_hr=first_hr, hr=hr, values=values, value_hrs=value_hrs)
+        db.add(latest)
+        return latest
+    # Columns the new rows did not observe keep their hr, which now has to be spelled out
+    old_hrs = {col: latest.value_hrs.get(col, latest.hr) for col in latest.values if col not in values}
+    # New dicts rather than in-place updates, so the JSON columns are flagged as changed
+    latest.first_hr = min(latest.first_hr, first_hr)
+    latest.hr = max(latest.hr, hr)
+    latest.values = {**latest.values, **values}
+    latest.value_hrs = {**old_hrs, **value_hrs}
+    return latest
+
+
+def latest_row(latest):
+    """Non-null columns of the stay's last row: the values seen at its latest hr."""
+    return {col: value for col, value in latest.values.items() if col not in latest.value_hrs}
+
+
+def load_latest(db, stay_ids, persist=True):
+    """
+    stay_latest entries of the given stays (one keyed query). Stays that have
+    rows but no entry yet are rebuilt from patient_data and added to the session,
+    or only returned (not added) with persist=False.
+    """
+    if len(stay_ids) == 1:
+        latest = db.get(StayLatest, stay_ids[0])
+        found = {latest.stay_id: latest} if latest is not None else {}
+    else:
+        found = {row.stay_id: row for row in db.query(StayLatest).filter(StayLatest.stay_id.in_(stay_ids))}
+    missing = [stay_id for stay_id in stay_ids if stay_id not in found]
+    if missing:
+        df = stays_frame(db, missing)
+        if not df.empty:
+            for stay_id, (first_hr, hr, values, value_hrs) in frame_states(df).items():
+                found[stay_id] = StayLatest(stay_id=stay_id, first_hr=first_hr, hr=hr, values=values, value_hrs=value_hrs)
+                if persist:
+                    db.add(found[stay_id])
+    return found
+
+
+def rebuild_stay_latest(db, chunk_stays=2000):
+    """Recreate stay_latest from patient_data, streaming stays in chunks. Returns the number of stays."""
+    db.query(StayLatest).delete(synchronize_session=False)
+    stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().order_by(PatientData.stay_id)
+                if sid is not None]
+    for i in range(0, len(stay_ids), chunk_stays):
+        df = stays_frame(db, stay_ids[i:i + chunk_stays])
+        db.bulk_insert_mappings(StayLatest, [
+            {"stay_id": stay_id, "first_hr": first_hr, "hr": hr, "values": values, "value_hrs": value_hrs}
+            for stay_id, (first_hr, hr, values, value_hrs) in frame_states(df).items()
+        ])
+    db.commit()
+    return len(stay_ids)
+
+
+def grud_last(latest):
+    """
+    GRU-D state at the stay's latest hr, in MODEL_INPUT_FEATURES order: the last
+    observed value of every feature and the hr it was observed at, as the model
+    sees them (stay_id, hr and gender are present on every row). Features never observed
+    are NaN in both; GRU-D falls back to the global mean and the first hr there.
+
+    Returns:
+        last_value [F] float32, last_time [F] float64
+    """
+    # f0_ present (even as None) makes gender default to 0 like for stored rows
+    X, _ = records_to_matrix([{"f0_": None, **latest.values, "stay_id": latest.stay_id, "hr": latest.hr}])
+    last_value = X[0]
+    last_time = np.array([
+        latest.hr if f in EVERY_ROW else latest.value_hrs.get(f, latest.hr)
+        for f in MODEL_INPUT_FEATURES
+    ], dtype=np.float64)
+    last_time[np.isnan(last_value)] = np.nan
+    return last_value, last_time
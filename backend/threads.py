@@ -0,0 +1,34 @@
+import os
+
+# =============================================================================
+# Thread budgets for multi-process runs
+#
+# The serve.py workers and the batch_score.py pool each split the cores
+# between their processes: every process caps torch intra-op and BLAS threads
+# at cores // processes, so N processes do not each start one thread per core.
+# =============================================================================
+
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers, cores=None):
+    """Intra-op threads per worker: the cores split evenly, at least one."""
+    return max(1, (cores or available_cores()) // workers)
+
+
+def limit_threads(n_threads):
+    """Cap torch intra-op and BLAS threads of the current process."""
+    import torch
+    torch.set_num_threads(n_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(n_threads)
+    except ImportError:
+        pass
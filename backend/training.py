@@ -0,0 +1,145 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from imputation import grud_impute
+from model_wrapper import WINDOW_HOURS
+
+# =============================================================================
+# Training windows as index arrays
+#
+# The notebook's TemporalWindowDataset grouped the rows by stay with pandas and
+# kept a (hist, target, times_hist, w) tuple of arrays for every window of
+# every stay and size. Here the rows are sorted by (stay_id, time) once and
+# every sample is three integers:
+#   start      position (in that order) of the first history row
+#   window_id  head of the window (0=6h, 1=12h, 2=24h)
+#   target     row of y to predict
+# found for all stays at once from the stay boundaries: a stay of L rows has
+# samples for window w at local positions i = w .. L-horizon-1, with history
+# rows i-w .. i-1 and target row i+horizon, exactly as the notebook loop. X is
+# only sliced when a sample is fetched, so it can stay a read-only memmap
+# (np.load(..., mmap_mode="r")) of X_train_scaled.
+# =============================================================================
+
+
+def sort_rows(stay_ids, times):
+    """Row order by (stay_id, time), or None when the rows are already in that order."""
+    stay_ids = np.asarray(stay_ids)
+    times = np.asarray(times)
+    in_order = (stay_ids[1:] > stay_ids[:-1]) | ((stay_ids[1:] == stay_ids[:-1]) & (times[1:] >= times[:-1]))
+    if in_order.all():
+        return None
+    return np.lexsort((times, stay_ids))
+
+
+def window_index(stay_ids, times, window_sizes=WINDOW_HOURS, horizon=1):
+    """
+    Samples of every window size for every stay (see module comment).
+
+    Returns:
+        order: [N] row order by (stay_id, time), None if the rows are already sorted
+        start: [S] position in that order of each sample's first history row
+        window_id: [S] int8 head of each sample
+        target: [S] row of each sample's target
+    Row numbers are int32 (int64 beyond 2**31 rows).
+    Samples come stay by stay, then by window size, then by time, like the notebook.
+    """
+    order = sort_rows(stay_ids, times)
+    sorted_ids = np.asarray(stay_ids) if order is None else np.asarray(stay_ids)[order]
+    N = len(sorted_ids)
+    first = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    lengths = np.diff(np.r_[first, N])
+    stay_start = np.repeat(first, lengths)
+    local = np.arange(N) - stay_start
+    stay_length = np.repeat(lengths, lengths)
+
+    starts, window_ids, ranks, stays = [], [], [], []
+    for rank, w in enumerate(window_sizes):
+        # i = position of the row right after the history; stays with at most
+        # w + horizon rows have none
+        i = np.flatnonzero((local >= w) & (local < stay_length - horizon))
+        starts.append(i - w)
+        window_ids.append(np.full(len(i), WINDOW_HOURS.index(w), dtype=np.int8))
+        ranks.append(np.full(len(i), rank, dtype=np.int8))
+        stays.append(stay_start[i])
+    start = np.concatenate(starts)
+    window_id = np.concatenate(window_ids)
+    keep = np.lexsort((start, np.concatenate(ranks), np.concatenate(stays)))
+    # 4-byte row numbers up to 2**31 rows
+    index_dtype = np.int32 if N < 2 ** 31 else np.int64
+    start, window_id = start[keep].astype(index_dtype), window_id[keep]
+    target = start + np.asarray(WINDOW_HOURS, dtype=index_dtype)[window_id] + horizon
+    if order is not None:
+        order = order.astype(index_dtype)
+        target = order[target]
+    return order, start, window_id, target
+
+
+class TemporalWindowDataset(Dataset):
+    """
+    The notebook's TemporalWindowDataset on index arrays (window_index). Items
+    are the same dicts: imputed X, mask and delta of the history window, y_reg /
+    y_bin of the target row and the window_id.
+
+    Args:
+        X: [N, F] scaled features, or the path of a .npy file to memory-map
+        y: [N, n_reg + n_bin] scaled targets (regression columns first)
+        stay_ids, times: [N] stay and hour of every row
+        global_feat_mean: [F] imputation fallback
+        n_reg: number of regression columns in y (y_train_reg.shape[1] in the notebook)
+    """
+
+    def __init__(self, X, y, stay_ids, times, global_feat_mean, window_sizes=(6, 12, 24), horizon=1, n_reg=8):
+        self.X = np.load(X, mmap_mode="r") if isinstance(X, str) else X
+        self.y = y
+        self.global_mean = global_feat_mean
+        self.n_reg = n_reg
+        self.order, self.start, self.window_id, self.target = window_index(stay_ids, times, window_sizes, horizon)
+        times = np.asarray(times, dtype=np.float64)
+        self.times = times if self.order is None else times[self.order]
+        self.sizes = np.asarray(WINDOW_HOURS, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.start)
+
+    def nbytes(self):
+        """Memory held by the sample index (excluding X and y)."""
+        arrays = [self.start, self.window_id, self.target, self.times] + ([self.order] if self.order is not None else [])
+        return sum(a.nbytes for a in arrays)
+
+    def __getitem__(self, idx):
+        start = int(self.start[idx])
+        window_id = int(self.window_id[idx])
+        end = start + int(self.sizes[window_id])
+        # Contiguous slice of the memmap when the rows are already sorted
+        rows = slice(start, end) if self.order is None else self.order[start:end]
+
+        X_seq = np.asarray(self.X[rows], dtype=float)
+        y_target = np.asarray(self.y[int(self.target[idx])])
+        y_reg = y_target[:self.n_reg].astype(float)
+        y_bin = y_target[self.n_reg:].astype(int)
+
+        X_filled, mask, delta = grud_impute(X_seq, self.times[start:end], self.global_mean)
+
+        return {
+            "X": torch.tensor(X_filled, dtype=torch.float32),
+            "mask": torch.tensor(mask.astype(float), dtype=torch.float32),
+            "delta": torch.tensor(delta, dtype=torch.float32),
+            "y_reg": torch.tensor(y_reg, dtype=torch.float32),
+            "y_bin": torch.tensor(y_bin, dtype=torch.float32),
+            "window_id": torch.tensor(window_id, dtype=torch.long),
+        }
+
+
+def collate_fn(batch):
+    """Right-pad X / mask / delta with zeros to the longest window of the batch (as in the notebook)."""
+    pad = torch.nn.utils.rnn.pad_sequence
+    return {
+        "X": pad([item["X"] for item in batch], batch_first=True),
+        "mask": pad([item["mask"] for item in batch], batch_first=True),
+        "delta": pad([item["delta"] for item in batch], batch_first=True),
+        "y_reg": torch.stack([item["y_reg"] for item in batch]),
+        "y_bin": torch.stack([item["y_bin"] for item in batch]),
+        "window_id": torch.stack([item["window_id"] for item in batch]),
+    }
@@ -0,0 +1,148 @@
+"""
+Accuracy gate for the inference precision modes (ModelWrapper precision=
+fp32 / int8 / bf16): scores held-out stays in every mode and reports the
+drift from fp32 in sepsis probability and the SOFA components next to the
+speedup of the model stage (imputation + encoder + heads, inputs prepared
+beforehand). Exits non-zero when a mode drifts more than allowed.
+
+Every stay is scored at --cutoffs evenly spaced hours (all three horizons).
+
+Usage (from backend/):
+    python validate_precision.py --parquet ../dataset/df_test30.parquet --model-dir ../new_model
+    python validate_precision.py --synthetic 256          # no held-out parquet at hand
+    MODEL_PRECISION=int8                                  # then serve the mode that passed
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmark import synthetic_records, SOFA_COLS
+from model_wrapper import ModelWrapper, PRECISIONS, WINDOW_HOURS, records_to_matrix
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "../new_model")
+DEFAULT_PARQUET = os.path.join(os.path.dirname(__file__), "../dataset/df_test30.parquet")
+
+
+def load_stays(path, max_stays):
+    """(X_seq, times) per stay of a held-out parquet, first max_stays stays."""
+    import pyarrow.parquet as pq
+
+    df = pq.read_table(path).to_pandas()
+    stay_ids = df["stay_id"].drop_duplicates().head(max_stays)
+    df = df[df["stay_id"].isin(stay_ids)].sort_values(["stay_id", "hr"])
+    return [records_to_matrix(group.to_dict("records")) for _, group in df.groupby("stay_id", sort=False)]
+
+
+def synthetic_stays(n_stays, seed=0):
+    rng = np.random.default_rng(seed)
+    return [records_to_matrix(synthetic_records(rng, int(rng.integers(6, 96)), stay_id=i)) for i in range(n_stays)]
+
+
+def score_points(stays, cutoffs):
+    """Items for predict_arrays: every stay cut at `cutoffs` evenly spaced hours."""
+    items = []
+    for X_seq, times in stays:
+        for end in np.unique(np.linspace(1, len(X_seq), cutoffs).round().astype(int)):
+            items.append((X_seq[:end], times[:end], 0))
+    return items
+
+
+def run_mode(model, items, batch_size, repeat):
+    """Outputs [N, horizons, 1 + len(SOFA_COLS)] (sepsis first) and best-of-repeat seconds."""
+    def score():
+        results = []
+        for i in range(0, len(items), batch_size):
+            results.extend(model.predict_arrays(items[i:i + batch_size], all_horizons=True))
+        return results
+
+    results = score()
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        score()
+        best = min(best, time.perf_counter() - started)
+    outputs = np.array([
+        [[result["horizons"][f"{hours}h"][col] for col in ["sepsis"] + SOFA_COLS] for hours in WINDOW_HOURS]
+        for result in results
+    ])
+    return outputs, best
+
+
+def drift(outputs, reference):
+    diff = np.abs(outputs - reference)
+    sofa_total = np.abs(outputs[..., 1:].sum(-1) - reference[..., 1:].sum(-1))
+    return {
+        "sepsis": {"max": float(diff[..., 0].max()), "mean": float(diff[..., 0].mean())},
+        **{col: {"max": float(diff[..., 1 + i].max()), "mean": float(diff[..., 1 + i].mean())}
+           for i, col in enumerate(SOFA_COLS)},
+        "sofa_total": {"max": float(sofa_total.max()), "mean": float(sofa_total.mean())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--artifact", default="auto")
+    parser.add_argument("--parquet", default=DEFAULT_PARQUET)
+    parser.add_argument("--synthetic", type=int, default=0, help="score N synthetic stays instead of the parquet")
+    parser.add_argument("--max-stays", type=int, default=500)
+    parser.add_argument("--cutoffs", type=int, default=4, help="scored hours per stay")
+    parser.add_argument("--modes", nargs="+", default=list(PRECISIONS), choices=PRECISIONS)
+    parser.add_argument("--windowed", action="store_true", help="score in windowed mode (WINDOWED_INFERENCE=1)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-sepsis-drift", type=float, default=0.02, help="largest allowed |p - p_fp32|")
+    parser.add_argument("--max-sofa-drift", type=float, default=0.25, help="largest allowed drift of any SOFA component")
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        stays = synthetic_stays(args.synthetic)
+        source = f"{args.synthetic} synthetic stays"
+    else:
+        if not os.path.exists(args.parquet):
+            parser.error(f"not found: {args.parquet} (use --synthetic N without a held-out parquet)")
+        stays = load_stays(args.parquet, args.max_stays)
+        source = f"{len(stays)} stays of {args.parquet}"
+    items = score_points(stays, args.cutoffs)
+    print(f"Scoring {len(items)} points ({source}) x {len(WINDOW_HOURS)} horizons")
+
+    modes = ["fp32"] + [mode for mode in args.modes if mode != "fp32"]
+    report, reference, reference_seconds = {}, None, None
+    for mode in modes:
+        model = ModelWrapper(args.model_dir, artifact=args.artifact, precision=mode)
+        if args.windowed:
+            model.enable_windowed()
+        outputs, seconds = run_mode(model, items, args.batch_size, args.repeat)
+        if reference is None:
+            reference, reference_seconds = outputs, seconds
+        report[mode] = {"seconds": seconds, "speedup": reference_seconds / seconds, "drift": drift(outputs, reference)}
+
+    ok = True
+    print(f"{'mode':>5} {'time (s)':>9} {'speedup':>8} {'sepsis max':>11} {'sepsis mean':>12} "
+          f"{'sofa max':>9} {'sofa mean':>10} {'total max':>10} {'gate':>5}")
+    for mode, entry in report.items():
+        d = entry["drift"]
+        sofa_max = max(d[col]["max"] for col in SOFA_COLS)
+        sofa_mean = max(d[col]["mean"] for col in SOFA_COLS)
+        passed = d["sepsis"]["max"] <= args.max_sepsis_drift and sofa_max <= args.max_sofa_drift
+        entry["passed"] = passed
+        ok &= passed
+        print(f"{mode:>5} {entry['seconds']:>9.3f} {entry['speedup']:>7.2f}x {d['sepsis']['max']:>11.5f} "
+              f"{d['sepsis']['mean']:>12.5f} {sofa_max:>9.4f} {sofa_mean:>10.4f} {d['sofa_total']['max']:>10.4f} "
+              f"{'PASS' if passed else 'FAIL':>5}")
+    print("(sofa max / mean: worst of the six components; total: drift of their sum)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"source": source, "points": len(items), "limits": {
+                "sepsis": args.max_sepsis_drift, "sofa": args.max_sofa_drift}, "modes": report}, f, indent=2)
+    print("All precision modes within limits ✅" if ok else "Precision check FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -1,4 +1,8 @@
-from database import SessionLocal, PatientData
+import os
+from sqlalchemy import func
+
+from database import SessionLocal, PatientData, DatasetStats, Stay, StayLatest
+from stats import compute_stats, COUNTER_COLS
 
 def verify():
     db = SessionLocal()
@@ -11,5 +15,137 @@ def verify():
         print(f"Sample row: StayID={first.stay_id}, Age={first.age}, HR={first.hr}")
     db.close()
 
+def verify_stats():
+    """Compare the incrementally maintained /stats summary with a full recompute."""
+    db = SessionLocal()
+    summary = db.get(DatasetStats, 1)
+    if summary is None:
+        print("No dataset_stats summary row yet (built by init_db or the first /stats call)")
+        db.close()
+        return False
+    
+    expected = compute_stats(db)
+    ok = True
+    for col in COUNTER_COLS:
+        got = getattr(summary, col) or 0
+        if abs(got - expected[col]) > 1e-6:
+            print(f"  {col}: summary={got} recompute={expected[col]} MISMATCH")
+            ok = False
+    print("Stats summary matches full recompute ✅" if ok else "Stats summary is out of sync")
+    db.close()
+    return ok
+
+def verify_stays():
+    """Compare the incrementally maintained stays index with patient_data."""
+    db = SessionLocal()
+    expected = {
+        row[0]: tuple(row[1:]) for row in db.query(
+            PatientData.stay_id, func.min(PatientData.hr), func.max(PatientData.hr), func.count(PatientData.id)
+        ).group_by(PatientData.stay_id)
+    }
+    got = {row[0]: tuple(row[1:]) for row in db.query(Stay.stay_id, Stay.first_hr, Stay.last_hr, Stay.row_count)}
+    mismatched = [stay_id for stay_id in expected.keys() | got.keys() if expected.get(stay_id) != got.get(stay_id)]
+    for stay_id in mismatched[:10]:
+        print(f"  stay {stay_id}: index={got.get(stay_id)} patient_data={expected.get(stay_id)} MISMATCH")
+    ok = not mismatched
+    print("Stays index matches patient_data ✅" if ok else f"Stays index is out of sync ({len(mismatched)} stays)")
+    db.close()
+    return ok
+
+def verify_stay_latest(chunk_stays=2000):
+    """
+    Compare the maintained stay_latest entries with a recompute from patient_data,
+    and the forward-fill source (latest_row) with each stay's last row.
+    """
+    from stay_latest import stays_frame, frame_states, latest_row
+
+    db = SessionLocal()
+    stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().order_by(PatientData.stay_id)]
+    mismatched = []
+    for i in range(0, len(stay_ids), chunk_stays):
+        chunk = stay_ids[i:i + chunk_stays]
+        stored = {row.stay_id: row for row in db.query(StayLatest).filter(StayLatest.stay_id.in_(chunk))}
+        df = stays_frame(db, chunk)
+        last_rows = frame_states(df.groupby("stay_id", sort=False).tail(1))
+        for stay_id, state in frame_states(df).items():
+            row = stored.get(stay_id)
+            if row is None or (row.first_hr, row.hr, row.values, row.value_hrs) != state \
+                    or latest_row(row) != last_rows[stay_id][2]:
+                mismatched.append(stay_id)
+    for stay_id in mismatched[:10]:
+        print(f"  stay {stay_id}: stay_latest differs from patient_data MISMATCH")
+    ok = not mismatched
+    print("stay_latest matches patient_data ✅" if ok else f"stay_latest is out of sync ({len(mismatched)} stays)")
+    db.close()
+    return ok
+
+def verify_feature_map(n_stays=50, last_n=24):
+    """FEATURE_MAP arrays (tuples straight from SQL) vs records_to_matrix() on the ORM rows."""
+    import numpy as np
+    from database import stay_rows
+    from feature_map import FEATURE_MAP
+    from model_wrapper import records_to_matrix
+
+    db = SessionLocal()
+    stay_ids = [sid for (sid,) in db.query(PatientData.stay_id).distinct().order_by(PatientData.stay_id).limit(n_stays)]
+    mismatched = []
+    for n in (None, last_n):
+        arrays = FEATURE_MAP.load(db, stay_ids, n)
+        records_by_stay = {}
+        for r in stay_rows(db, stay_ids, n):
+            d = r.__dict__.copy()
+            d.pop('_sa_instance_state', None)
+            records_by_stay.setdefault(r.stay_id, []).append(d)
+        for stay_id, records in records_by_stay.items():
+            X_want, times_want = records_to_matrix(records)
+            X, times = arrays.get(stay_id, (None, None))
+            if X is None or not (np.array_equal(X, X_want, equal_nan=True) and np.array_equal(times, times_want)):
+                mismatched.append((stay_id, n))
+    for stay_id, n in mismatched[:10]:
+        print(f"  stay {stay_id} (last_n={n}): feature map differs from records_to_matrix MISMATCH")
+    ok = not mismatched
+    print("Feature map matches records_to_matrix ✅" if ok else f"Feature map differs ({len(mismatched)} stays)")
+    db.close()
+    return ok
+
+def verify_feature_store_append():
+    """
+    Rows appended to the feature store vs the same rows read back from
+    patient_data (FEATURE_MAP), for a new stay posted without f0_. Runs on a
+    throwaway database and store.
+    """
+    import tempfile
+    import numpy as np
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from feature_map import FEATURE_MAP
+    from feature_store import FeatureStore
+
+    records = [
+        {"stay_id": 1, "hr": -1, "age": 70, "heart_rate_max": 112.0, "gender": 1, "sepsis": 1},
+        {"stay_id": 1, "hr": 0, "age": 70, "sbp_min": 84.0},
+    ]
+    columns = PatientData.__table__.columns.keys()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/verify.db")
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add_all(PatientData(**{k: v for k, v in r.items() if k in columns}) for r in records)
+            db.commit()
+            X_want, times_want = FEATURE_MAP.load(db, [1])[1]
+        store = FeatureStore(os.path.join(tmp, "store"))
+        store.append(1, records)
+        X, times = store.get(1)
+        engine.dispose()
+    ok = np.array_equal(X, X_want, equal_nan=True) and np.array_equal(times, times_want)
+    print("Feature store append matches patient_data ✅" if ok else "Feature store append differs from patient_data")
+    return ok
+
 if __name__ == "__main__":
     verify()
+    verify_stats()
+    verify_stays()
+    verify_stay_latest()
+    verify_feature_map()
+    verify_feature_store_append()
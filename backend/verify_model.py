@@ -0,0 +1,244 @@
+"""
+Consistency checks for the optimized inference paths against a plain
+full-history ModelWrapper.predict() (windowed mode: on the trailing window).
+
+Usage (from backend/):
+    python verify_model.py --model-dir ../new_model
+"""
+import argparse
+import os
+
+import numpy as np
+
+from benchmark import synthetic_records
+from model_wrapper import ModelWrapper, WINDOW_HOURS
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "../new_model")
+
+
+def max_diff(a, b):
+    return max(abs(a[k] - b[k]) for k in b)
+
+
+def report(name, diff, tol):
+    ok = diff <= tol
+    print(f"  {name}: {'OK' if ok else 'MISMATCH'} (max abs diff {diff:.2e})")
+    return ok
+
+
+def verify_batch(model, rng, tol):
+    """predict_batch on a padded batch vs one predict() per stay."""
+    print("Batched prediction vs single-stay predict()")
+    items = [(synthetic_records(rng, T, stay_id=i), i % 3) for i, T in enumerate([1, 7, 30, 72])]
+    batched = model.predict_batch(items)
+    ok = True
+    for (records, window_id), got in zip(items, batched):
+        ok &= report(f"T={len(records)} window_id={window_id}", max_diff(got, model.predict(records, window_id)), tol)
+    return ok
+
+
+def verify_incremental(model, rng, tol):
+    """Hour-by-hour incremental updates vs a full recompute after every hour."""
+    print("Incremental inference vs full recompute")
+    engine = model.enable_incremental()
+    records = synthetic_records(rng, 48, stay_id=1)
+    ok = True
+    engine.update(1, records[:5])
+    for t in range(5, len(records) + 1):
+        if t > 5:
+            engine.update(1, records[t - 1:t])
+        for window_id in range(3):
+            diff = max_diff(engine.predict(1, window_id), model.predict(records[:t], window_id))
+            if diff > tol or t == len(records):
+                ok &= report(f"T={t} window_id={window_id}", diff, tol)
+    engine.evict(1)
+    ok &= report("evicted", float(engine.get_state(1) is not None), 0)
+
+    # Evicted by the LRU while being synced: the synced state is still scored
+    def count_rows():
+        engine.evict(1)
+        return len(records)
+    result = engine.sync_predict(1, lambda after_hr: records if after_hr is None else [], count_rows)
+    ok &= report("evicted during sync", max_diff(result, model.predict(records)) if result else float("inf"), tol)
+    model.incremental = None
+    return ok
+
+
+def verify_concurrent_incremental(model, rng, tol, rounds=20):
+    """
+    Two concurrent incremental predictions of the same stay with different
+    windows (as two /predict/{stay_id} calls with different window_hours, which
+    the prediction cache does not coalesce) after every append: the new rows
+    must be folded once, and both results must match a full recompute.
+    """
+    import tempfile
+    import threading
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from api import _predict_incremental
+    from database import Base, PatientData
+
+    print("Concurrent incremental predictions vs full recompute")
+    columns = set(PatientData.__table__.columns.keys())
+    # As stored: only patient_data columns (gender comes from f0_)
+    records = [{k: v for k, v in r.items() if k in columns} for r in synthetic_records(rng, 5 + rounds, stay_id=1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/verify.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        model.enable_incremental()
+
+        def append(batch):
+            with Session() as db:
+                db.add_all(PatientData(**r) for r in batch)
+                db.commit()
+
+        ok = True
+        append(records[:5])
+        for t in range(6, len(records) + 1):
+            append(records[t - 1:t])
+            results = {}
+            barrier = threading.Barrier(2)
+
+            def predict(window_id):
+                with Session() as db:
+                    barrier.wait()
+                    results[window_id] = _predict_incremental(model, 1, window_id, False, db)
+
+            threads = [threading.Thread(target=predict, args=(w,)) for w in (0, 1)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            rows = model.incremental.n_rows(1)
+            diff = max(max_diff(results[w], model.predict(records[:t], w)) for w in (0, 1))
+            if rows != t or diff > tol or t == len(records):
+                ok &= report(f"T={t} folded rows={rows}", diff if rows == t else float("inf"), tol)
+        engine.dispose()
+    model.incremental = None
+    return ok
+
+
+def verify_windowed(model_dir, rng, tol):
+    """Windowed mode vs full-history predict() on the last 6/12/24 records, per head and all_horizons."""
+    print("Windowed inference vs predict() on the trailing window")
+    full = ModelWrapper(model_dir)
+    windowed = ModelWrapper(model_dir)
+    windowed.enable_windowed()
+    ok = True
+    for T in (3, 20, 100):
+        records = synthetic_records(rng, T, stay_id=T)
+        combined = windowed.predict(records, 0, all_horizons=True)
+        for window_id, hours in enumerate(WINDOW_HOURS):
+            want = full.predict(records[-hours:], window_id)
+            ok &= report(f"T={T} window={hours}h", max_diff(windowed.predict(records, window_id), want), tol)
+            ok &= report(f"T={T} all_horizons {hours}h", max_diff(combined["horizons"][f"{hours}h"], want), tol)
+    return ok
+
+
+def verify_trajectory(model, rng, tol):
+    """predict_trajectory() at every hour vs predict() on the window ending there."""
+    print("Trajectory vs per-hour predict()")
+    records = synthetic_records(rng, 40, stay_id=1)
+    X_seq, times = model.records_to_array(records)
+    ok = True
+    for window_id, hours in enumerate(WINDOW_HOURS):
+        points = model.predict_trajectory(X_seq, times, window_id, batch_size=16)
+        diff = max(max_diff(point, model.predict(records[max(0, t - hours + 1):t + 1], window_id))
+                   for t, point in enumerate(points))
+        ok &= report(f"T={len(records)} window={hours}h", diff, tol)
+    return ok
+
+
+def verify_parquet_scoring(model, rng, tol):
+    """
+    batch_score.py on an arrow table with MIMIC-sized stay_ids: table_to_matrix
+    vs records_to_matrix, and the scored columns vs predict_trajectory().
+    """
+    print("Parquet batch scoring vs records_to_matrix / predict_trajectory()")
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("  skipped (pyarrow not installed)")
+        return True
+    from batch_score import served_outputs, stay_starts, table_to_matrix
+    from model_wrapper import records_to_matrix
+
+    stays = [synthetic_records(rng, T, stay_id=30000000 + i) for i, T in enumerate([3, 30, 9])]
+    records = [record for stay in stays for record in stay]
+    X, times, stay_ids = table_to_matrix(pa.Table.from_pylist(records))
+    X_want, times_want = records_to_matrix(records)
+    ok = report("table_to_matrix", float(np.nanmax(np.abs(X - X_want)))
+                if np.array_equal(np.isnan(X), np.isnan(X_want)) and np.array_equal(times, times_want) else np.inf, 0.0)
+    for window_id, hours in enumerate(WINDOW_HOURS):
+        y_reg, y_bin = model.trajectory_outputs(X, times, window_id, batch_size=16, starts=stay_starts(stay_ids))
+        outputs = served_outputs(model.regression_cols, y_reg, y_bin)
+        points = [point for stay in stays for point in model.predict_trajectory(*model.records_to_array(stay), window_id)]
+        diff = max(max(abs(outputs[col][row] - point[col]) for col in point) for row, point in enumerate(points))
+        ok &= report(f"scored window={hours}h", diff, tol)
+    return ok
+
+
+def verify_evaluation(model, rng, tol, horizon=1):
+    """
+    evaluate.py on a labelled parquet with MIMIC-sized stay_ids: sample counts
+    vs training.window_index and the metrics vs predict() on every window.
+    """
+    print("Evaluation harness vs per-window predict()")
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("  skipped (pyarrow not installed)")
+        return True
+    import tempfile
+    from sklearn.metrics import roc_auc_score
+    from evaluate import evaluate, load_parquet
+    from training import window_index
+
+    stays = [synthetic_records(rng, T, stay_id=30000000 + i) for i, T in enumerate([40, 8, 30, 26])]
+    for stay in stays:
+        for record in stay:
+            record.update(sepsis=int(rng.integers(0, 2)), renal=float(rng.integers(0, 5)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "labelled.parquet")
+        pq.write_table(pa.Table.from_pylist([record for stay in stays for record in stay]), path)
+        X, times, stay_ids, labels = load_parquet(path)
+    report_ = evaluate(model, X, times, stay_ids, labels, horizon, batch_size=16)
+
+    _, _, sample_window, _ = window_index(stay_ids, times, horizon=horizon)
+    ok = True
+    for window_id, hours in enumerate(WINDOW_HOURS):
+        entry = report_[f"{hours}h"]
+        ok &= report(f"{hours}h samples", abs(entry["samples"] - int((sample_window == window_id).sum())), 0)
+        # Window rows i-w .. i-1, labels of row i + horizon
+        pairs = [(model.predict(stay[i - hours:i], window_id), stay[i + horizon])
+                 for stay in stays for i in range(hours, len(stay) - horizon)]
+        renal_mae = np.mean([abs(pred["renal"] - target["renal"]) for pred, target in pairs])
+        ok &= report(f"{hours}h renal MAE", abs(entry["regression"]["renal"]["mae"] - renal_mae), tol)
+        auroc = roc_auc_score([target["sepsis"] for _, target in pairs], [pred["sepsis"] for pred, _ in pairs])
+        ok &= report(f"{hours}h sepsis AUROC", abs(entry["sepsis"]["auroc"] - auroc), tol)
+    return ok
+
+
+def verify(model_dir, seed=0, tol=1e-4):
+    model = ModelWrapper(model_dir)
+    rng = np.random.default_rng(seed)
+    ok = verify_batch(model, rng, tol)
+    ok &= verify_incremental(model, rng, tol)
+    ok &= verify_concurrent_incremental(model, rng, tol)
+    ok &= verify_windowed(model_dir, rng, tol)
+    ok &= verify_trajectory(model, rng, tol)
+    ok &= verify_parquet_scoring(model, rng, tol)
+    ok &= verify_evaluation(model, rng, tol)
+    print("All model checks passed ✅" if ok else "Model checks FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    args = parser.parse_args()
+    raise SystemExit(0 if verify(args.model_dir) else 1)
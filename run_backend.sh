@@ -3,8 +3,13 @@
 pip install sqlalchemy joblib torch > /dev/null
 
 # Make sure we are in the root
-cd /Users/rezaal/Documents/coding/ORCA_PURAPURANINJA
+cd "$(dirname "$0")"
 
 # Run the backend
 cd backend
-python3 -m uvicorn main:app --reload --port 8000
+if [ "$1" = "prod" ]; then
+    # Model loaded once, WORKERS forked workers sharing it (default: one per core)
+    python3 serve.py --workers "${WORKERS:-$(nproc)}" --port 8000
+else
+    python3 -m uvicorn main:app --reload --port 8000
+fi